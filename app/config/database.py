@@ -3,12 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
 import mysql.connector
+import mysql.connector.pooling
 from mysql.connector import Error
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 import random  
 import time
+import threading
+from contextlib import contextmanager
 
 # Cargar variables de entorno
 load_dotenv()
@@ -43,8 +46,50 @@ def get_db():
         return conn
     except Error as e:
         print(f" Error de conexión: {e}")
+        raise HTTPException(status_code=500, detail=f"Error de conexión: {str(e)}") from e
+
+# Pool de lectura para reportes; apunta a una réplica si se define DB_READ_HOST
+DB_LECTURA_CONFIG = {**DB_CONFIG, 'host': os.getenv('DB_READ_HOST', DB_CONFIG['host'])}
+TAMANO_POOL_LECTURA = int(os.getenv('DB_READ_POOL_SIZE', 8))
+
+_pool_lectura = None
+_lock_pool = threading.Lock()
+
+def get_db_lectura():
+    """Conexión del pool de lectura (conn.close() la devuelve al pool)"""
+    global _pool_lectura
+    try:
+        if _pool_lectura is None:
+            with _lock_pool:
+                if _pool_lectura is None:
+                    _pool_lectura = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name="lectura",
+                        pool_size=TAMANO_POOL_LECTURA,
+                        **DB_LECTURA_CONFIG
+                    )
+        return _pool_lectura.get_connection()
+    except mysql.connector.errors.PoolError:
+        # Pool agotado: conexión directa a la misma instancia de lectura
+        return mysql.connector.connect(**DB_LECTURA_CONFIG)
+    except Error as e:
+        print(f" Error de conexión de lectura: {e}")
         raise HTTPException(status_code=500, detail=f"Error de conexión: {str(e)}")
 
+def consulta_lectura(query: str, params: tuple = None):
+    """Como execute_query(fetch=True) pero sobre el pool de lectura"""
+    conn = get_db_lectura()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params or ())
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+    except Error as e:
+        print(f"Error en query de lectura: {e}")
+        raise HTTPException(status_code=500, detail=f"Error en query: {str(e)}")
+    finally:
+        conn.close()
+
 def execute_query(query: str, params: tuple = None, fetch: bool = True):
     conn = get_db()
     try:
@@ -63,3 +108,22 @@ def execute_query(query: str, params: tuple = None, fetch: bool = True):
     except Error as e:
         print(f"Error en query: {e}")
         raise HTTPException(status_code=500, detail=f"Error en query: {str(e)}")
+
+@contextmanager
+def transaccion():
+    """Ejecuta varias consultas sobre una misma conexión y hace commit al final"""
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        yield cursor
+        conn.commit()
+    except Error as e:
+        conn.rollback()
+        print(f"Error en transacción: {e}")
+        raise HTTPException(status_code=500, detail=f"Error en query: {str(e)}") from e
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
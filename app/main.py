@@ -9,8 +9,12 @@ from datetime import datetime
 from dotenv import load_dotenv
 import random  
 import time
-from app.routes import sucursales, usuarios,productos,categorias,profile,carrito,pedidos,trivia,lealtad,cupones,reportes,localidades,tipo_cambio,sinpe,recomendaciones,favoritos,reservaciones,tarjetas,tse
+from app.routes import sucursales, usuarios,productos,categorias,profile,carrito,pedidos,trivia,lealtad,cupones,reportes,localidades,tipo_cambio,sinpe,recomendaciones,favoritos,reservaciones,tarjetas,tse,auditoria,planificador
 from app.routes.profile import router as profile_router 
+from app.services.idempotencia import IdempotenciaMiddleware
+from app.services import trabajos
+from app.services import planificador as planificador_tareas
+from app.services import clientes_unicos, escritor_auditoria, referencia
 
 # Cargar variables de entorno
 load_dotenv()
@@ -21,6 +25,18 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# ============= IDEMPOTENCIA =============
+# Reintentos de checkout y pagos con el mismo Idempotency-Key reciben la respuesta original
+app.add_middleware(
+    IdempotenciaMiddleware,
+    rutas=[
+        "/pedidos/crear-desde-carrito",
+        "/tarjetas/procesar-pago",
+        "/sinpe/iniciar-transferencia"
+    ],
+    ttl=int(os.getenv('IDEMPOTENCIA_TTL', 24 * 3600))
+)
+
 # ============= CORS =============
 # Obtener orígenes permitidos desde variable de entorno
 ALLOWED_ORIGINS = os.getenv(
@@ -85,183 +101,6 @@ def execute_query(query: str, params: tuple = None, fetch: bool = True):
 
 
 
-# ============= MODELOS PARA AUDITORÍA =============
-class AuditoriaCreate(BaseModel):
-    usuario_Id: int
-    tabla: str
-    accion: str  
-    registro_Id: int = 0
-    datos_Anteriores: Optional[str] = None
-    datos_Nuevos: Optional[str] = None
-    ip_Address: Optional[str] = None
-    descripcion: Optional[str] = None
-    endpoint: Optional[str] = None
-    metodo: Optional[str] = None
-
-# ============= AUDITORÍA =============
-@app.post("/auditoria", status_code=status.HTTP_201_CREATED)
-def create_auditoria(auditoria: AuditoriaCreate):
-    query = """
-        INSERT INTO auditoria 
-        (usuario_Id, tabla, accion, registro_Id, datos_Anteriores, datos_Nuevos, 
-         ip_Address, descripcion, endpoint, metodo)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    result = execute_query(query, (
-        auditoria.usuario_Id,
-        auditoria.tabla,
-        auditoria.accion,
-        auditoria.registro_Id,
-        auditoria.datos_Anteriores,
-        auditoria.datos_Nuevos,
-        auditoria.ip_Address,
-        auditoria.descripcion,
-        auditoria.endpoint,
-        auditoria.metodo
-    ), fetch=False)
-    return {"id": result['last_id'], "message": "Auditoría creada"}
-
-@app.get("/auditoria")
-def get_auditorias(
-    usuario_Id: Optional[int] = Query(None),
-    tabla: Optional[str] = Query(None),
-    accion: Optional[str] = Query(None),
-    fechaDesde: Optional[str] = Query(None),
-    fechaHasta: Optional[str] = Query(None),
-    limit: int = Query(50),
-    offset: int = Query(0)
-):
-    conditions = []
-    params = []
-    
-    if usuario_Id:
-        conditions.append("a.usuario_Id = %s")
-        params.append(usuario_Id)
-    
-    if tabla:
-        conditions.append("a.tabla = %s")
-        params.append(tabla)
-    
-    if accion:
-        conditions.append("a.accion = %s")
-        params.append(accion)
-    
-    if fechaDesde:
-        conditions.append("a.fecha >= %s")
-        params.append(fechaDesde)
-    
-    if fechaHasta:
-        conditions.append("a.fecha <= %s")
-        params.append(fechaHasta)
-    
-    where_clause = " AND ".join(conditions) if conditions else "1=1"
-    
-    # Contar total
-    count_query = f"SELECT COUNT(*) as total FROM auditoria a WHERE {where_clause}"
-    total_result = execute_query(count_query, tuple(params))
-    total = total_result[0]['total']
-    
-    # Obtener registros
-    params.extend([limit, offset])
-    query = f"""
-        SELECT 
-            a.*,
-            u.correo,
-            c.nombre,
-            c.apellido
-        FROM auditoria a
-        LEFT JOIN usuarios u ON a.usuario_Id = u.id
-        LEFT JOIN clientes c ON u.id = c.usuario_Id
-        WHERE {where_clause}
-        ORDER BY a.fecha DESC
-        LIMIT %s OFFSET %s
-    """
-    
-    items = execute_query(query, tuple(params))
-    
-    return {
-        "items": items,
-        "total": total,
-        "limit": limit,
-        "offset": offset
-    }
-
-@app.get("/auditoria/{id}")
-def get_auditoria_by_id(id: int):
-    query = """
-        SELECT 
-            a.*,
-            u.correo,
-            c.nombre,
-            c.apellido
-        FROM auditoria a
-        LEFT JOIN usuarios u ON a.usuario_Id = u.id
-        LEFT JOIN clientes c ON u.id = c.usuario_Id
-        WHERE a.id = %s
-    """
-    result = execute_query(query, (id,))
-    if not result:
-        raise HTTPException(status_code=404, detail="Auditoría no encontrada")
-    return result[0]
-
-@app.get("/auditoria/historial/{tabla}/{registro_id}")
-def get_historial_registro(tabla: str, registro_id: int):
-    query = """
-        SELECT 
-            a.*,
-            u.correo,
-            c.nombre,
-            c.apellido
-        FROM auditoria a
-        LEFT JOIN usuarios u ON a.usuario_Id = u.id
-        LEFT JOIN clientes c ON u.id = c.usuario_Id
-        WHERE a.tabla = %s AND a.registro_Id = %s
-        ORDER BY a.fecha DESC
-    """
-    return execute_query(query, (tabla, registro_id))
-
-@app.get("/auditoria/estadisticas/general")
-def get_estadisticas_auditoria(usuario_Id: Optional[int] = Query(None)):
-    conditions = "WHERE usuario_Id = %s" if usuario_Id else ""
-    params = (usuario_Id,) if usuario_Id else ()
-    
-    query = f"""
-        SELECT 
-            accion,
-            COUNT(*) as total
-        FROM auditoria
-        {conditions}
-        GROUP BY accion
-    """
-    
-    resultados = execute_query(query, params)
-    
-    stats = {
-        'totalInserts': 0,
-        'totalUpdates': 0,
-        'totalDeletes': 0,
-        'totalSelects': 0,
-        'total': 0
-    }
-    
-    for row in resultados:
-        accion = row['accion'].lower()
-        total = int(row['total'])
-        
-        if accion == 'insert':
-            stats['totalInserts'] = total
-        elif accion == 'update':
-            stats['totalUpdates'] = total
-        elif accion == 'delete':
-            stats['totalDeletes'] = total
-        elif accion == 'select':
-            stats['totalSelects'] = total
-        
-        stats['total'] += total
-    
-    return stats
-
-
 # ============= INICIO =============
 app.include_router(usuarios.router)
 app.include_router(productos.router)
@@ -282,8 +121,34 @@ app.include_router(favoritos.router)
 app.include_router(reservaciones.router)
 app.include_router(tarjetas.router)
 app.include_router(tse.router)
+app.include_router(auditoria.router)
+app.include_router(planificador.router)
+
+
 
 
+# ============= SERVICIOS EN SEGUNDO PLANO =============
+@app.on_event("startup")
+def iniciar_servicios():
+    trabajos.iniciar()
+    planificador_tareas.iniciar()
+    escritor_auditoria.iniciar()
+    # Si la base no responde al iniciar, se cargan en el primer acceso
+    try:
+        referencia.cargar()
+    except Exception as e:
+        print(f"No se pudieron cargar los datos de referencia: {e}")
+
+@app.on_event("shutdown")
+def detener_servicios():
+    trabajos.detener()
+    planificador_tareas.detener()
+    escritor_auditoria.detener()
+    # Lo acumulado en memoria desde el último guardado
+    try:
+        clientes_unicos.guardar()
+    except Exception as e:
+        print(f"No se pudieron guardar los clientes distintos: {e}")
 
 
 @app.get("/")
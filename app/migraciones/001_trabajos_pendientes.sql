@@ -0,0 +1,21 @@
+-- Cola de trabajos en segundo plano (outbox) para efectos posteriores al checkout
+CREATE TABLE IF NOT EXISTS trabajos_pendientes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    estado ENUM('pendiente', 'procesando', 'completado', 'fallido') NOT NULL DEFAULT 'pendiente',
+    intentos INT NOT NULL DEFAULT 0,
+    ultimo_error TEXT NULL,
+    disponible_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fecha_creacion DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fecha_procesado DATETIME NULL,
+    INDEX idx_trabajos_estado (estado, disponible_en, id)
+);
+
+-- Los puntos y el uso de cupón de un pedido se registran una sola vez,
+-- aunque lleguen por el worker y por el endpoint del cliente
+ALTER TABLE puntos_historial
+    ADD UNIQUE KEY uk_puntos_historial_pedido_tipo (pedido_id, tipo);
+
+ALTER TABLE cupon_usos
+    ADD UNIQUE KEY uk_cupon_usos_pedido (cupon_id, pedido_id);
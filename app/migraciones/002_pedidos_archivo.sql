@@ -0,0 +1,15 @@
+-- Nivel de archivo para pedidos terminados (completados o cancelados).
+-- Misma estructura e índices que las tablas activas; los ids se conservan.
+-- Se usa un split activo/archivo en lugar de particiones porque MySQL no
+-- permite llaves foráneas en tablas particionadas. Las llaves foráneas de
+-- otras tablas hacia pedidos(id) se eliminan en 013_pedidos_llaves_foraneas.sql,
+-- que debe aplicarse antes de la primera ejecución del archivador.
+CREATE TABLE IF NOT EXISTS pedidos_archivo LIKE pedidos;
+CREATE TABLE IF NOT EXISTS pedido_detalles_archivo LIKE pedido_detalles;
+
+-- Consultas del historial por cliente en ambos niveles
+ALTER TABLE pedidos ADD INDEX idx_pedidos_cliente_fecha (cliente_id, fecha_creacion);
+ALTER TABLE pedidos_archivo ADD INDEX idx_pedidos_archivo_cliente_fecha (cliente_id, fecha_creacion);
+
+-- Selección de pedidos a archivar y búsquedas por estado (carrito, activos)
+ALTER TABLE pedidos ADD INDEX idx_pedidos_estado_fecha (estado, fecha_completado);
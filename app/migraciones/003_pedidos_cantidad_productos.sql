@@ -0,0 +1,11 @@
+-- Cantidad de líneas por pedido, mantenida al escribir el carrito
+-- (evita el COUNT(*) correlacionado en el historial de pedidos).
+-- Se agrega en ambos niveles para que el archivado siga copiando con SELECT *.
+ALTER TABLE pedidos ADD COLUMN cantidad_productos INT NOT NULL DEFAULT 0;
+ALTER TABLE pedidos_archivo ADD COLUMN cantidad_productos INT NOT NULL DEFAULT 0;
+
+UPDATE pedidos p
+SET cantidad_productos = (SELECT COUNT(*) FROM pedido_detalles pd WHERE pd.pedido_id = p.id);
+
+UPDATE pedidos_archivo p
+SET cantidad_productos = (SELECT COUNT(*) FROM pedido_detalles_archivo pd WHERE pd.pedido_id = p.id);
@@ -0,0 +1,20 @@
+-- Totales de ventas precalculados por día y sucursal (sucursal_id = 0 si el pedido no tiene)
+-- Se actualizan al completar un pedido; se reconstruyen con:
+--   python -m app.services.ventas_rollup --desde YYYY-MM-DD --hasta YYYY-MM-DD
+CREATE TABLE IF NOT EXISTS ventas_diarias (
+    fecha DATE NOT NULL,
+    sucursal_id INT NOT NULL DEFAULT 0,
+    total_pedidos INT NOT NULL DEFAULT 0,
+    total_ventas DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, sucursal_id)
+);
+
+CREATE TABLE IF NOT EXISTS ventas_producto_diarias (
+    fecha DATE NOT NULL,
+    sucursal_id INT NOT NULL DEFAULT 0,
+    producto_id INT NOT NULL,
+    cantidad INT NOT NULL DEFAULT 0,
+    total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, sucursal_id, producto_id),
+    INDEX idx_ventas_producto_producto (producto_id, fecha)
+);
@@ -0,0 +1,11 @@
+-- Historial de ejecuciones de las tareas periódicas (app/services/planificador.py)
+CREATE TABLE IF NOT EXISTS planificador_ejecuciones (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tarea VARCHAR(100) NOT NULL,
+    instancia VARCHAR(100) NOT NULL,
+    inicio DATETIME NOT NULL,
+    duracion_ms INT NOT NULL,
+    estado ENUM('completada', 'fallida', 'omitida') NOT NULL,
+    error TEXT NULL,
+    INDEX idx_planificador_tarea (tarea, inicio)
+);
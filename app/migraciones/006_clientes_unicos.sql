@@ -0,0 +1,11 @@
+-- Sketches HyperLogLog de clientes distintos por día y sucursal (sucursal_id = 0 si el pedido no tiene)
+-- registros: 2^14 registros de un byte comprimidos con zlib
+-- Se reconstruyen con:
+--   python -m app.services.clientes_unicos --desde YYYY-MM-DD --hasta YYYY-MM-DD
+CREATE TABLE IF NOT EXISTS clientes_unicos_diarios (
+    fecha DATE NOT NULL,
+    sucursal_id INT NOT NULL DEFAULT 0,
+    registros BLOB NOT NULL,
+    fecha_actualizacion DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (fecha, sucursal_id)
+);
@@ -0,0 +1,6 @@
+-- Paginación por cursor de /auditoria: orden (fecha, id) con y sin filtros frecuentes
+ALTER TABLE auditoria
+    ADD INDEX idx_auditoria_fecha (fecha, id),
+    ADD INDEX idx_auditoria_usuario_fecha (usuario_Id, fecha, id),
+    ADD INDEX idx_auditoria_tabla_fecha (tabla, fecha, id),
+    ADD INDEX idx_auditoria_registro (tabla, registro_Id, fecha);
@@ -0,0 +1,24 @@
+-- Contadores de auditoría por acción, mantenidos al escribir cada lote
+-- ambito: 'general' (clave ''), 'usuario' (clave = usuario_Id) o 'tabla' (clave = nombre)
+CREATE TABLE IF NOT EXISTS auditoria_resumen (
+    ambito ENUM('general', 'usuario', 'tabla') NOT NULL,
+    clave VARCHAR(100) NOT NULL DEFAULT '',
+    accion VARCHAR(20) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ambito, clave, accion)
+);
+
+-- Carga inicial desde la tabla existente
+-- (o: python -m app.services.auditoria_resumen)
+INSERT INTO auditoria_resumen (ambito, clave, accion, total)
+SELECT ambito, clave, accion, total FROM (
+    SELECT 'general' as ambito, '' as clave, LOWER(accion) as accion, COUNT(*) as total
+    FROM auditoria GROUP BY LOWER(accion)
+    UNION ALL
+    SELECT 'usuario', CAST(usuario_Id AS CHAR), LOWER(accion), COUNT(*)
+    FROM auditoria WHERE usuario_Id IS NOT NULL GROUP BY usuario_Id, LOWER(accion)
+    UNION ALL
+    SELECT 'tabla', tabla, LOWER(accion), COUNT(*)
+    FROM auditoria GROUP BY tabla, LOWER(accion)
+) r
+ON DUPLICATE KEY UPDATE total = r.total;
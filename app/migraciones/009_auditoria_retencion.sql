@@ -0,0 +1,71 @@
+-- Retención de auditoría (app/services/retencion_auditoria.py)
+-- La tabla se particiona por mes; las particiones vencidas se exportan a
+-- NDJSON comprimido y se eliminan. La partición pmax se divide en meses
+-- la primera vez que corre la tarea de retención.
+-- Ese primer REORGANIZE de pmax copia toda la tabla (todas las filas viven en
+-- pmax hasta entonces), igual que el PARTITION BY de abajo: ambos reconstruyen
+-- auditoria completa y deben correr en una ventana de poco tráfico. Las
+-- divisiones siguientes solo tocan la cola vacía de pmax.
+-- MySQL no admite llaves foráneas en tablas particionadas (error 1506), así que
+-- antes se eliminan las de auditoria hacia otras tablas (p. ej. usuario_Id ->
+-- usuarios) y las de otras tablas hacia auditoria. Los índices se conservan;
+-- auditoria guarda el historial aunque el usuario se elimine.
+-- Ejecutar con el cliente mysql (usa DELIMITER).
+
+DROP PROCEDURE IF EXISTS quitar_llaves_auditoria;
+
+DELIMITER //
+CREATE PROCEDURE quitar_llaves_auditoria()
+BEGIN
+    DECLARE terminado INT DEFAULT 0;
+    DECLARE v_tabla VARCHAR(64);
+    DECLARE v_llave VARCHAR(64);
+    DECLARE llaves CURSOR FOR
+        SELECT TABLE_NAME, CONSTRAINT_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+        AND (TABLE_NAME = 'auditoria' OR REFERENCED_TABLE_NAME = 'auditoria');
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET terminado = 1;
+
+    OPEN llaves;
+    recorrer: LOOP
+        FETCH llaves INTO v_tabla, v_llave;
+        IF terminado THEN
+            LEAVE recorrer;
+        END IF;
+        SET @sentencia = CONCAT('ALTER TABLE `', v_tabla, '` DROP FOREIGN KEY `', v_llave, '`');
+        PREPARE ejecutar FROM @sentencia;
+        EXECUTE ejecutar;
+        DEALLOCATE PREPARE ejecutar;
+    END LOOP;
+    CLOSE llaves;
+END //
+DELIMITER ;
+
+CALL quitar_llaves_auditoria();
+DROP PROCEDURE quitar_llaves_auditoria;
+
+-- La columna de partición debe formar parte de la clave primaria
+ALTER TABLE auditoria
+    MODIFY fecha DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, fecha);
+
+-- datos_Anteriores / datos_Nuevos son copias completas: compresión de página
+ALTER TABLE auditoria ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
+
+ALTER TABLE auditoria
+    PARTITION BY RANGE (TO_DAYS(fecha)) (
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+-- Índice compacto de registros archivados: una fila por registro y archivo mensual
+CREATE TABLE IF NOT EXISTS auditoria_archivo_indice (
+    tabla VARCHAR(100) NOT NULL,
+    registro_Id INT NOT NULL,
+    archivo VARCHAR(255) NOT NULL,
+    fecha_desde DATETIME NOT NULL,
+    fecha_hasta DATETIME NOT NULL,
+    total INT NOT NULL,
+    PRIMARY KEY (tabla, registro_Id, archivo)
+);
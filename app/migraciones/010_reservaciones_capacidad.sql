@@ -0,0 +1,27 @@
+-- Capacidad ocupada por sucursal, fecha y hora (app/services/capacidad_reservaciones.py)
+-- Las reservaciones se admiten con un UPDATE condicional sobre esta fila, así dos
+-- reservaciones simultáneas no pueden pasar ambas la verificación de capacidad.
+CREATE TABLE IF NOT EXISTS reservaciones_capacidad (
+    sucursal_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    hora TIME NOT NULL,
+    capacidad INT NOT NULL,
+    reservado INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sucursal_id, fecha, hora)
+);
+
+-- Ocupación actual de las reservaciones futuras
+INSERT INTO reservaciones_capacidad (sucursal_id, fecha, hora, capacidad, reservado)
+SELECT r.sucursal_id, r.fecha_reservacion, r.hora_reservacion,
+       COALESCE(MAX(h.capacidad_maxima), 0), SUM(r.numero_personas)
+FROM reservaciones r
+LEFT JOIN horarios_disponibles h
+    ON h.sucursal_id = r.sucursal_id
+    AND h.hora_inicio = r.hora_reservacion
+    AND h.dia_semana = ELT(WEEKDAY(r.fecha_reservacion) + 1,
+        'lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo')
+    AND h.activo = TRUE
+WHERE r.estado IN ('pendiente', 'confirmada')
+AND r.fecha_reservacion >= CURDATE()
+GROUP BY r.sucursal_id, r.fecha_reservacion, r.hora_reservacion
+ON DUPLICATE KEY UPDATE reservado = VALUES(reservado);
@@ -0,0 +1,7 @@
+-- Código de cupón normalizado (sin espacios al borde, en mayúsculas) e indexado.
+-- Las búsquedas que no encuentran el cupón en memoria (app/services/referencia.py)
+-- usan este índice en lugar de UPPER(codigo), que no puede usar ninguno.
+ALTER TABLE cupones
+    ADD COLUMN codigo_normalizado VARCHAR(100)
+        GENERATED ALWAYS AS (UPPER(TRIM(codigo))) STORED,
+    ADD INDEX idx_cupones_codigo_normalizado (codigo_normalizado);
@@ -0,0 +1,25 @@
+-- Contadores de uso de cupones (app/services/usos_cupones.py)
+-- Se incrementan con UPDATE condicionales en la misma transacción que inserta en
+-- cupon_usos, así validar un cupón no cuenta filas y los límites no se exceden
+-- con canjes simultáneos.
+ALTER TABLE cupones
+    ADD COLUMN usos_actuales INT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS cupon_usos_cliente (
+    cupon_id INT NOT NULL,
+    cliente_id INT NOT NULL,
+    usos INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (cupon_id, cliente_id)
+);
+
+-- Valores iniciales desde los usos ya registrados
+UPDATE cupones c
+JOIN (SELECT cupon_id, COUNT(*) as total FROM cupon_usos GROUP BY cupon_id) u
+    ON u.cupon_id = c.id
+SET c.usos_actuales = u.total;
+
+INSERT INTO cupon_usos_cliente (cupon_id, cliente_id, usos)
+SELECT cupon_id, cliente_id, COUNT(*)
+FROM cupon_usos
+GROUP BY cupon_id, cliente_id
+ON DUPLICATE KEY UPDATE usos = VALUES(usos);
@@ -0,0 +1,41 @@
+-- Elimina las llaves foráneas de otras tablas hacia pedidos(id)
+-- (cupon_usos, puntos_historial, transacciones, ...). Sin esto el DELETE de
+-- app/services/archivo_pedidos.py falla (RESTRICT) o borra en cascada el
+-- historial de cupones, puntos y pagos del pedido archivado.
+-- pedido_detalles conserva su llave: el archivador borra las líneas antes que el pedido.
+-- Los índices de las columnas pedido_id se conservan; solo se quita la restricción.
+-- Ejecutar con el cliente mysql (usa DELIMITER).
+
+DROP PROCEDURE IF EXISTS quitar_llaves_hacia_pedidos;
+
+DELIMITER //
+CREATE PROCEDURE quitar_llaves_hacia_pedidos()
+BEGIN
+    DECLARE terminado INT DEFAULT 0;
+    DECLARE v_tabla VARCHAR(64);
+    DECLARE v_llave VARCHAR(64);
+    DECLARE llaves CURSOR FOR
+        SELECT TABLE_NAME, CONSTRAINT_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+        AND REFERENCED_TABLE_NAME = 'pedidos'
+        AND TABLE_NAME NOT IN ('pedido_detalles', 'pedido_detalles_archivo');
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET terminado = 1;
+
+    OPEN llaves;
+    recorrer: LOOP
+        FETCH llaves INTO v_tabla, v_llave;
+        IF terminado THEN
+            LEAVE recorrer;
+        END IF;
+        SET @sentencia = CONCAT('ALTER TABLE `', v_tabla, '` DROP FOREIGN KEY `', v_llave, '`');
+        PREPARE ejecutar FROM @sentencia;
+        EXECUTE ejecutar;
+        DEALLOCATE PREPARE ejecutar;
+    END LOOP;
+    CLOSE llaves;
+END //
+DELIMITER ;
+
+CALL quitar_llaves_hacia_pedidos();
+DROP PROCEDURE quitar_llaves_hacia_pedidos;
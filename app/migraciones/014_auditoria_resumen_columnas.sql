@@ -0,0 +1,9 @@
+-- Amplía auditoria_resumen.clave y .accion para los valores de auditoria.tabla y
+-- auditoria.accion (008 las creó como VARCHAR(100) y VARCHAR(20)). Un valor más
+-- largo hacía fallar el INSERT de los contadores y, con él, el lote completo de
+-- auditoría. app/services/auditoria_resumen.py recorta a estos mismos largos.
+-- Si la carga inicial de 008 falló por esa razón, reconstruir los contadores
+-- después de aplicar esta migración: python -m app.services.auditoria_resumen
+ALTER TABLE auditoria_resumen
+    MODIFY clave VARCHAR(255) NOT NULL DEFAULT '',
+    MODIFY accion VARCHAR(50) NOT NULL;
@@ -0,0 +1,4 @@
+-- Suma de personas por horario (sembrado de reservaciones_capacidad en
+-- app/services/capacidad_reservaciones.py, disponibilidad y calendario)
+ALTER TABLE reservaciones
+    ADD INDEX idx_reservaciones_horario (sucursal_id, fecha_reservacion, hora_reservacion);
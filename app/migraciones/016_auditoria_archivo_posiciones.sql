@@ -0,0 +1,10 @@
+-- Índice de auditoría archivada (app/services/retencion_auditoria.py):
+-- tabla con el mismo largo que auditoria_resumen.clave (014); con VARCHAR(100)
+-- un nombre más largo hacía fallar el archivado de la partición completa.
+-- desplazamiento / largo: posición en bytes del tramo (miembro gzip) de cada
+-- registro dentro del archivo mensual; NULL en archivos escritos antes de esta
+-- migración, que se siguen leyendo completos.
+ALTER TABLE auditoria_archivo_indice
+    MODIFY tabla VARCHAR(255) NOT NULL,
+    ADD COLUMN desplazamiento BIGINT NULL AFTER archivo,
+    ADD COLUMN largo INT NULL AFTER desplazamiento;
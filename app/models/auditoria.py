@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class AuditoriaCreate(BaseModel):
+    usuario_Id: int
+    tabla: str
+    accion: str  
+    registro_Id: int = 0
+    datos_Anteriores: Optional[str] = None
+    datos_Nuevos: Optional[str] = None
+    ip_Address: Optional[str] = None
+    descripcion: Optional[str] = None
+    endpoint: Optional[str] = None
+    metodo: Optional[str] = None
@@ -0,0 +1,305 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from typing import Optional
+from datetime import datetime, date
+import base64
+from app.config.database import execute_query, transaccion
+from app.models.auditoria import AuditoriaCreate
+from app.services.trabajos import manejador
+from app.services import exportacion, escritor_auditoria, auditoria_resumen, retencion_auditoria, planificador
+from app.services.cache import CacheTTL
+
+router = APIRouter(
+    prefix="/auditoria",
+    tags=["Auditoría"]
+)
+
+# ============= AUDITORÍA =============
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+def create_auditoria(auditoria: AuditoriaCreate):
+    """Encolar un registro de auditoría; se escribe en lote en segundo plano"""
+    escritor_auditoria.encolar(auditoria.model_dump())
+    return {"message": "Auditoría encolada"}
+
+@manejador('auditoria.crear')
+def trabajo_crear_auditoria(payload: dict):
+    """Registrar un evento de auditoría desde la cola de trabajos"""
+    # Escritura directa: el trabajo solo se marca completado si la fila quedó guardada
+    with transaccion() as cursor:
+        escritor_auditoria.insertar(cursor, [AuditoriaCreate(**payload).model_dump()])
+
+@router.get("/escritor/metricas")
+def get_metricas_escritor():
+    """Estado de la cola de escritura de auditoría"""
+    return escritor_auditoria.metricas()
+
+LIMITE_MAXIMO = 200
+
+# Totales por combinación de filtros; no hace falta recontar en cada página
+_cache_totales = CacheTTL(ttl=60, maximo=1000)
+
+def _codificar_cursor(fecha, auditoria_id: int) -> str:
+    valor = f"{fecha.isoformat()}|{auditoria_id}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+def _decodificar_cursor(cursor: str):
+    try:
+        fecha, auditoria_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(auditoria_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _contar(where_clause: str, params: tuple, conteo: str):
+    if conteo == 'exacto':
+        query = f"SELECT COUNT(*) as total FROM auditoria a WHERE {where_clause}"
+        return execute_query(query, params)[0]['total']
+
+    # Estimado del optimizador: no recorre la tabla
+    plan = execute_query(f"EXPLAIN SELECT a.id FROM auditoria a WHERE {where_clause}", params)
+    return int(plan[0]['rows'] or 0) if plan else 0
+
+@router.get("")
+def get_auditorias(
+    usuario_Id: Optional[int] = Query(None),
+    tabla: Optional[str] = Query(None),
+    accion: Optional[str] = Query(None),
+    fechaDesde: Optional[str] = Query(None),
+    fechaHasta: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, description="siguienteCursor de la página anterior"),
+    conteo: str = Query('estimado', pattern='^(exacto|estimado|ninguno)$'),
+    offset: int = Query(0, ge=0, deprecated=True)
+):
+    """Listar auditoría paginada por cursor sobre (fecha, id); para volcados usar /auditoria/exportar"""
+    conditions = []
+    params = []
+    
+    if usuario_Id:
+        conditions.append("a.usuario_Id = %s")
+        params.append(usuario_Id)
+    
+    if tabla:
+        conditions.append("a.tabla = %s")
+        params.append(tabla)
+    
+    if accion:
+        conditions.append("a.accion = %s")
+        params.append(accion)
+    
+    if fechaDesde:
+        conditions.append("a.fecha >= %s")
+        params.append(fechaDesde)
+    
+    if fechaHasta:
+        conditions.append("a.fecha <= %s")
+        params.append(fechaHasta)
+    
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    
+    # Total exacto o estimado, en caché por filtros
+    total = None
+    if conteo != 'ninguno':
+        filtros = tuple(params)
+        total = _cache_totales.obtener((where_clause, filtros, conteo), lambda: _contar(where_clause, filtros, conteo))
+    
+    # Página siguiente: filas estrictamente anteriores al cursor
+    pagina_conditions = list(conditions)
+    pagina_params = list(params)
+    if cursor:
+        fecha_cursor, id_cursor = _decodificar_cursor(cursor)
+        pagina_conditions.append("(a.fecha < %s OR (a.fecha = %s AND a.id < %s))")
+        pagina_params.extend([fecha_cursor, fecha_cursor, id_cursor])
+        offset = 0
+    
+    pagina_where = " AND ".join(pagina_conditions) if pagina_conditions else "1=1"
+    
+    # Obtener registros (uno extra para saber si hay más)
+    pagina_params.extend([limit + 1, offset])
+    query = f"""
+        SELECT 
+            a.*,
+            u.correo,
+            c.nombre,
+            c.apellido
+        FROM auditoria a
+        LEFT JOIN usuarios u ON a.usuario_Id = u.id
+        LEFT JOIN clientes c ON u.id = c.usuario_Id
+        WHERE {pagina_where}
+        ORDER BY a.fecha DESC, a.id DESC
+        LIMIT %s OFFSET %s
+    """
+    
+    items = execute_query(query, tuple(pagina_params))
+    
+    siguiente_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        siguiente_cursor = _codificar_cursor(items[-1]['fecha'], items[-1]['id'])
+    
+    return {
+        "items": items,
+        "total": total,
+        "conteo": conteo,
+        "limit": limit,
+        "offset": offset,
+        "siguienteCursor": siguiente_cursor,
+        "exportar": "/auditoria/exportar"
+    }
+
+COLUMNAS_EXPORTAR = [
+    'id', 'fecha', 'usuario_Id', 'correo', 'tabla', 'accion', 'registro_Id',
+    'descripcion', 'endpoint', 'metodo', 'ip_Address', 'datos_Anteriores', 'datos_Nuevos'
+]
+
+@router.get("/exportar")
+def exportar_auditorias(
+    usuario_Id: Optional[int] = Query(None),
+    tabla: Optional[str] = Query(None),
+    accion: Optional[str] = Query(None),
+    fechaDesde: Optional[str] = Query(None),
+    fechaHasta: Optional[str] = Query(None),
+    formato: str = Query('csv', pattern='^(csv|ndjson)$'),
+    gzip: bool = Query(False)
+):
+    """Exportar el registro de auditoría en streaming (CSV o NDJSON)"""
+    try:
+        if fechaDesde:
+            desde = datetime.strptime(fechaDesde[:10], '%Y-%m-%d').date()
+        else:
+            primero = execute_query("SELECT MIN(fecha) as primero FROM auditoria")[0]['primero']
+            desde = primero.date() if primero else date.today()
+        hasta = datetime.strptime(fechaHasta[:10], '%Y-%m-%d').date() if fechaHasta else date.today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+
+    conditions = ["a.fecha >= %(desde)s", "a.fecha < %(hasta)s"]
+    params = {}
+
+    if usuario_Id:
+        conditions.append("a.usuario_Id = %(usuario_Id)s")
+        params['usuario_Id'] = usuario_Id
+
+    if tabla:
+        conditions.append("a.tabla = %(tabla)s")
+        params['tabla'] = tabla
+
+    if accion:
+        conditions.append("a.accion = %(accion)s")
+        params['accion'] = accion
+
+    query = f"""
+        SELECT
+            a.*,
+            u.correo
+        FROM auditoria a
+        LEFT JOIN usuarios u ON a.usuario_Id = u.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY a.fecha ASC, a.id ASC
+    """
+
+    filas = exportacion.filas_por_rangos(query, desde, hasta, params)
+    return exportacion.respuesta(
+        filas, COLUMNAS_EXPORTAR, formato, f"auditoria_{desde}_{hasta}", comprimir=gzip
+    )
+
+@router.get("/{id}")
+def get_auditoria_by_id(id: int):
+    query = """
+        SELECT 
+            a.*,
+            u.correo,
+            c.nombre,
+            c.apellido
+        FROM auditoria a
+        LEFT JOIN usuarios u ON a.usuario_Id = u.id
+        LEFT JOIN clientes c ON u.id = c.usuario_Id
+        WHERE a.id = %s
+    """
+    result = execute_query(query, (id,))
+    if not result:
+        raise HTTPException(status_code=404, detail="Auditoría no encontrada")
+    return result[0]
+
+@router.get("/historial/{tabla}/{registro_id}")
+def get_historial_registro(tabla: str, registro_id: int):
+    query = """
+        SELECT 
+            a.*,
+            u.correo,
+            c.nombre,
+            c.apellido
+        FROM auditoria a
+        LEFT JOIN usuarios u ON a.usuario_Id = u.id
+        LEFT JOIN clientes c ON u.id = c.usuario_Id
+        WHERE a.tabla = %s AND a.registro_Id = %s
+        ORDER BY a.fecha DESC
+    """
+    historial = execute_query(query, (tabla, registro_id))
+
+    # Los meses fuera del periodo de retención están en el archivo comprimido;
+    # siempre son anteriores a lo que queda en la tabla
+    archivados = retencion_auditoria.buscar_archivados(tabla, registro_id)
+    if archivados:
+        usuario_ids = sorted({r['usuario_Id'] for r in archivados if r.get('usuario_Id')})
+        usuarios = {}
+        if usuario_ids:
+            placeholders = ", ".join(["%s"] * len(usuario_ids))
+            usuarios = {
+                u['id']: u for u in execute_query(f"""
+                    SELECT u.id, u.correo, c.nombre, c.apellido
+                    FROM usuarios u
+                    LEFT JOIN clientes c ON u.id = c.usuario_Id
+                    WHERE u.id IN ({placeholders})
+                """, tuple(usuario_ids))
+            }
+        for registro in archivados:
+            usuario = usuarios.get(registro.get('usuario_Id'), {})
+            historial.append({
+                **registro,
+                'correo': usuario.get('correo'),
+                'nombre': usuario.get('nombre'),
+                'apellido': usuario.get('apellido'),
+                'archivado': True
+            })
+
+    return historial
+
+@router.get("/estadisticas/general")
+def get_estadisticas_auditoria(
+    usuario_Id: Optional[int] = Query(None),
+    tabla: Optional[str] = Query(None)
+):
+    # Los contadores son por usuario o por tabla, no por la combinación
+    if usuario_Id and tabla:
+        raise HTTPException(status_code=400, detail="Filtre por usuario_Id o por tabla, no por ambos")
+    
+    # Contadores mantenidos al escribir cada lote (auditoria_resumen)
+    resultados = auditoria_resumen.obtener(usuario_Id, tabla)
+    
+    stats = {
+        'totalInserts': 0,
+        'totalUpdates': 0,
+        'totalDeletes': 0,
+        'totalSelects': 0,
+        'total': 0
+    }
+    
+    for accion, total in resultados.items():
+        if accion == 'insert':
+            stats['totalInserts'] = total
+        elif accion == 'update':
+            stats['totalUpdates'] = total
+        elif accion == 'delete':
+            stats['totalDeletes'] = total
+        elif accion == 'select':
+            stats['totalSelects'] = total
+        
+        stats['total'] += total
+    
+    return stats
+
+# ============= RETENCIÓN =============
+@planificador.tarea('auditoria.retencion', '0 2 * * *', jitter=600, unica=True)
+def tarea_retencion_auditoria():
+    """Particiones mensuales nuevas y archivado de las vencidas"""
+    retencion_auditoria.asegurar_particiones()
+    retencion_auditoria.aplicar_retencion()
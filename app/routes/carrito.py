@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from app.config.database import execute_query
+from app.config.database import execute_query, transaccion
 
 router = APIRouter(
     prefix="/carrito",
@@ -15,87 +15,81 @@ class AgregarProductoDto(BaseModel):
 def get_carrito(usuario_id: int):
     """Obtener carrito activo del usuario"""
     
-    # Buscar cliente
-    cliente_query = "SELECT id FROM clientes WHERE usuario_id = %s"
-    cliente = execute_query(cliente_query, (usuario_id,))
-    
-    if not cliente:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    
-    cliente_id = cliente[0]['id']
-    
-    # Buscar carrito activo CON SUCURSAL
+    # Cliente, carrito activo, sucursal y productos en una sola consulta
     carrito_query = """
         SELECT 
-            p.*,
+            c.id as cliente_id,
+            p.id,
+            p.subtotal,
+            p.descuento,
+            p.costo_envio,
+            p.total,
             s.id as sucursal_id,
             s.nombre as sucursal_nombre,
             s.direccion as sucursal_direccion,
             s.provincia as sucursal_provincia,
             s.telefono as sucursal_telefono,
-            s.horario as sucursal_horario
-        FROM pedidos p
-        LEFT JOIN sucursales s ON p.sucursal_id = s.id
-        WHERE p.cliente_id = %s AND p.estado = 'carrito'
-        ORDER BY p.fecha_creacion DESC
-        LIMIT 1
-    """
-    
-    carrito = execute_query(carrito_query, (cliente_id,))
-    
-    if not carrito:
-        # Crear carrito vacío si no existe
-        insert_query = """
-            INSERT INTO pedidos (cliente_id, estado, subtotal, descuento, costo_envio, total)
-            VALUES (%s, 'carrito', 0, 0, 0, 0)
-        """
-        result = execute_query(insert_query, (cliente_id,), fetch=False)
-        pedido_id = result['last_id']
-        
-        return {
-            "id": pedido_id,
-            "subtotal": 0,
-            "descuento": 0,
-            "costoEnvio": 0,
-            "total": 0,
-            "tiempoEstimado": 0,
-            "productos": [],
-            "sucursal": None,
-            "sucursal_id": None
-        }
-    
-    carrito = carrito[0]
-    pedido_id = carrito['id']
-    
-    # Obtener productos del carrito
-    productos_query = """
-        SELECT 
-            pd.id,
+            s.horario as sucursal_horario,
+            pd.id as detalle_id,
             pd.producto_id,
             pd.cantidad,
             pd.precio_unitario,
-            pd.subtotal,
+            pd.subtotal as detalle_subtotal,
             pd.notas_especiales,
             pr.nombre,
             pr.descripcion,
-            pr.imagen_principal as imagen
-        FROM pedido_detalles pd
-        JOIN productos pr ON pd.producto_id = pr.id
-        WHERE pd.pedido_id = %s
+            pr.imagen_principal as imagen,
+            pr.tiempo_preparacion
+        FROM clientes c
+        LEFT JOIN pedidos p ON p.id = (
+            SELECT p2.id FROM pedidos p2
+            WHERE p2.cliente_id = c.id AND p2.estado = 'carrito'
+            ORDER BY p2.fecha_creacion DESC
+            LIMIT 1
+        )
+        LEFT JOIN sucursales s ON p.sucursal_id = s.id
+        LEFT JOIN pedido_detalles pd ON pd.pedido_id = p.id
+        LEFT JOIN productos pr ON pd.producto_id = pr.id
+        WHERE c.usuario_id = %s
+        ORDER BY pd.id ASC
     """
     
-    productos = execute_query(productos_query, (pedido_id,))
+    with transaccion() as cursor:
+        cursor.execute(carrito_query, (usuario_id,))
+        filas = cursor.fetchall()
+        
+        if not filas:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        
+        carrito = filas[0]
+        
+        if carrito['id'] is None:
+            # Crear carrito vacío si no existe (misma conexión)
+            insert_query = """
+                INSERT INTO pedidos (cliente_id, estado, subtotal, descuento, costo_envio, total)
+                VALUES (%s, 'carrito', 0, 0, 0, 0)
+            """
+            cursor.execute(insert_query, (carrito['cliente_id'],))
+            
+            return {
+                "id": cursor.lastrowid,
+                "subtotal": 0,
+                "descuento": 0,
+                "costoEnvio": 0,
+                "total": 0,
+                "tiempoEstimado": 0,
+                "productos": [],
+                "sucursal": None,
+                "sucursal_id": None
+            }
+    
+    # Solo líneas con producto existente (equivalente al JOIN original)
+    productos = [f for f in filas if f['detalle_id'] is not None and f['nombre'] is not None]
     
-    # Calcular tiempo estimado
+    # Calcular tiempo estimado con las filas ya obtenidas
     if productos:
-        tiempo_query = """
-            SELECT MAX(pr.tiempo_preparacion) as max_tiempo
-            FROM pedido_detalles pd
-            JOIN productos pr ON pd.producto_id = pr.id
-            WHERE pd.pedido_id = %s
-        """
-        tiempo_result = execute_query(tiempo_query, (pedido_id,))
-        tiempo_estimado = tiempo_result[0]['max_tiempo'] or 15
+        tiempos = [p['tiempo_preparacion'] for p in productos if p['tiempo_preparacion'] is not None]
+        tiempo_estimado = max(tiempos, default=None) or 15
     else:
         tiempo_estimado = 0
     
@@ -120,14 +114,14 @@ def get_carrito(usuario_id: int):
         "tiempoEstimado": tiempo_estimado,
         "productos": [
             {
-                "id": p['id'],
+                "id": p['detalle_id'],
                 "productoId": p['producto_id'],
                 "nombre": p['nombre'],
                 "descripcion": p['descripcion'],
                 "imagen": p['imagen'],
                 "precio": float(p['precio_unitario']),
                 "cantidad": p['cantidad'],
-                "subtotal": float(p['subtotal']),
+                "subtotal": float(p['detalle_subtotal']),
                 "notas": p['notas_especiales']
             }
             for p in productos
@@ -288,11 +282,12 @@ def add_carrito_item(carritoId: int, productoId: int, cantidad: int):
     return {"message": "Item agregado al carrito"}
 
 def recalcular_carrito(carrito_id: int):
-    """Recalcula subtotal y total del carrito"""
-    query = "SELECT SUM(subtotal) as total FROM pedido_detalles WHERE pedido_id = %s"  
+    """Recalcula subtotal, total y cantidad de productos del carrito"""
+    query = "SELECT SUM(subtotal) as total, COUNT(*) as cantidad FROM pedido_detalles WHERE pedido_id = %s"  
     result = execute_query(query, (carrito_id,))
     
     subtotal = result[0]['total'] or 0
+    cantidad_productos = result[0]['cantidad']
     
     # Obtener descuento actual
     pedido_query = "SELECT descuento, tipo_entrega FROM pedidos WHERE id = %s"  
@@ -311,10 +306,10 @@ def recalcular_carrito(carrito_id: int):
     # Actualizar pedido
     update_query = """
         UPDATE pedidos 
-        SET subtotal = %s, costo_envio = %s, total = %s 
+        SET subtotal = %s, costo_envio = %s, total = %s, cantidad_productos = %s 
         WHERE id = %s
     """  
-    execute_query(update_query, (subtotal, costo_envio, total, carrito_id), fetch=False)
+    execute_query(update_query, (subtotal, costo_envio, total, cantidad_productos, carrito_id), fetch=False)
 
 @router.delete("/items/{id}")
 def delete_carrito_item(id: int):
@@ -342,7 +337,7 @@ def vaciar_carrito(carrito_id: int):
     # Resetear totales
     execute_query("""
         UPDATE pedidos 
-        SET subtotal = 0, descuento = 0, costo_envio = 0, total = 0 
+        SET subtotal = 0, descuento = 0, costo_envio = 0, total = 0, cantidad_productos = 0 
         WHERE id = %s
     """, (carrito_id,), fetch=False)  
     
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from app.config.database import execute_query 
+from app.services import referencia
 
 router = APIRouter(
     prefix="/categorias",
@@ -9,18 +10,15 @@ router = APIRouter(
 # ============= OBTENER TODAS LAS CATEGORÍAS =============
 @router.get("/")
 def get_categorias():
-    query = "SELECT * FROM categorias ORDER BY nombre ASC"
-    result = execute_query(query)
-    return result
+    return [dict(c) for c in referencia.categorias()]
 
 # ============= OBTENER UNA CATEGORÍA POR ID =============
 @router.get("/{id}")
 def get_categoria(id: int):
-    query = "SELECT * FROM categorias WHERE id = %s"
-    result = execute_query(query, (id,))
-    if not result:
+    categoria = referencia.categoria(id)
+    if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
-    return result[0]
+    return dict(categoria)
 
 # ============= PRODUCTOS DE UNA CATEGORÍA =============
 @router.get("/{id}/productos")
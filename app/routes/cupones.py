@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
-from app.config.database import execute_query
+from app.config.database import execute_query, transaccion
 from app.models.cupones import CuponValidarRequest, CuponAplicarRequest, CuponUsoRequest
-from datetime import date
+from app.services.trabajos import manejador
+from app.services import referencia, usos_cupones
 
 router = APIRouter(
     prefix="/cupones",
@@ -12,6 +13,7 @@ router = APIRouter(
 @router.get("/")
 def get_cupones():
     """Obtener todos los cupones activos"""
+    # Incluye los vencidos, que el registro en memoria ya no carga
     return execute_query("SELECT * FROM cupones WHERE activo = TRUE")
 
 # ============= OBTENER CUPÓN POR CÓDIGO =============
@@ -19,24 +21,37 @@ def get_cupones():
 def get_cupon_by_codigo(codigo: str):
     """Obtener cupón por código"""
     
-    query = """
-        SELECT * FROM cupones 
-        WHERE UPPER(codigo) = UPPER(%s) AND activo = TRUE 
-        AND fecha_inicio <= CURDATE() AND fecha_fin >= CURDATE()
-    """
-    result = execute_query(query, (codigo,))
+    cupon = referencia.cupon_vigente(codigo)
     
-    if not result:
+    if not cupon:
         raise HTTPException(status_code=404, detail="Cupón no válido o expirado")
     
-    return result[0]
+    return dict(cupon)
 
 # ============= VALIDAR CUPÓN =============
+def _verificar_cupon(codigo: str, cliente_id: int):
+    """Cupón vigente que el cliente todavía puede usar; HTTPException si no"""
+    cupon = referencia.cupon_vigente(codigo)
+    
+    if not cupon:
+        raise HTTPException(status_code=404, detail="Cupón no encontrado o inactivo")
+    
+    # Contadores mantenidos al registrar cada uso
+    usos_totales, usos_cliente = usos_cupones.consultar(cliente_id, [cupon['id']]).get(cupon['id'], (0, 0))
+    
+    if cupon['usos_maximos'] and usos_totales >= cupon['usos_maximos']:
+        raise HTTPException(status_code=400, detail="El cupón ha alcanzado su límite de usos")
+    
+    if usos_cliente >= cupon['usos_por_cliente']:
+        raise HTTPException(status_code=400, detail="Ya has usado este cupón el máximo de veces permitido")
+    
+    return cupon
+
 @router.post("/validar")
 def validar_cupon(request: CuponValidarRequest):
     """Validar si un cupón es válido para un usuario"""
     
-    codigo = request.codigo.upper()
+    codigo = referencia.normalizar_codigo(request.codigo)
     usuario_id = request.usuarioId
     
     print(f"Validando cupón: {codigo} para usuario {usuario_id}")
@@ -48,50 +63,7 @@ def validar_cupon(request: CuponValidarRequest):
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    cliente_id = cliente[0]['id']
-    
-    # Buscar cupón
-    cupon_query = """
-        SELECT * FROM cupones 
-        WHERE UPPER(codigo) = UPPER(%s) AND activo = TRUE 
-        AND fecha_inicio <= CURDATE() AND fecha_fin >= CURDATE()
-    """
-    cupon = execute_query(cupon_query, (codigo,))
-    
-    if not cupon:
-        raise HTTPException(status_code=404, detail="Cupón no encontrado o inactivo")
-    
-    cupon = cupon[0]
-    
-    # Validar fechas
-    hoy = date.today()
-    
-    if cupon['fecha_inicio'] > hoy:
-        raise HTTPException(status_code=400, detail="El cupón aún no está disponible")
-    
-    if cupon['fecha_fin'] < hoy:
-        raise HTTPException(status_code=400, detail="El cupón ha expirado")
-    
-    # Validar usos totales
-    if cupon['usos_maximos']:
-        usos_query = "SELECT COUNT(*) as total FROM cupon_usos WHERE cupon_id = %s"
-        usos = execute_query(usos_query, (cupon['id'],))
-        usos_actuales = usos[0]['total']
-        
-        if usos_actuales >= cupon['usos_maximos']:
-            raise HTTPException(status_code=400, detail="El cupón ha alcanzado su límite de usos")
-    
-    # Validar usos por cliente
-    usos_cliente_query = """
-        SELECT COUNT(*) as total 
-        FROM cupon_usos 
-        WHERE cupon_id = %s AND cliente_id = %s
-    """
-    usos_cliente = execute_query(usos_cliente_query, (cupon['id'], cliente_id))
-    usos_cliente_total = usos_cliente[0]['total']
-    
-    if usos_cliente_total >= cupon['usos_por_cliente']:
-        raise HTTPException(status_code=400, detail="Ya has usado este cupón el máximo de veces permitido")
+    cupon = _verificar_cupon(codigo, cliente[0]['id'])
     
     print(f" Cupón válido")
     
@@ -111,7 +83,7 @@ def validar_cupon(request: CuponValidarRequest):
 def aplicar_cupon(request: CuponAplicarRequest):
     """Aplicar cupón al carrito del usuario"""
     
-    codigo = request.codigo.upper()
+    codigo = referencia.normalizar_codigo(request.codigo)
     usuario_id = request.usuarioId
     
     print(f" Aplicando cupón {codigo} para usuario {usuario_id}")
@@ -125,11 +97,8 @@ def aplicar_cupon(request: CuponAplicarRequest):
     
     cliente_id = cliente[0]['id']
     
-    # Validar cupón primero
-    try:
-        validacion = validar_cupon(CuponValidarRequest(codigo=codigo, usuarioId=usuario_id))
-    except HTTPException as e:
-        raise e
+    # Validar cupón (una sola búsqueda, reutilizada abajo)
+    cupon = _verificar_cupon(codigo, cliente_id)
     
     # Buscar carrito
     carrito_query = """
@@ -143,11 +112,6 @@ def aplicar_cupon(request: CuponAplicarRequest):
     
     carrito = carrito[0]
     
-    # Buscar cupón completo
-    cupon_query = "SELECT * FROM cupones WHERE UPPER(codigo) = UPPER(%s)"
-    cupon = execute_query(cupon_query, (codigo,))
-    cupon = cupon[0]
-    
     # Validar monto mínimo
     subtotal = float(carrito['subtotal'])
     monto_minimo = float(cupon['monto_minimo'])
@@ -261,40 +225,21 @@ def get_cupones_disponibles(usuario_id: int):
     cliente_id = cliente[0]['id']
     
     # Obtener cupones activos
-    cupones_query = """
-        SELECT * FROM cupones 
-        WHERE activo = TRUE 
-        AND fecha_inicio <= CURDATE() 
-        AND fecha_fin >= CURDATE()
-        ORDER BY valor_descuento DESC
-    """
-    cupones = execute_query(cupones_query)
+    cupones = sorted(referencia.cupones_vigentes(), key=lambda c: c['valor_descuento'], reverse=True)
+    
+    # Usos de todos los cupones vigentes en una sola consulta
+    usos = usos_cupones.consultar(cliente_id, [c['id'] for c in cupones])
     
     cupones_disponibles = []
     
     for cupon in cupones:
-        # Verificar usos del cliente
-        usos_cliente_query = """
-            SELECT COUNT(*) as total 
-            FROM cupon_usos 
-            WHERE cupon_id = %s AND cliente_id = %s
-        """
-        usos_cliente = execute_query(usos_cliente_query, (cupon['id'], cliente_id))
-        usos_cliente_total = usos_cliente[0]['total']
+        usos_totales, usos_cliente = usos.get(cupon['id'], (0, 0))
         
-        if usos_cliente_total >= cupon['usos_por_cliente']:
+        if usos_cliente >= cupon['usos_por_cliente']:
             continue
         
-        # Verificar usos totales
-        if cupon['usos_maximos']:
-            usos_totales_query = """
-                SELECT COUNT(*) as total 
-                FROM cupon_usos 
-                WHERE cupon_id = %s
-            """
-            usos_totales = execute_query(usos_totales_query, (cupon['id'],))
-            if usos_totales[0]['total'] >= cupon['usos_maximos']:
-                continue
+        if cupon['usos_maximos'] and usos_totales >= cupon['usos_maximos']:
+            continue
         
         cupones_disponibles.append({
             "codigo": cupon['codigo'],
@@ -313,8 +258,8 @@ def registrar_uso_cupon(request: CuponUsoRequest):
     """Registrar el uso de un cupón"""
     
     # Buscar cupón
-    cupon_query = "SELECT id FROM cupones WHERE codigo = %s"
-    cupon = execute_query(cupon_query, (request.cuponCodigo,))
+    cupon_query = "SELECT id FROM cupones WHERE codigo_normalizado = %s"
+    cupon = execute_query(cupon_query, (referencia.normalizar_codigo(request.cuponCodigo),))
     
     if not cupon:
         return {"message": "Cupón no encontrado"}
@@ -326,13 +271,18 @@ def registrar_uso_cupon(request: CuponUsoRequest):
     pedido = execute_query(pedido_query, (request.pedidoId,))
     descuento = float(pedido[0]['descuento']) if pedido else 0
     
-    # Registrar uso
-    insert_query = """
-        INSERT INTO cupon_usos (cupon_id, cliente_id, pedido_id, descuento_aplicado)
-        VALUES (%s, %s, %s, %s)
-    """
-    execute_query(insert_query, (cupon_id, request.clienteId, request.pedidoId, descuento), fetch=False)
+    # Registrar uso (una sola vez por pedido) y subir los contadores si hay cupo
+    with transaccion() as cursor:
+        registrado = usos_cupones.registrar(cursor, cupon_id, request.clienteId, request.pedidoId, descuento)
     
-    print(f"Uso de cupón registrado")
+    if not registrado:
+        print(f"Uso de cupón ya registrado para pedido {request.pedidoId}")
+    else:
+        print(f"Uso de cupón registrado")
     
-    return {"message": "Uso de cupón registrado"}
\ No newline at end of file
+    return {"message": "Uso de cupón registrado"}
+
+@manejador('cupones.registrar_uso')
+def trabajo_registrar_uso_cupon(payload: dict):
+    """Registrar el uso de cupón de un pedido desde la cola de trabajos"""
+    registrar_uso_cupon(CuponUsoRequest(**payload))
\ No newline at end of file
@@ -1,7 +1,9 @@
 
 from fastapi import APIRouter, HTTPException
-from app.config.database import execute_query
+from app.config.database import execute_query, transaccion
 from app.models.lealtad import AgregarPuntosRequest, CanjearRecompensaRequest
+from app.services.trabajos import manejador
+from app.services import referencia
 from datetime import date, timedelta
 import time
 
@@ -55,30 +57,44 @@ def agregar_puntos_por_compra(request: AgregarPuntosRequest):
     print(f" Monto: ₡{monto_compra} → {puntos_ganados} puntos")
     
     if puntos_ganados > 0:
-        # Actualizar puntos del cliente
-        nuevos_puntos = puntos_actuales + puntos_ganados
-        update_query = "UPDATE clientes SET puntos_lealtad = %s WHERE id = %s"
-        execute_query(update_query, (nuevos_puntos, cliente_id), fetch=False)
-        
-        print(f"Puntos actualizados: {puntos_actuales} → {nuevos_puntos}")
-        
-        # Registrar en historial (si existe la tabla)
-        try:
+        with transaccion() as cursor:
+            # Registrar en historial; la clave única (pedido_id, tipo) evita sumar dos veces el mismo pedido
             historial_query = """
-                INSERT INTO puntos_historial 
+                INSERT IGNORE INTO puntos_historial 
                 (cliente_id, puntos, tipo, pedido_id, descripcion)
                 VALUES (%s, %s, 'ganado', %s, %s)
             """
             descripcion = f"Ganados por compra de ₡{int(monto_compra):,}"
-            execute_query(historial_query, (cliente_id, puntos_ganados, pedido_id, descripcion), fetch=False)
-        except Exception as e:
-            print(f" No se pudo registrar en historial: {e}")
+            cursor.execute(historial_query, (cliente_id, puntos_ganados, pedido_id, descripcion))
+            
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "SELECT puntos FROM puntos_historial WHERE pedido_id = %s AND tipo = 'ganado'",
+                    (pedido_id,)
+                )
+                registrado = cursor.fetchone()
+                print(f"Puntos del pedido {pedido_id} ya registrados")
+                return {
+                    "puntosGanados": int(registrado['puntos']) if registrado else 0,
+                    "puntosTotal": puntos_actuales
+                }
+            
+            # Actualizar puntos del cliente
+            update_query = "UPDATE clientes SET puntos_lealtad = puntos_lealtad + %s WHERE id = %s"
+            cursor.execute(update_query, (puntos_ganados, cliente_id))
+        
+        print(f"Puntos actualizados: {puntos_actuales} → {puntos_actuales + puntos_ganados}")
     
     return {
         "puntosGanados": puntos_ganados,
         "puntosTotal": puntos_actuales + puntos_ganados
     }
 
+@manejador('lealtad.agregar_puntos')
+def trabajo_agregar_puntos(payload: dict):
+    """Acumular puntos de un pedido desde la cola de trabajos"""
+    agregar_puntos_por_compra(AgregarPuntosRequest(**payload))
+
 # ============= OBTENER HISTORIAL DE PUNTOS =============
 @router.get("/historial/{usuario_id}")
 def get_historial_puntos(usuario_id: int):
@@ -128,20 +144,6 @@ def get_historial_puntos(usuario_id: int):
 def get_recompensas_disponibles():
     """Obtener todas las recompensas activas"""
     
-    query = """
-        SELECT 
-            id,
-            nombre,
-            descripcion,
-            puntos_requeridos,
-            tipo,
-            valor
-        FROM recompensas
-        WHERE activa = TRUE
-        ORDER BY puntos_requeridos ASC
-    """
-    recompensas = execute_query(query)
-    
     return [
         {
             "id": r['id'],
@@ -151,7 +153,7 @@ def get_recompensas_disponibles():
             "tipo": r['tipo'],
             "valor": r['valor']
         }
-        for r in recompensas
+        for r in referencia.recompensas()
     ]
 
 # ============= CANJEAR RECOMPENSA =============
@@ -173,16 +175,11 @@ def canjear_recompensa(request: CanjearRecompensaRequest):
     puntos_actuales = int(cliente[0]['puntos_lealtad'])
     
     # Buscar recompensa
-    recompensa_query = """
-        SELECT * FROM recompensas 
-        WHERE id = %s AND activa = TRUE
-    """
-    recompensa = execute_query(recompensa_query, (recompensa_id,))
+    recompensa = referencia.recompensa(recompensa_id)
     
     if not recompensa:
         raise HTTPException(status_code=404, detail="Recompensa no encontrada")
     
-    recompensa = recompensa[0]
     puntos_requeridos = int(recompensa['puntos_requeridos'])
     
     # Validar puntos suficientes
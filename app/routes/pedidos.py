@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException, Query,Request
+from fastapi import APIRouter, HTTPException, Query,Request, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from app.config.database import execute_query
+from datetime import datetime
+import base64
+import json
+from app.config.database import execute_query, transaccion
 from app.models.pedidos import CrearPedidoRequest, CancelarPedidoRequest
+from app.services.cache import CacheTTL
+from app.services.eventos import canal_pedidos
+from app.services import trabajos, archivo_pedidos, ventas_rollup, planificador, referencia, usos_cupones
 
 router = APIRouter(
     prefix="/pedidos",
@@ -60,7 +67,7 @@ async def crear_pedido_desde_carrito(request: Request):
     # 2. Buscar carrito activo
     print(f" Paso 2: Buscando carrito activo para cliente_id={cliente_id}")
     carrito_query = """
-        SELECT id, sucursal_id, metodo_pago_id 
+        SELECT id, sucursal_id, metodo_pago_id, total, cupon_aplicado, descuento 
         FROM pedidos 
         WHERE cliente_id = %s AND estado = 'carrito'
         ORDER BY fecha_creacion DESC 
@@ -95,44 +102,86 @@ async def crear_pedido_desde_carrito(request: Request):
     
     print(f" Sucursal validada: {sucursal_id}")
     
-    # 5. Cambiar estado del carrito a 'pendiente'
+    # 5. Cambiar estado del carrito a 'pendiente' y encolar efectos posteriores en la misma transacción
     print(f" Paso 4: Cambiando estado del carrito a 'pendiente'")
     
-    if metodo_pago == 'paypal' and paypal_order_id:
-        update_query = """
-            UPDATE pedidos 
-            SET estado = 'pendiente',
-                paypal_order_id = %s,
-                paypal_payer_id = %s,
-                paypal_amount = %s
-            WHERE id = %s
-        """
-        execute_query(update_query, (paypal_order_id, paypal_payer_id, paypal_amount, carrito_id), fetch=False)
-        print(f"Pedido con PayPal")
+    with transaccion() as cursor:
+        if metodo_pago == 'paypal' and paypal_order_id:
+            update_query = """
+                UPDATE pedidos 
+                SET estado = 'pendiente',
+                    paypal_order_id = %s,
+                    paypal_payer_id = %s,
+                    paypal_amount = %s
+                WHERE id = %s AND estado = 'carrito'
+            """
+            cursor.execute(update_query, (paypal_order_id, paypal_payer_id, paypal_amount, carrito_id))
+            nuevo_estado = 'pendiente'
+            print(f"Pedido con PayPal")
+            
+        elif metodo_pago == 'sinpe' and sinpe_comprobante:
+            update_query = """
+                UPDATE pedidos 
+                SET estado = 'pendiente',
+                    sinpe_comprobante = %s,
+                    sinpe_telefono = %s,
+                    sinpe_verificado = FALSE
+                WHERE id = %s AND estado = 'carrito'
+            """
+            cursor.execute(update_query, (sinpe_comprobante, sinpe_telefono, carrito_id))
+            nuevo_estado = 'pendiente'
+            print(f"🇨🇷 Pedido con SINPE - Comprobante: {sinpe_comprobante}")
+            
+        else:
+            # Pago en efectivo
+            update_query = """
+                UPDATE pedidos 
+                SET estado = 'confirmado',
+                    metodo_pago = 'efectivo',
+                    fecha_confirmacion = NOW()
+                WHERE id = %s AND estado = 'carrito'
+            """
+            cursor.execute(update_query, (carrito_id,))
+            nuevo_estado = 'confirmado'
+            print(f"Pedido confirmado - Pago en efectivo")
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=409, detail="El carrito ya fue procesado")
         
-    elif metodo_pago == 'sinpe' and sinpe_comprobante:
-        update_query = """
-            UPDATE pedidos 
-            SET estado = 'pendiente',
-                sinpe_comprobante = %s,
-                sinpe_telefono = %s,
-                sinpe_verificado = FALSE
-            WHERE id = %s
-        """
-        execute_query(update_query, (sinpe_comprobante, sinpe_telefono, carrito_id), fetch=False)
-        print(f"🇨🇷 Pedido con SINPE - Comprobante: {sinpe_comprobante}")
+        # El uso del cupón se registra aquí: si el cupón llegó a su límite,
+        # el pedido no se crea
+        if carrito[0]['cupon_aplicado']:
+            cursor.execute(
+                "SELECT id FROM cupones WHERE codigo_normalizado = %s",
+                (referencia.normalizar_codigo(carrito[0]['cupon_aplicado']),)
+            )
+            cupon = cursor.fetchone()
+            if cupon:
+                usos_cupones.registrar(
+                    cursor, cupon['id'], cliente_id, carrito_id, float(carrito[0]['descuento'] or 0)
+                )
         
-    else:
-        # Pago en efectivo
-        update_query = """
-            UPDATE pedidos 
-            SET estado = 'confirmado',
-                metodo_pago = 'efectivo',
-                fecha_confirmacion = NOW()
-            WHERE id = %s
-        """
-        execute_query(update_query, (carrito_id,), fetch=False)
-        print(f"Pedido confirmado - Pago en efectivo")
+        # Lealtad y auditoría se procesan en segundo plano
+        trabajos.encolar(cursor, 'lealtad.agregar_puntos', {
+            'usuarioId': usuario_id,
+            'montoCompra': float(carrito[0]['total']),
+            'pedidoId': carrito_id
+        })
+        
+        trabajos.encolar(cursor, 'auditoria.crear', {
+            'usuario_Id': usuario_id,
+            'tabla': 'pedidos',
+            'accion': 'UPDATE',
+            'registro_Id': carrito_id,
+            'datos_Anteriores': json.dumps({'estado': 'carrito'}),
+            'datos_Nuevos': json.dumps({'estado': nuevo_estado, 'metodo_pago': metodo_pago}),
+            'descripcion': 'Pedido creado desde carrito',
+            'endpoint': '/pedidos/crear-desde-carrito',
+            'metodo': 'POST'
+        })
+    
+    trabajos.despertar()
+    notificar_cambio_estado(carrito_id, cliente_id, sucursal_id, 'carrito', nuevo_estado)
     # 6. Retornar pedido creado
     print(f"Pedido creado exitosamente con ID: {carrito_id}")
     
@@ -145,13 +194,34 @@ async def crear_pedido_desde_carrito(request: Request):
     }
 
 
-@router.get("/activos")
-def get_pedidos_activos():
-    """Obtener pedidos activos (ADMIN)"""
+# Snapshot compartido entre todas las pantallas de cocina que hacen polling
+_cache_activos = CacheTTL(ttl=2)
+
+def invalidar_pedidos_activos():
+    """Forzar recarga del snapshot de pedidos activos"""
+    _cache_activos.invalidar()
+
+def notificar_cambio_estado(pedido_id: int, cliente_id: int, sucursal_id: Optional[int],
+                            estado_anterior: Optional[str], estado: str,
+                            total=None, fecha_creacion=None):
+    """Publicar un cambio de estado a los suscriptores y refrescar el snapshot"""
+    invalidar_pedidos_activos()
+    canal_pedidos.publicar('estado_pedido', {
+        'pedido_id': pedido_id,
+        'cliente_id': cliente_id,
+        'sucursal_id': sucursal_id,
+        'estado_anterior': estado_anterior,
+        'estado': estado,
+        'total': float(total) if total is not None else None,
+        'fecha_creacion': fecha_creacion.isoformat() if fecha_creacion else None
+    })
+
+def _cargar_pedidos_activos():
     query = """
         SELECT 
             p.id,
             p.cliente_id,
+            p.sucursal_id,
             p.estado,
             p.tipo_entrega,
             p.total,
@@ -166,72 +236,251 @@ def get_pedidos_activos():
     """
     pedidos = execute_query(query)
     
-    # Obtener detalles de cada pedido
+    if not pedidos:
+        return []
+    
+    # Detalles de todos los pedidos activos en una sola consulta
+    placeholders = ", ".join(["%s"] * len(pedidos))
+    detalles_query = f"""
+        SELECT 
+            pd.pedido_id,
+            pd.cantidad,
+            pd.precio_unitario,
+            pr.nombre
+        FROM pedido_detalles pd
+        JOIN productos pr ON pd.producto_id = pr.id
+        WHERE pd.pedido_id IN ({placeholders})
+        ORDER BY pd.id ASC
+    """
+    detalles = execute_query(detalles_query, tuple(p['id'] for p in pedidos))
+    
+    productos_por_pedido = {}
+    for d in detalles:
+        productos_por_pedido.setdefault(d['pedido_id'], []).append({
+            'nombre': d['nombre'],
+            'cantidad': d['cantidad'],
+            'precio': float(d['precio_unitario'])
+        })
+    
     for pedido in pedidos:
-        detalles_query = """
-            SELECT 
-                pd.cantidad,
-                pd.precio_unitario,
-                pr.nombre
-            FROM pedido_detalles pd
-            JOIN productos pr ON pd.producto_id = pr.id
-            WHERE pd.pedido_id = %s
-        """
-        detalles = execute_query(detalles_query, (pedido['id'],))
-        
-        pedido['productos'] = [
-            {
-                'nombre': d['nombre'],
-                'cantidad': d['cantidad'],
-                'precio': float(d['precio_unitario'])
-            }
-            for d in detalles
-        ]
+        pedido['productos'] = productos_por_pedido.get(pedido['id'], [])
         pedido['sucursal'] = pedido.pop('sucursal_nombre')
         pedido['total'] = float(pedido['total'])
     
     return pedidos
 
 
+@router.get("/activos")
+def get_pedidos_activos(sucursal_id: Optional[int] = Query(None)):
+    """Obtener pedidos activos (ADMIN)"""
+    pedidos = _cache_activos.obtener('activos', _cargar_pedidos_activos)
+    
+    if sucursal_id is not None:
+        pedidos = [p for p in pedidos if p['sucursal_id'] == sucursal_id]
+    
+    return pedidos
+
+
+# ============= EVENTOS EN TIEMPO REAL =============
+def _filtro_eventos(pedido_id: Optional[int], usuario_id: Optional[int], sucursal_id: Optional[int]) -> dict:
+    filtro = {}
+    
+    if pedido_id is not None:
+        filtro['pedido_id'] = pedido_id
+    
+    if sucursal_id is not None:
+        filtro['sucursal_id'] = sucursal_id
+    
+    if usuario_id is not None:
+        cliente_query = "SELECT id FROM clientes WHERE usuario_id = %s"
+        cliente = execute_query(cliente_query, (usuario_id,))
+        
+        if not cliente:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        
+        filtro['cliente_id'] = cliente[0]['id']
+    
+    return filtro
+
+def _parse_ultimo_id(valor: Optional[str]) -> Optional[int]:
+    try:
+        return int(valor) if valor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Id de evento inválido")
+
+
+@router.get("/eventos")
+async def eventos_pedidos(
+    request: Request,
+    pedido_id: Optional[int] = Query(None),
+    usuario_id: Optional[int] = Query(None),
+    sucursal_id: Optional[int] = Query(None),
+    ultimo_id: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Stream SSE de cambios de estado (por pedido, cliente o sucursal)"""
+    filtro = _filtro_eventos(pedido_id, usuario_id, sucursal_id)
+    suscripcion = canal_pedidos.suscribir(filtro, _parse_ultimo_id(last_event_id or ultimo_id))
+    
+    async def generar():
+        try:
+            while not await request.is_disconnected():
+                evento = await suscripcion.siguiente(timeout=15)
+                
+                if evento is None:
+                    yield ": ping\n\n"
+                    continue
+                
+                yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            suscripcion.cerrar()
+    
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws")
+async def eventos_pedidos_ws(
+    websocket: WebSocket,
+    pedido_id: Optional[int] = None,
+    usuario_id: Optional[int] = None,
+    sucursal_id: Optional[int] = None,
+    ultimo_id: Optional[str] = None
+):
+    """WebSocket con los cambios de estado (mismos filtros que /eventos)"""
+    await websocket.accept()
+    
+    try:
+        filtro = _filtro_eventos(pedido_id, usuario_id, sucursal_id)
+        desde = _parse_ultimo_id(ultimo_id)
+    except HTTPException as e:
+        await websocket.send_json({"tipo": "error", "detalle": e.detail})
+        await websocket.close(code=1008)
+        return
+    
+    suscripcion = canal_pedidos.suscribir(filtro, desde)
+    
+    try:
+        while True:
+            evento = await suscripcion.siguiente(timeout=15)
+            await websocket.send_json(evento if evento else {"tipo": "ping"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        suscripcion.cerrar()
+
+
+@router.post("/archivar")
+def archivar_pedidos_terminados(dias: int = Query(archivo_pedidos.DIAS_RETENCION, ge=1)):
+    """Mover pedidos terminados antiguos al archivo (ADMIN)"""
+    archivados = archivo_pedidos.archivar_pedidos(dias)
+    
+    return {
+        "archivados": archivados,
+        "dias": dias
+    }
+
+@planificador.tarea('pedidos.archivar', '30 3 * * *', jitter=600, unica=True)
+def tarea_archivar_pedidos():
+    """Archivado diario de pedidos terminados"""
+    archivo_pedidos.archivar_pedidos()
+
+
+def _codificar_cursor(fecha_creacion, pedido_id: int) -> str:
+    valor = f"{fecha_creacion.isoformat()}|{pedido_id}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+def _decodificar_cursor(cursor: str):
+    try:
+        fecha, pedido_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(pedido_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 @router.get("/usuario/{usuario_id}")
-def get_pedidos_usuario(usuario_id: int):
-    """Obtener pedidos de un usuario"""
+def get_pedidos_usuario(
+    usuario_id: int,
+    limite: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
+):
+    """Obtener pedidos de un usuario (paginado por cursor)"""
     # Buscar cliente
     cliente_query = "SELECT id FROM clientes WHERE usuario_id = %s"
     cliente = execute_query(cliente_query, (usuario_id,))
     
     if not cliente:
-        return []
+        return {"items": [], "siguienteCursor": None, "limite": limite}
     
     cliente_id = cliente[0]['id']
     
-    # Obtener pedidos con cantidad de productos
-    query = """
-        SELECT 
-            p.id,
-            p.estado,
-            p.total,
-            p.fecha_creacion,
-            s.nombre as sucursal_nombre,
-            (SELECT COUNT(*) FROM pedido_detalles WHERE pedido_id = p.id) as cantidad_productos
-        FROM pedidos p
-        LEFT JOIN sucursales s ON p.sucursal_id = s.id
-        WHERE p.cliente_id = %s AND p.estado != 'carrito'
-        ORDER BY p.fecha_creacion DESC
+    # Paginación por (fecha_creacion, id): cada página es un rango del índice del cliente
+    condicion_cursor = ""
+    params_cursor = ()
+    if cursor:
+        fecha_cursor, id_cursor = _decodificar_cursor(cursor)
+        condicion_cursor = "AND (p.fecha_creacion < %s OR (p.fecha_creacion = %s AND p.id < %s))"
+        params_cursor = (fecha_cursor, fecha_cursor, id_cursor)
+    
+    # Se pide un registro extra para saber si hay otra página
+    query = f"""
+        SELECT * FROM (
+            (SELECT 
+                p.id,
+                p.estado,
+                p.total,
+                p.fecha_creacion,
+                p.cantidad_productos,
+                s.nombre as sucursal_nombre
+            FROM pedidos p
+            LEFT JOIN sucursales s ON p.sucursal_id = s.id
+            WHERE p.cliente_id = %s AND p.estado != 'carrito' {condicion_cursor}
+            ORDER BY p.fecha_creacion DESC, p.id DESC
+            LIMIT %s)
+            UNION ALL
+            (SELECT 
+                p.id,
+                p.estado,
+                p.total,
+                p.fecha_creacion,
+                p.cantidad_productos,
+                s.nombre as sucursal_nombre
+            FROM pedidos_archivo p
+            LEFT JOIN sucursales s ON p.sucursal_id = s.id
+            WHERE p.cliente_id = %s {condicion_cursor}
+            ORDER BY p.fecha_creacion DESC, p.id DESC
+            LIMIT %s)
+        ) historial
+        ORDER BY fecha_creacion DESC, id DESC
+        LIMIT %s
     """
-    pedidos = execute_query(query, (cliente_id,))
-    
-    return [
-        {
-            "id": p['id'],
-            "estado": p['estado'],
-            "total": float(p['total']),
-            "cantidad_productos": p['cantidad_productos'],
-            "sucursal_nombre": p['sucursal_nombre'],
-            "fecha_creacion": p['fecha_creacion'].isoformat() if p['fecha_creacion'] else None
-        }
-        for p in pedidos
-    ]
+    params = (cliente_id, *params_cursor, limite + 1, cliente_id, *params_cursor, limite + 1, limite + 1)
+    pedidos = execute_query(query, params)
+    
+    siguiente_cursor = None
+    if len(pedidos) > limite:
+        pedidos = pedidos[:limite]
+        ultimo = pedidos[-1]
+        siguiente_cursor = _codificar_cursor(ultimo['fecha_creacion'], ultimo['id'])
+    
+    return {
+        "items": [
+            {
+                "id": p['id'],
+                "estado": p['estado'],
+                "total": float(p['total']),
+                "cantidad_productos": p['cantidad_productos'],
+                "sucursal_nombre": p['sucursal_nombre'],
+                "fecha_creacion": p['fecha_creacion'].isoformat() if p['fecha_creacion'] else None
+            }
+            for p in pedidos
+        ],
+        "siguienteCursor": siguiente_cursor,
+        "limite": limite
+    }
 
 @router.put("/{pedido_id}")
 def actualizar_sucursal_pedido(
@@ -253,13 +502,12 @@ def actualizar_sucursal_pedido(
         print(f"Pedido encontrado - sucursal_id actual: {pedido[0].get('sucursal_id')}")
         
         # Verificar que la sucursal existe y está activa
-        sucursal_query = "SELECT id, nombre FROM sucursales WHERE id = %s AND activa = TRUE"
-        sucursal = execute_query(sucursal_query, (sucursal_id,))
+        sucursal = referencia.sucursal(sucursal_id)
         
         if not sucursal:
             raise HTTPException(status_code=404, detail="Sucursal no encontrada o inactiva")
         
-        print(f" Sucursal válida: {sucursal[0]['nombre']}")
+        print(f" Sucursal válida: {sucursal['nombre']}")
         
         # Actualizar el pedido con la sucursal
         update_query = "UPDATE pedidos SET sucursal_id = %s WHERE id = %s"
@@ -295,6 +543,49 @@ def actualizar_sucursal_pedido(
     
 
 
+def _buscar_pedido_con_productos(pedido_id: int, archivo: bool):
+    """Pedido y sus productos desde las tablas activas o las de archivo"""
+    tabla_pedidos = "pedidos_archivo" if archivo else "pedidos"
+    tabla_detalles = "pedido_detalles_archivo" if archivo else "pedido_detalles"
+    
+    pedido_query = f"""
+        SELECT 
+            p.*,
+            s.nombre as sucursal_nombre,
+            s.direccion as sucursal_direccion,
+            s.provincia as sucursal_provincia,
+            s.telefono as sucursal_telefono,
+            c.nombre as cliente_nombre,
+            c.telefono as cliente_telefono
+        FROM {tabla_pedidos} p
+        LEFT JOIN sucursales s ON p.sucursal_id = s.id
+        LEFT JOIN clientes c ON p.cliente_id = c.id
+        WHERE p.id = %s
+    """
+    
+    pedido = execute_query(pedido_query, (pedido_id,))
+    
+    if not pedido:
+        return None, []
+    
+    productos_query = f"""
+        SELECT 
+            pd.id,
+            pd.producto_id,
+            pd.cantidad,
+            pd.precio_unitario,
+            pd.subtotal,
+            pr.nombre,
+            pr.descripcion,
+            pr.imagen_principal as imagen
+        FROM {tabla_detalles} pd
+        JOIN productos pr ON pd.producto_id = pr.id
+        WHERE pd.pedido_id = %s
+    """
+    
+    return pedido[0], execute_query(productos_query, (pedido_id,))
+
+
 @router.get("/{pedido_id}/detalle")
 def get_pedido_detalle(pedido_id: int):
     """Obtener detalle del pedido"""
@@ -302,47 +593,15 @@ def get_pedido_detalle(pedido_id: int):
     print(f" Obteniendo detalle del pedido {pedido_id}")
     
     try:
-        # Obtener pedido con toda la información
-        pedido_query = """
-            SELECT 
-                p.*,
-                s.nombre as sucursal_nombre,
-                s.direccion as sucursal_direccion,
-                s.provincia as sucursal_provincia,
-                s.telefono as sucursal_telefono,
-                c.nombre as cliente_nombre,
-                c.telefono as cliente_telefono
-            FROM pedidos p
-            LEFT JOIN sucursales s ON p.sucursal_id = s.id
-            LEFT JOIN clientes c ON p.cliente_id = c.id
-            WHERE p.id = %s
-        """
+        # Buscar primero en las tablas activas y luego en el archivo
+        pedido_data, productos = _buscar_pedido_con_productos(pedido_id, archivo=False)
         
-        pedido = execute_query(pedido_query, (pedido_id,))
+        if pedido_data is None:
+            pedido_data, productos = _buscar_pedido_con_productos(pedido_id, archivo=True)
         
-        if not pedido:
+        if pedido_data is None:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
-        pedido_data = pedido[0]
-        
-        # Obtener productos del pedido
-        productos_query = """
-            SELECT 
-                pd.id,
-                pd.producto_id,
-                pd.cantidad,
-                pd.precio_unitario,
-                pd.subtotal,
-                pr.nombre,
-                pr.descripcion,
-                pr.imagen_principal as imagen
-            FROM pedido_detalles pd
-            JOIN productos pr ON pd.producto_id = pr.id
-            WHERE pd.pedido_id = %s
-        """
-        
-        productos = execute_query(productos_query, (pedido_id,))
-        
         # Construir respuesta
         sucursal_obj = None
         if pedido_data.get('sucursal_id'):
@@ -413,9 +672,17 @@ def cancelar_pedido(pedido_id: int, request: CancelarPedidoRequest):
     if pedido['estado'] in ['completado', 'cancelado']:
         raise HTTPException(status_code=400, detail="No se puede cancelar este pedido")
     
-    # Cancelar pedido
-    update_query = "UPDATE pedidos SET estado = 'cancelado' WHERE id = %s"
-    execute_query(update_query, (pedido_id,), fetch=False)
+    # Cancelar pedido, solo si nadie lo cambió desde la lectura (p. ej. completado por un admin)
+    update_query = "UPDATE pedidos SET estado = 'cancelado' WHERE id = %s AND estado = %s"
+    resultado = execute_query(update_query, (pedido_id, pedido['estado']), fetch=False)
+    
+    if resultado['affected_rows'] == 0:
+        raise HTTPException(status_code=409, detail="El pedido cambió de estado, intente de nuevo")
+    
+    notificar_cambio_estado(
+        pedido_id, cliente_id, pedido['sucursal_id'], pedido['estado'], 'cancelado',
+        total=pedido['total'], fecha_creacion=pedido['fecha_creacion']
+    )
     
     return {
         "message": "Pedido cancelado exitosamente",
@@ -433,7 +700,7 @@ def cambiar_estado_pedido(pedido_id: int, estado: str = Query(...)):
         raise HTTPException(status_code=400, detail="Estado no válido")
     
     # Obtener pedido actual
-    pedido_query = "SELECT estado FROM pedidos WHERE id = %s"
+    pedido_query = "SELECT estado, cliente_id, sucursal_id, total, fecha_creacion FROM pedidos WHERE id = %s"
     pedido = execute_query(pedido_query, (pedido_id,))
     
     if not pedido:
@@ -447,7 +714,15 @@ def cambiar_estado_pedido(pedido_id: int, estado: str = Query(...)):
             status_code=400,
             detail="No se puede cambiar el estado de este pedido"
         )
-    
+
+    # Mismo estado: no hay cambio (MySQL no contaría la fila en rowcount)
+    if estado == estado_actual:
+        return {
+            "id": pedido_id,
+            "estado": estado,
+            "mensaje": f"El pedido ya está en: {estado}"
+        }
+
     # Actualizar estado
     update_query = "UPDATE pedidos SET estado = %s"
     params = [estado]
@@ -456,10 +731,23 @@ def cambiar_estado_pedido(pedido_id: int, estado: str = Query(...)):
     if estado == 'completado':
         update_query += ", fecha_completado = NOW()"
     
-    update_query += " WHERE id = %s"
-    params.append(pedido_id)
+    # Solo si nadie lo cambió desde la lectura, para no contar dos veces un pedido completado
+    update_query += " WHERE id = %s AND estado = %s"
+    params.extend([pedido_id, estado_actual])
+    
+    with transaccion() as cursor:
+        cursor.execute(update_query, tuple(params))
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=409, detail="El pedido cambió de estado, intente de nuevo")
+        
+        if estado == 'completado':
+            ventas_rollup.acumular_pedido(cursor, pedido_id)
     
-    execute_query(update_query, tuple(params), fetch=False)
+    notificar_cambio_estado(
+        pedido_id, pedido[0]['cliente_id'], pedido[0]['sucursal_id'], estado_actual, estado,
+        total=pedido[0]['total'], fecha_creacion=pedido[0]['fecha_creacion']
+    )
     
     return {
         "id": pedido_id,
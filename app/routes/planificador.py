@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from app.config.database import execute_query
+from app.services import planificador
+
+router = APIRouter(
+    prefix="/planificador",
+    tags=["Planificador"]
+)
+
+# ============= TAREAS PERIÓDICAS =============
+@router.get("")
+def get_tareas():
+    """Listar las tareas periódicas con sus métricas en este proceso"""
+    return {
+        "instancia": planificador.INSTANCIA,
+        "tareas": planificador.tareas()
+    }
+
+@router.get("/{nombre}/historial")
+def get_historial_tarea(nombre: str, limite: int = Query(50, ge=1, le=500)):
+    """Últimas ejecuciones de una tarea en todos los workers"""
+    if planificador.obtener(nombre) is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+
+    query = """
+        SELECT instancia, inicio, duracion_ms, estado, error
+        FROM planificador_ejecuciones
+        WHERE tarea = %s
+        ORDER BY inicio DESC, id DESC
+        LIMIT %s
+    """
+    ejecuciones = execute_query(query, (nombre, limite))
+
+    return {
+        "tarea": nombre,
+        "ejecuciones": [
+            {
+                "instancia": e['instancia'],
+                "inicio": e['inicio'].isoformat() if e['inicio'] else None,
+                "duracionMs": e['duracion_ms'],
+                "estado": e['estado'],
+                "error": e['error']
+            }
+            for e in ejecuciones
+        ]
+    }
+
+@router.post("/{nombre}/ejecutar", status_code=status.HTTP_202_ACCEPTED)
+def ejecutar_tarea(nombre: str):
+    """Ejecutar una tarea ahora, fuera de su horario"""
+    if planificador.obtener(nombre) is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+
+    if not planificador.lanzar(nombre):
+        raise HTTPException(status_code=409, detail="La tarea ya está en ejecución")
+
+    return {"message": f"Tarea {nombre} iniciada"}
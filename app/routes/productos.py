@@ -1,7 +1,8 @@
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 from app.config.database import execute_query
+from app.services import metricas, tendencias, planificador
 from pydantic import BaseModel, Field
 from typing import Optional
 
@@ -32,9 +33,30 @@ def get_productos():
 
 
 # 🔥 NUEVO: Endpoint para productos en tendencia
+# Mínimo de productos con ventas en la ventana para usar la tendencia automática
+MINIMO_TENDENCIA = 3
+
 @router.get("/tendencia")
-def get_productos_tendencia():
-    """Obtener productos en tendencia"""
+def get_productos_tendencia(ventana: str = Query('dia', pattern='^(hora|dia|semana)$')):
+    """Obtener productos en tendencia (los más vendidos de la ventana)"""
+    ranking = tendencias.top(ventana, 20)
+
+    if len(ranking) >= MINIMO_TENDENCIA:
+        ids = tuple(producto_id for producto_id, _, _ in ranking)
+        placeholders = ", ".join(["%s"] * len(ids))
+        query = f"""
+            SELECT p.*, c.nombre as categoria_nombre
+            FROM productos p
+            LEFT JOIN categorias c ON p.categoria_id = c.id
+            WHERE p.id IN ({placeholders})
+            AND p.disponible = TRUE
+        """
+        productos = {p['id']: p for p in execute_query(query, ids)}
+        resultado = [productos[i] for i in ids if i in productos][:10]
+        if len(resultado) >= MINIMO_TENDENCIA:
+            return resultado
+
+    # Pocas ventas recientes: productos marcados manualmente
     query = """
         SELECT p.*, c.nombre as categoria_nombre
         FROM productos p
@@ -47,6 +69,42 @@ def get_productos_tendencia():
     return execute_query(query)
 
 
+@router.get("/tendencia/top")
+def get_top_productos_tiempo_real(
+    ventana: str = Query('hora', pattern='^(hora|dia|semana)$'),
+    limite: int = Query(10, ge=1, le=tendencias.CAPACIDAD)
+):
+    """Top de productos vendidos en tiempo real (aproximado)"""
+    ranking = tendencias.top(ventana, limite)
+
+    nombres = {}
+    if ranking:
+        ids = tuple(producto_id for producto_id, _, _ in ranking)
+        placeholders = ", ".join(["%s"] * len(ids))
+        filas = execute_query(f"SELECT id, nombre FROM productos WHERE id IN ({placeholders})", ids)
+        nombres = {f['id']: f['nombre'] for f in filas}
+
+    return {
+        "ventana": ventana,
+        "productos": [
+            {
+                "productoId": producto_id,
+                "nombre": nombres.get(producto_id),
+                "cantidad": cantidad,
+                # La cantidad real está entre cantidad - error y cantidad
+                "error": error
+            }
+            for producto_id, cantidad, error in ranking
+        ]
+    }
+
+
+@planificador.tarea('tendencias.procesar', '* * * * *', jitter=10)
+def tarea_procesar_tendencias():
+    """Procesar pedidos completados aunque nadie consulte la tendencia"""
+    tendencias.procesar_pendientes()
+
+
 # 🔥 NUEVO: Endpoint para producto destacado
 @router.get("/destacado")
 def get_producto_destacado():
@@ -185,6 +243,7 @@ def crear_producto(producto: CrearProductoDto):
         )
         
         producto_id = result['last_id']
+        metricas.cambio_producto(delta_total=1, delta_disponibles=int(producto.disponible))
         
         print(f" Producto creado con ID: {producto_id}")
         
@@ -211,7 +270,7 @@ def actualizar_producto(producto_id: int, producto: CrearProductoDto):
     
     try:
         # Verificar que el producto existe
-        check_query = "SELECT id FROM productos WHERE id = %s"
+        check_query = "SELECT id, disponible FROM productos WHERE id = %s"
         existe = execute_query(check_query, (producto_id,))
         
         if not existe:
@@ -245,6 +304,8 @@ def actualizar_producto(producto_id: int, producto: CrearProductoDto):
             fetch=False
         )
         
+        metricas.cambio_producto(delta_disponibles=int(producto.disponible) - int(bool(existe[0]['disponible'])))
+        
         print(f"Producto actualizado")
         
         return {
@@ -272,6 +333,8 @@ def eliminar_producto(producto_id: int):
         if result.get('affected_rows', 0) == 0:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
         
+        metricas.cambio_producto(delta_disponibles=-1)
+        
         print(f" Producto eliminado")
         
         return {"message": "Producto eliminado exitosamente"}
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException, status, Query
 from app.models.profile import UpdateProfileDto, UpdateFotoPerfilDto, CreateDireccionDto, CreateMetodoPagoDto, AddCondicionesSaludDto
 from app.config.database import execute_query
+from app.services import referencia
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
@@ -10,8 +11,7 @@ router = APIRouter(prefix="/profile", tags=["Profile"])
 @router.get("/condiciones-salud")
 def get_condiciones_salud():
     """Obtener todas las condiciones de salud disponibles"""
-    query = "SELECT * FROM condiciones_salud ORDER BY nombre ASC"
-    return execute_query(query)
+    return [dict(c) for c in referencia.condiciones_salud()]
 
 @router.get("/{usuario_id}")
 def get_profile(usuario_id: int):
@@ -289,10 +289,7 @@ def add_condiciones_salud(usuario_id: int, data: AddCondicionesSaludDto):
     if data.condicion_ids:
         for condicion_id in data.condicion_ids:
             # Verificar que la condición existe
-            verify_query = "SELECT id FROM condiciones_salud WHERE id = %s"
-            condicion_existe = execute_query(verify_query, (condicion_id,))
-            
-            if not condicion_existe:
+            if not referencia.condicion_salud(condicion_id):
                 raise HTTPException(
                     status_code=400, 
                     detail=f"Condición con id {condicion_id} no existe"
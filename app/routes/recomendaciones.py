@@ -393,14 +393,17 @@ async def obtener_recomendaciones_pedido(pedido_id: int):
     """Obtener recomendaciones basadas en un pedido específico"""
     
     try:
-        # Obtener productos del pedido CON CATEGORÍA
+        # Obtener productos del pedido CON CATEGORÍA (activo o archivado)
         productos_query = """
             SELECT p.nombre, p.categoria, pd.cantidad
-            FROM pedido_detalles pd
+            FROM (
+                SELECT producto_id, cantidad FROM pedido_detalles WHERE pedido_id = %s
+                UNION ALL
+                SELECT producto_id, cantidad FROM pedido_detalles_archivo WHERE pedido_id = %s
+            ) pd
             JOIN productos p ON pd.producto_id = p.id
-            WHERE pd.pedido_id = %s
         """
-        productos = execute_query(productos_query, (pedido_id,))
+        productos = execute_query(productos_query, (pedido_id, pedido_id))
         
         if not productos:
             return {
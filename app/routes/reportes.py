@@ -1,15 +1,22 @@
 
 from fastapi import APIRouter, HTTPException, Query
-from app.config.database import execute_query
+from app.config.database import execute_query, consulta_lectura
 from app.models.reportes import (ReporteVentasRequest)
+from app.services import metricas, analitica, exportacion, planificador, clientes_unicos, paralelo, referencia
+from app.services.cache import CacheTTL
 from datetime import datetime, timedelta, date
 from typing import Optional
+import numpy as np
 
 router = APIRouter(
     prefix="/reportes",
     tags=["Reportes"]
 )
 
+# Reportes precalculados por el planificador; si se piden antes, se calculan al vuelo
+_cache_ventas = CacheTTL(ttl=5 * 60)
+_cache_clientes = CacheTTL(ttl=30 * 60)
+
 # ============= REPORTE DE VENTAS =============
 @router.get("/ventas")
 def get_reporte_ventas(
@@ -29,22 +36,26 @@ def get_reporte_ventas(
     else:
         fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
     
+    # Solo el rango por defecto se precalcula y se guarda en caché
+    if fecha_inicio or fecha_fin:
+        return _calcular_reporte_ventas(inicio, fin)
+    return _cache_ventas.obtener((inicio, fin), lambda: _calcular_reporte_ventas(inicio, fin))
+
+def _calcular_reporte_ventas(inicio: date, fin: date) -> dict:
     print(f"Generando reporte de ventas: {inicio} a {fin}")
     
-    # Pedidos completados en el rango
-    query = """
+    # Resumen desde el rollup diario
+    resumen_query = """
         SELECT 
-            p.id,
-            p.total,
-            p.fecha_completado
-        FROM pedidos p
-        WHERE p.estado = 'completado'
-        AND DATE(p.fecha_completado) BETWEEN %s AND %s
+            COALESCE(SUM(total_ventas), 0) as total_ventas,
+            COALESCE(SUM(total_pedidos), 0) as total_pedidos
+        FROM ventas_diarias
+        WHERE fecha BETWEEN %s AND %s
     """
-    pedidos = execute_query(query, (inicio, fin))
+    resumen = execute_query(resumen_query, (inicio, fin))[0]
     
-    total_ventas = sum(float(p['total']) for p in pedidos)
-    total_pedidos = len(pedidos)
+    total_ventas = float(resumen['total_ventas'])
+    total_pedidos = int(resumen['total_pedidos'])
     ticket_promedio = total_ventas / total_pedidos if total_pedidos > 0 else 0
     
     # Productos más vendidos
@@ -52,13 +63,11 @@ def get_reporte_ventas(
         SELECT 
             pr.id,
             pr.nombre,
-            SUM(pd.cantidad) as cantidad,
-            SUM(pd.subtotal) as total
-        FROM pedidos p
-        JOIN pedido_detalles pd ON p.id = pd.pedido_id
-        JOIN productos pr ON pd.producto_id = pr.id
-        WHERE p.estado = 'completado'
-        AND DATE(p.fecha_completado) BETWEEN %s AND %s
+            SUM(v.cantidad) as cantidad,
+            SUM(v.total) as total
+        FROM ventas_producto_diarias v
+        JOIN productos pr ON v.producto_id = pr.id
+        WHERE v.fecha BETWEEN %s AND %s
         GROUP BY pr.id, pr.nombre
         ORDER BY cantidad DESC
         LIMIT 5
@@ -68,12 +77,11 @@ def get_reporte_ventas(
     # Ventas por día
     ventas_dia_query = """
         SELECT 
-            DATE(fecha_completado) as fecha,
-            SUM(total) as total
-        FROM pedidos
-        WHERE estado = 'completado'
-        AND DATE(fecha_completado) BETWEEN %s AND %s
-        GROUP BY DATE(fecha_completado)
+            fecha,
+            SUM(total_ventas) as total
+        FROM ventas_diarias
+        WHERE fecha BETWEEN %s AND %s
+        GROUP BY fecha
         ORDER BY fecha ASC
     """
     ventas_por_dia = execute_query(ventas_dia_query, (inicio, fin))
@@ -112,54 +120,18 @@ def get_reporte_ventas(
 def get_metricas_generales():
     """Obtener métricas generales del sistema"""
     
-    hoy = date.today()
-    
-    print(f"Obteniendo métricas generales para {hoy}")
-    
-    # Pedidos de hoy
-    pedidos_hoy_query = """
-        SELECT COUNT(*) as total
-        FROM pedidos
-        WHERE DATE(fecha_creacion) = %s AND estado = 'completado'
-    """
-    pedidos_hoy = execute_query(pedidos_hoy_query, (hoy,))
-    
-    # Ventas de hoy
-    ventas_hoy_query = """
-        SELECT COALESCE(SUM(total), 0) as total
-        FROM pedidos
-        WHERE DATE(fecha_creacion) = %s AND estado = 'completado'
-    """
-    ventas_hoy = execute_query(ventas_hoy_query, (hoy,))
-    
-    # Pedidos activos
-    pedidos_activos_query = """
-        SELECT COUNT(*) as total
-        FROM pedidos
-        WHERE estado IN ('confirmado', 'en_preparacion', 'listo', 'pendiente')
-    """
-    pedidos_activos = execute_query(pedidos_activos_query)
-    
-    # Productos
-    productos_query = """
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN disponible = TRUE THEN 1 ELSE 0 END) as disponibles
-        FROM productos
-    """
-    productos = execute_query(productos_query)
-    
-    print(f"Métricas obtenidas")
+    # Contadores en memoria, mantenidos por eventos y reconciliados periódicamente
+    contadores = metricas.obtener()
     
     return {
         "hoy": {
-            "pedidos": pedidos_hoy[0]['total'],
-            "ventas": round(float(ventas_hoy[0]['total']), 2)
+            "pedidos": contadores['pedidos_hoy'],
+            "ventas": round(contadores['ventas_hoy'], 2)
         },
-        "pedidosActivos": pedidos_activos[0]['total'],
+        "pedidosActivos": contadores['pedidos_activos'],
         "productos": {
-            "total": productos[0]['total'],
-            "disponibles": productos[0]['disponibles']
+            "total": contadores['productos_total'],
+            "disponibles": contadores['productos_disponibles']
         }
     }
 
@@ -221,14 +193,16 @@ def get_reporte_productos():
 @router.get("/clientes")
 def get_reporte_clientes():
     """Obtener reporte de clientes"""
-    
+    return _cache_clientes.obtener('reporte', _calcular_reporte_clientes)
+
+def _calcular_reporte_clientes() -> dict:
     print(f" Generando reporte de clientes")
     
     # Total de clientes
     total_query = "SELECT COUNT(*) as total FROM clientes"
     total = execute_query(total_query)
     
-    # Clientes con más pedidos
+    # Clientes con más pedidos (incluye pedidos archivados)
     top_clientes_query = """
         SELECT 
             c.id,
@@ -237,7 +211,11 @@ def get_reporte_clientes():
             COUNT(p.id) as total_pedidos,
             COALESCE(SUM(p.total), 0) as total_gastado
         FROM clientes c
-        LEFT JOIN pedidos p ON c.id = p.cliente_id AND p.estado = 'completado'
+        JOIN (
+            SELECT id, cliente_id, total FROM pedidos WHERE estado = 'completado'
+            UNION ALL
+            SELECT id, cliente_id, total FROM pedidos_archivo WHERE estado = 'completado'
+        ) p ON c.id = p.cliente_id
         GROUP BY c.id, c.nombre, c.email
         HAVING total_pedidos > 0
         ORDER BY total_gastado DESC
@@ -267,4 +245,410 @@ def get_reporte_clientes():
             }
             for c in top_clientes
         ]
-    }
\ No newline at end of file
+    }
+
+# ============= REPORTE POR SUCURSAL =============
+def _resumen_sucursal(sucursal: dict, inicio: date, fin: date) -> dict:
+    """Agregados de una sucursal; se ejecuta en un hilo del pool de reportes"""
+    sucursal_id = sucursal['id']
+
+    ventas = consulta_lectura("""
+        SELECT fecha, total_pedidos, total_ventas
+        FROM ventas_diarias
+        WHERE sucursal_id = %s AND fecha BETWEEN %s AND %s
+        ORDER BY fecha ASC
+    """, (sucursal_id, inicio, fin))
+
+    top_productos = consulta_lectura("""
+        SELECT pr.id, pr.nombre, SUM(v.cantidad) as cantidad, SUM(v.total) as total
+        FROM ventas_producto_diarias v
+        JOIN productos pr ON v.producto_id = pr.id
+        WHERE v.sucursal_id = %s AND v.fecha BETWEEN %s AND %s
+        GROUP BY pr.id, pr.nombre
+        ORDER BY cantidad DESC
+        LIMIT 5
+    """, (sucursal_id, inicio, fin))
+
+    placeholders = ", ".join(["%s"] * len(metricas.ESTADOS_ACTIVOS))
+    activos = consulta_lectura(f"""
+        SELECT COUNT(*) as total FROM pedidos
+        WHERE sucursal_id = %s AND estado IN ({placeholders})
+    """, (sucursal_id, *metricas.ESTADOS_ACTIVOS))[0]['total']
+
+    total_ventas = sum(float(v['total_ventas']) for v in ventas)
+    total_pedidos = sum(int(v['total_pedidos']) for v in ventas)
+
+    return {
+        "sucursalId": sucursal_id,
+        "nombre": sucursal['nombre'],
+        "totalVentas": round(total_ventas, 2),
+        "totalPedidos": total_pedidos,
+        "ticketPromedio": round(total_ventas / total_pedidos, 2) if total_pedidos else 0,
+        "pedidosActivos": int(activos),
+        "ventasPorDia": {v['fecha'].isoformat(): float(v['total_ventas']) for v in ventas},
+        "topProductos": [
+            {
+                "nombre": p['nombre'],
+                "cantidad": int(p['cantidad']),
+                "total": round(float(p['total']), 2)
+            }
+            for p in top_productos
+        ]
+    }
+
+@router.get("/por-sucursal")
+def get_reporte_por_sucursal(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None)
+):
+    """Tablero por sucursal; cada sucursal se consulta en paralelo"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+
+    sucursales = [{'id': s['id'], 'nombre': s['nombre']} for s in referencia.sucursales()]
+    resumenes = paralelo.repartir(lambda s: _resumen_sucursal(s, inicio, fin), sucursales)
+
+    # Fusión de los agregados parciales
+    total_ventas = sum(r['totalVentas'] for r in resumenes)
+    total_pedidos = sum(r['totalPedidos'] for r in resumenes)
+    ventas_por_dia = {}
+    for r in resumenes:
+        for fecha, total in r['ventasPorDia'].items():
+            ventas_por_dia[fecha] = ventas_por_dia.get(fecha, 0) + total
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "resumen": {
+            "totalVentas": round(total_ventas, 2),
+            "totalPedidos": total_pedidos,
+            "ticketPromedio": round(total_ventas / total_pedidos, 2) if total_pedidos else 0,
+            "pedidosActivos": sum(r['pedidosActivos'] for r in resumenes)
+        },
+        "ventasPorDia": [
+            {"fecha": fecha, "total": round(total, 2)}
+            for fecha, total in sorted(ventas_por_dia.items())
+        ],
+        "sucursales": [
+            {
+                **r,
+                "ventasPorDia": [
+                    {"fecha": fecha, "total": round(total, 2)}
+                    for fecha, total in r['ventasPorDia'].items()
+                ]
+            }
+            for r in resumenes
+        ]
+    }
+
+# ============= CLIENTES DISTINTOS =============
+@router.get("/clientes-unicos")
+def get_clientes_unicos(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None),
+    agrupar: str = Query('dia', pattern='^(dia|semana|total)$')
+):
+    """Clientes distintos aproximados por sucursal y periodo (HyperLogLog)"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    sketches = clientes_unicos.cargar(inicio, fin, sucursal_id)
+
+    def periodo(fecha: date) -> date:
+        if agrupar == 'semana':
+            return fecha - timedelta(days=fecha.weekday())
+        if agrupar == 'total':
+            return inicio
+        return fecha
+
+    # Fusión por sucursal y periodo, por sucursal, y general
+    general = clientes_unicos.HyperLogLog()
+    por_sucursal = {}
+    por_periodo = {}
+    for (fecha, sucursal), sketch in sketches.items():
+        general.fusionar(sketch)
+        por_sucursal.setdefault(sucursal, clientes_unicos.HyperLogLog()).fusionar(sketch)
+        por_periodo.setdefault((sucursal, periodo(fecha)), clientes_unicos.HyperLogLog()).fusionar(sketch)
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "agrupar": agrupar,
+        "errorRelativo": round(1.04 / clientes_unicos.REGISTROS ** 0.5, 4),
+        "total": general.estimar(),
+        "porSucursal": [
+            {
+                "sucursalId": sucursal or None,
+                "total": por_sucursal[sucursal].estimar(),
+                "periodos": [
+                    {"inicio": p.isoformat(), "clientes": sketch.estimar()}
+                    for (s_id, p), sketch in sorted(por_periodo.items())
+                    if s_id == sucursal
+                ]
+            }
+            for sucursal in sorted(por_sucursal)
+        ]
+    }
+
+# ============= TAREAS PROGRAMADAS =============
+@planificador.tarea('reportes.ventas', '*/5 * * * *', jitter=30)
+def tarea_reporte_ventas():
+    """Precalcular el reporte de ventas del rango por defecto (últimos 30 días)"""
+    fin = date.today()
+    inicio = fin - timedelta(days=30)
+    _cache_ventas.guardar((inicio, fin), _calcular_reporte_ventas(inicio, fin))
+
+@planificador.tarea('reportes.clientes', '*/15 * * * *', jitter=60)
+def tarea_reporte_clientes():
+    _cache_clientes.guardar('reporte', _calcular_reporte_clientes())
+
+@planificador.tarea('clientes_unicos.guardar', '* * * * *', jitter=15)
+def tarea_guardar_clientes_unicos():
+    clientes_unicos.guardar()
+
+@planificador.tarea('metricas.reconciliar', '* * * * *', jitter=10)
+def tarea_reconciliar_metricas():
+    metricas.reconciliar()
+
+@planificador.tarea('analitica.refrescar', '* * * * *', jitter=10)
+def tarea_refrescar_analitica():
+    analitica.refrescar()
+
+# ============= ANALÍTICA =============
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+
+def _rango_fechas(fecha_inicio: Optional[str], fecha_fin: Optional[str], inicio_defecto: Optional[date] = None):
+    """Valida un rango de fechas (por defecto los últimos 30 días)"""
+    if inicio_defecto is None:
+        inicio_defecto = date.today() - timedelta(days=30)
+    try:
+        inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date() if fecha_inicio else inicio_defecto
+        fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date() if fecha_fin else date.today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+
+    if inicio > fin:
+        raise HTTPException(status_code=400, detail="fecha_inicio no puede ser posterior a fecha_fin")
+
+    return inicio, fin
+
+
+@router.get("/analitica/horas")
+def get_analitica_horas(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None)
+):
+    """Mapa de calor de pedidos y ventas por día de semana y hora"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    cols = analitica.snapshot()
+    mascara = analitica.filtrar(cols, inicio, fin, sucursal_id)
+    pedidos, ventas = analitica.mapa_horas(cols, mascara)
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "dias": DIAS_SEMANA,
+        "pedidos": pedidos.tolist(),
+        "ventas": np.round(ventas, 2).tolist(),
+        "totalPedidos": int(pedidos.sum())
+    }
+
+
+@router.get("/analitica/tickets")
+def get_analitica_tickets(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None),
+    intervalos: int = Query(10, ge=1, le=50)
+):
+    """Distribución del monto de los pedidos por sucursal"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    cols = analitica.snapshot()
+    mascara = analitica.filtrar(cols, inicio, fin, sucursal_id)
+    totales = cols.total[mascara]
+    sucursales = cols.sucursal_id[mascara]
+
+    # Mismos límites de histograma para todas las sucursales, para poder compararlas
+    limites = np.histogram_bin_edges(totales, bins=intervalos) if len(totales) else np.zeros(0)
+
+    por_sucursal = []
+    for sucursal in np.unique(sucursales):
+        montos = totales[sucursales == sucursal]
+        conteos, _ = np.histogram(montos, bins=limites)
+        por_sucursal.append({
+            "sucursalId": int(sucursal) or None,
+            "pedidos": int(len(montos)),
+            "promedio": round(float(montos.mean()), 2),
+            "percentiles": analitica.cuantiles(montos, [0.25, 0.5, 0.75, 0.9, 0.99]),
+            "histograma": conteos.tolist()
+        })
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "limites": np.round(limites, 2).tolist(),
+        "general": {
+            "pedidos": int(len(totales)),
+            "promedio": round(float(totales.mean()), 2) if len(totales) else 0,
+            "percentiles": analitica.cuantiles(totales, [0.25, 0.5, 0.75, 0.9, 0.99])
+        },
+        "porSucursal": por_sucursal
+    }
+
+
+@router.get("/analitica/variacion-diaria")
+def get_analitica_variacion_diaria(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None)
+):
+    """Ventas por día con la variación respecto al día anterior"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    cols = analitica.snapshot()
+    # Se incluye el día previo al rango para calcular la primera variación
+    mascara = analitica.filtrar(cols, inicio - timedelta(days=1), fin, sucursal_id)
+
+    dias = np.arange(np.datetime64(inicio - timedelta(days=1), 'D'), np.datetime64(fin, 'D') + 1)
+    indice = (cols.dia[mascara] - dias[0]).astype(np.int64)
+    pedidos = np.bincount(indice, minlength=len(dias))
+    ventas = np.bincount(indice, weights=cols.total[mascara], minlength=len(dias))
+
+    variacion = np.diff(ventas)
+    anteriores = ventas[:-1]
+    porcentaje = np.divide(variacion, anteriores, out=np.full(len(variacion), np.nan), where=anteriores > 0) * 100
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "dias": [
+            {
+                "fecha": str(dias[i + 1]),
+                "pedidos": int(pedidos[i + 1]),
+                "ventas": round(float(ventas[i + 1]), 2),
+                "variacion": round(float(variacion[i]), 2),
+                "variacionPorcentaje": None if np.isnan(porcentaje[i]) else round(float(porcentaje[i]), 2)
+            }
+            for i in range(len(variacion))
+        ]
+    }
+
+
+@router.get("/analitica/productos")
+def get_analitica_productos(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None),
+    limite: int = Query(10, ge=1, le=100)
+):
+    """Productos más vendidos en el rango, con su participación en las ventas"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    cols = analitica.snapshot()
+    mascara = analitica.mascara_lineas(cols, analitica.filtrar(cols, inicio, fin, sucursal_id))
+
+    productos, _, cantidades = analitica.agrupar(cols.linea_producto_id[mascara], cols.linea_cantidad[mascara])
+    _, _, totales = analitica.agrupar(cols.linea_producto_id[mascara], cols.linea_subtotal[mascara])
+    total_general = float(totales.sum()) if len(totales) else 0
+
+    orden = np.argsort(-cantidades, kind='stable')[:limite]
+    ids = [int(productos[i]) for i in orden]
+
+    nombres = {}
+    if ids:
+        placeholders = ", ".join(["%s"] * len(ids))
+        filas = execute_query(f"SELECT id, nombre FROM productos WHERE id IN ({placeholders})", tuple(ids))
+        nombres = {f['id']: f['nombre'] for f in filas}
+
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fin": fin.isoformat()},
+        "productos": [
+            {
+                "id": int(productos[i]),
+                "nombre": nombres.get(int(productos[i])),
+                "cantidad": int(cantidades[i]),
+                "total": round(float(totales[i]), 2),
+                "participacion": round(float(totales[i]) / total_general * 100, 2) if total_general else 0
+            }
+            for i in orden
+        ]
+    }
+
+# ============= EXPORTACIÓN =============
+COLUMNAS_EXPORTAR_VENTAS = [
+    'id', 'sucursal_id', 'cliente_id', 'fecha_creacion', 'fecha_completado',
+    'tipo_entrega', 'cantidad_productos', 'total'
+]
+
+COLUMNAS_EXPORTAR_CLIENTES = [
+    'id', 'nombre', 'apellido', 'email', 'telefono', 'fecha_registro',
+    'puntos_lealtad', 'total_pedidos', 'total_gastado'
+]
+
+
+@router.get("/exportar/ventas")
+def exportar_ventas(
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    sucursal_id: Optional[int] = Query(None),
+    formato: str = Query('csv', pattern='^(csv|ndjson)$'),
+    gzip: bool = Query(False)
+):
+    """Exportar los pedidos completados del rango (ambos niveles) en streaming"""
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+
+    filtro_sucursal = "AND sucursal_id = %(sucursal_id)s" if sucursal_id else ""
+    query = f"""
+        SELECT id, sucursal_id, cliente_id, fecha_creacion, fecha_completado,
+               tipo_entrega, cantidad_productos, total
+        FROM pedidos
+        WHERE estado = 'completado'
+        AND fecha_completado >= %(desde)s AND fecha_completado < %(hasta)s
+        {filtro_sucursal}
+        UNION ALL
+        SELECT id, sucursal_id, cliente_id, fecha_creacion, fecha_completado,
+               tipo_entrega, cantidad_productos, total
+        FROM pedidos_archivo
+        WHERE estado = 'completado'
+        AND fecha_completado >= %(desde)s AND fecha_completado < %(hasta)s
+        {filtro_sucursal}
+        ORDER BY fecha_completado ASC, id ASC
+    """
+
+    print(f"Exportando ventas: {inicio} a {fin} ({formato})")
+
+    filas = exportacion.filas_por_rangos(query, inicio, fin, {'sucursal_id': sucursal_id})
+    return exportacion.respuesta(
+        filas, COLUMNAS_EXPORTAR_VENTAS, formato, f"ventas_{inicio}_{fin}", comprimir=gzip
+    )
+
+
+@router.get("/exportar/clientes")
+def exportar_clientes(
+    fecha_inicio: Optional[str] = Query(None, description="Fecha de registro desde"),
+    fecha_fin: Optional[str] = Query(None, description="Fecha de registro hasta"),
+    formato: str = Query('csv', pattern='^(csv|ndjson)$'),
+    gzip: bool = Query(False)
+):
+    """Exportar clientes con sus totales de pedidos completados en streaming"""
+    primero = execute_query("SELECT MIN(fecha_registro) as primero FROM clientes")[0]['primero']
+    inicio_defecto = primero.date() if isinstance(primero, datetime) else (primero or date.today())
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin, inicio_defecto)
+
+    # Subconsultas correlacionadas: usan el índice por cliente en cada nivel
+    query = """
+        SELECT
+            c.id, c.nombre, c.apellido, c.email, c.telefono, c.fecha_registro, c.puntos_lealtad,
+            (SELECT COUNT(*) FROM pedidos p
+             WHERE p.cliente_id = c.id AND p.estado = 'completado')
+            + (SELECT COUNT(*) FROM pedidos_archivo pa
+               WHERE pa.cliente_id = c.id AND pa.estado = 'completado') as total_pedidos,
+            (SELECT COALESCE(SUM(p.total), 0) FROM pedidos p
+             WHERE p.cliente_id = c.id AND p.estado = 'completado')
+            + (SELECT COALESCE(SUM(pa.total), 0) FROM pedidos_archivo pa
+               WHERE pa.cliente_id = c.id AND pa.estado = 'completado') as total_gastado
+        FROM clientes c
+        WHERE c.fecha_registro >= %(desde)s AND c.fecha_registro < %(hasta)s
+        ORDER BY c.fecha_registro ASC, c.id ASC
+    """
+
+    print(f"Exportando clientes: {inicio} a {fin} ({formato})")
+
+    # Bloques más grandes: los registros de clientes son mucho menos densos que los pedidos
+    filas = exportacion.filas_por_rangos(query, inicio, fin, dias=30)
+    return exportacion.respuesta(
+        filas, COLUMNAS_EXPORTAR_CLIENTES, formato, f"clientes_{inicio}_{fin}", comprimir=gzip
+    )
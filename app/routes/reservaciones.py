@@ -3,7 +3,9 @@ from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, date, time, timedelta
-from app.config.database import execute_query
+from app.config.database import execute_query, transaccion
+from app.services.cache import CacheTTL
+from app.services import capacidad_reservaciones, referencia
 
 router = APIRouter(
     prefix="/reservaciones",
@@ -24,6 +26,61 @@ class ModificarReservacionRequest(BaseModel):
     numero_personas: Optional[int] = None
     notas_especiales: Optional[str] = None
 
+DIAS_SEMANA = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+# Disponibilidad por (sucursal_id, fecha); se invalida al crear, modificar o cancelar
+_cache_disponibilidad = CacheTTL(ttl=30, maximo=1000)
+
+def _hora_a_str(valor) -> str:
+    """TIME de MySQL (timedelta), time o string a 'HH:MM'"""
+    if isinstance(valor, timedelta):
+        total_seconds = int(valor.total_seconds())
+        return f"{total_seconds // 3600:02d}:{(total_seconds % 3600) // 60:02d}"
+    if isinstance(valor, time):
+        return valor.strftime('%H:%M')
+    return str(valor)
+
+def _horarios_del_dia(sucursal_id: int, fecha_obj: date) -> list:
+    """Horarios activos del día con las personas ya reservadas, en una sola consulta"""
+    horarios = referencia.horarios(sucursal_id, DIAS_SEMANA[fecha_obj.weekday()])
+    if not horarios:
+        return []
+
+    ocupacion = {
+        _hora_a_str(r['hora_reservacion']): int(r['personas_reservadas'])
+        for r in execute_query("""
+            SELECT hora_reservacion, SUM(numero_personas) as personas_reservadas
+            FROM reservaciones
+            WHERE sucursal_id = %s AND fecha_reservacion = %s
+            AND estado IN ('pendiente', 'confirmada')
+            GROUP BY hora_reservacion
+        """, (sucursal_id, fecha_obj))
+    }
+
+    resultado = []
+    for h in horarios:
+        hora = _hora_a_str(h['hora_inicio'])
+        resultado.append({
+            "id": h['id'],
+            "hora": hora,
+            "capacidad_maxima": h['capacidad_maxima'],
+            "capacidad_disponible": h['capacidad_maxima'] - ocupacion.get(hora, 0)
+        })
+    return resultado
+
+def _capacidad_horario(sucursal_id: int, fecha_obj: date, hora) -> Optional[int]:
+    """Capacidad máxima del horario que empieza a `hora`; None si no existe"""
+    hora = _hora_a_str(hora)
+    for h in referencia.horarios(sucursal_id, DIAS_SEMANA[fecha_obj.weekday()]):
+        if _hora_a_str(h['hora_inicio']) == hora:
+            return h['capacidad_maxima']
+    return None
+
+def _invalidar_disponibilidad(sucursal_id: int, fecha):
+    if isinstance(fecha, str):
+        fecha = datetime.strptime(fecha, '%Y-%m-%d').date()
+    _cache_disponibilidad.invalidar((sucursal_id, fecha))
+
 @router.get("/disponibilidad")
 async def verificar_disponibilidad(
     sucursal_id: int,
@@ -43,18 +100,11 @@ async def verificar_disponibilidad(
         if fecha_obj < date.today():
             raise HTTPException(status_code=400, detail="No se pueden hacer reservaciones en fechas pasadas")
         
-        # Obtener día de la semana
-        dias_semana = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
-        dia_semana = dias_semana[fecha_obj.weekday()]
-        
-        # Obtener horarios configurados
-        horarios_query = """
-            SELECT id, hora_inicio, hora_fin, capacidad_maxima
-            FROM horarios_disponibles
-            WHERE sucursal_id = %s AND dia_semana = %s AND activo = TRUE
-            ORDER BY hora_inicio
-        """
-        horarios = execute_query(horarios_query, (sucursal_id, dia_semana))
+        dia_semana = DIAS_SEMANA[fecha_obj.weekday()]
+        horarios = _cache_disponibilidad.obtener(
+            (sucursal_id, fecha_obj),
+            lambda: _horarios_del_dia(sucursal_id, fecha_obj)
+        )
         
         if not horarios:
             return {
@@ -64,47 +114,15 @@ async def verificar_disponibilidad(
                 "mensaje": "No hay horarios disponibles para este día"
             }
         
-        # Para cada horario, verificar reservaciones
-        horarios_disponibles = []
-        for horario in horarios:
-            # Convertir hora_inicio (puede ser timedelta o time) a string
-            hora_inicio = horario['hora_inicio']
-            
-            
-            if isinstance(hora_inicio, timedelta):
-                total_seconds = int(hora_inicio.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                hora_str = f"{hours:02d}:{minutes:02d}"
-            elif isinstance(hora_inicio, time):
-                hora_str = hora_inicio.strftime('%H:%M')
-            else:
-                # Si es string, usar directamente
-                hora_str = str(hora_inicio)
-            
-            # Contar reservaciones existentes
-            reservaciones_query = """
-                SELECT COUNT(*) as total, COALESCE(SUM(numero_personas), 0) as personas_reservadas
-                FROM reservaciones
-                WHERE sucursal_id = %s 
-                AND fecha_reservacion = %s
-                AND hora_reservacion = %s
-                AND estado IN ('pendiente', 'confirmada')
-            """
-            reservaciones = execute_query(
-                reservaciones_query, 
-                (sucursal_id, fecha, hora_str)
-            )
-            
-            personas_reservadas = int(reservaciones[0]['personas_reservadas'])
-            capacidad_disponible = horario['capacidad_maxima'] - personas_reservadas
-            
-            horarios_disponibles.append({
-                "hora": hora_str,
-                "capacidad_maxima": horario['capacidad_maxima'],
-                "capacidad_disponible": capacidad_disponible,
-                "disponible": capacidad_disponible > 0
-            })
+        horarios_disponibles = [
+            {
+                "hora": h['hora'],
+                "capacidad_maxima": h['capacidad_maxima'],
+                "capacidad_disponible": h['capacidad_disponible'],
+                "disponible": h['capacidad_disponible'] > 0
+            }
+            for h in horarios
+        ]
         
         return {
             "fecha": fecha,
@@ -120,6 +138,96 @@ async def verificar_disponibilidad(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+MAX_DIAS_CALENDARIO = 62
+
+@router.get("/calendario")
+async def obtener_calendario(
+    sucursal_id: int,
+    desde: str,
+    hasta: str,
+):
+    """Capacidad libre por día y horario para un rango de fechas"""
+    
+    try:
+        try:
+            desde_obj = datetime.strptime(desde, '%Y-%m-%d').date()
+            hasta_obj = datetime.strptime(hasta, '%Y-%m-%d').date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+        
+        # Los días pasados no se pueden reservar
+        desde_obj = max(desde_obj, date.today())
+        if hasta_obj < desde_obj:
+            raise HTTPException(status_code=400, detail="El rango de fechas no contiene días disponibles")
+        if (hasta_obj - desde_obj).days + 1 > MAX_DIAS_CALENDARIO:
+            raise HTTPException(status_code=400, detail=f"El rango máximo es de {MAX_DIAS_CALENDARIO} días")
+        
+        # Plantilla semanal de horarios
+        plantilla = {
+            dia: [(h['id'], _hora_a_str(h['hora_inicio']), h['capacidad_maxima']) for h in horarios]
+            for dia, horarios in referencia.horarios_sucursal(sucursal_id).items()
+        }
+        
+        # Ocupación de todo el rango en una sola consulta
+        ocupacion = {
+            (r['fecha_reservacion'], _hora_a_str(r['hora_reservacion'])): int(r['personas_reservadas'])
+            for r in execute_query("""
+                SELECT fecha_reservacion, hora_reservacion,
+                       SUM(numero_personas) as personas_reservadas
+                FROM reservaciones
+                WHERE sucursal_id = %s
+                AND fecha_reservacion BETWEEN %s AND %s
+                AND estado IN ('pendiente', 'confirmada')
+                GROUP BY fecha_reservacion, hora_reservacion
+            """, (sucursal_id, desde_obj, hasta_obj))
+        }
+        
+        dias = []
+        fecha_obj = desde_obj
+        while fecha_obj <= hasta_obj:
+            dia_semana = DIAS_SEMANA[fecha_obj.weekday()]
+            horarios = [
+                {
+                    "id": horario_id,
+                    "hora": hora,
+                    "capacidad_maxima": capacidad,
+                    "capacidad_disponible": capacidad - ocupacion.get((fecha_obj, hora), 0)
+                }
+                for horario_id, hora, capacidad in plantilla.get(dia_semana, [])
+            ]
+            # Las consultas de un solo día reutilizan lo calculado aquí
+            _cache_disponibilidad.guardar((sucursal_id, fecha_obj), horarios)
+            
+            dias.append({
+                "fecha": fecha_obj.isoformat(),
+                "dia_semana": dia_semana,
+                "horarios_disponibles": [
+                    {
+                        "hora": h['hora'],
+                        "capacidad_maxima": h['capacidad_maxima'],
+                        "capacidad_disponible": h['capacidad_disponible'],
+                        "disponible": h['capacidad_disponible'] > 0
+                    }
+                    for h in horarios
+                ]
+            })
+            fecha_obj += timedelta(days=1)
+        
+        return {
+            "sucursal_id": sucursal_id,
+            "desde": desde_obj.isoformat(),
+            "hasta": hasta_obj.isoformat(),
+            "dias": dias
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error obteniendo calendario: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/crear")
 async def crear_reservacion(
     request: CrearReservacionRequest,
@@ -147,61 +255,21 @@ async def crear_reservacion(
         if fecha_obj < date.today():
             raise HTTPException(status_code=400, detail="No se pueden hacer reservaciones en fechas pasadas")
         
-        dias_semana = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
-        dia_semana = dias_semana[fecha_obj.weekday()]
-        
-        # Verificar horario disponible usando string de hora
-        horario_query = """
-            SELECT id, capacidad_maxima, hora_inicio
-            FROM horarios_disponibles
-            WHERE sucursal_id = %s 
-            AND dia_semana = %s 
-            AND activo = TRUE
-        """
-        horarios = execute_query(horario_query, (request.sucursal_id, dia_semana))
+        # Horarios del día con su ocupación actual (sin caché: se va a reservar)
+        horarios = _horarios_del_dia(request.sucursal_id, fecha_obj)
         
         if not horarios:
             raise HTTPException(status_code=400, detail="No hay horarios disponibles para este día")
         
-        # Buscar el horario que coincida
-        horario_encontrado = None
-        for h in horarios:
-            hora_inicio = h['hora_inicio']
-            
-            # Convertir a string
-            if isinstance(hora_inicio, timedelta):
-                total_seconds = int(hora_inicio.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                hora_str = f"{hours:02d}:{minutes:02d}"
-            elif isinstance(hora_inicio, time):
-                hora_str = hora_inicio.strftime('%H:%M')
-            else:
-                hora_str = str(hora_inicio)
-            
-            if hora_str == request.hora_reservacion:
-                horario_encontrado = h
-                break
+        horario_encontrado = next((h for h in horarios if h['hora'] == hora_obj.strftime('%H:%M')), None)
         
         if not horario_encontrado:
             raise HTTPException(status_code=400, detail="Horario no disponible")
         
-        # Verificar capacidad
-        capacidad_query = """
-            SELECT COALESCE(SUM(numero_personas), 0) as personas_reservadas
-            FROM reservaciones
-            WHERE sucursal_id = %s 
-            AND fecha_reservacion = %s
-            AND hora_reservacion = %s
-            AND estado IN ('pendiente', 'confirmada')
-        """
-        capacidad_result = execute_query(
-            capacidad_query,
-            (request.sucursal_id, request.fecha_reservacion, request.hora_reservacion)
-        )
+        if request.numero_personas < 1:
+            raise HTTPException(status_code=400, detail="El número de personas debe ser mayor a cero")
         
-        personas_reservadas = int(capacidad_result[0]['personas_reservadas'])
-        capacidad_disponible = horario_encontrado['capacidad_maxima'] - personas_reservadas
+        capacidad_disponible = horario_encontrado['capacidad_disponible']
         
         if request.numero_personas > capacidad_disponible:
             raise HTTPException(
@@ -209,27 +277,15 @@ async def crear_reservacion(
                 detail=f"No hay capacidad suficiente. Disponible: {capacidad_disponible} personas"
             )
         
-        # Crear reservación
-        insert_query = """
-            INSERT INTO reservaciones (
-                cliente_id, sucursal_id, fecha_reservacion, hora_reservacion,
-                numero_personas, notas_especiales, telefono_contacto, estado
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, 'pendiente')
-        """
-        execute_query(
-            insert_query,
-            (
-                cliente_id,
-                request.sucursal_id,
-                request.fecha_reservacion,
-                request.hora_reservacion,
-                request.numero_personas,
-                request.notas_especiales,
-                request.telefono_contacto
-            ),
-            fetch=False
-        )
+        # Ocupar la capacidad y crear la reservación en la misma transacción;
+        # el UPDATE condicional rechaza si otra reservación tomó los lugares
+        with transaccion() as cursor:
+            if not capacidad_reservaciones.crear(
+                cursor, cliente_id, request.sucursal_id, fecha_obj, hora_obj,
+                horario_encontrado['capacidad_maxima'], request.numero_personas,
+                request.notas_especiales, request.telefono_contacto
+            ):
+                raise HTTPException(status_code=400, detail="No hay capacidad suficiente para este horario")
         
         # Obtener la reservación creada
         reservacion_query = """
@@ -248,21 +304,12 @@ async def crear_reservacion(
             (cliente_id, request.fecha_reservacion, request.hora_reservacion)
         )
         
+        _invalidar_disponibilidad(request.sucursal_id, fecha_obj)
+        
         if reservacion:
             res = reservacion[0]
             print(f" Reservación creada - ID: {res['id']}")
-            
-            # Convertir hora_reservacion a string
-            hora_reservacion = res['hora_reservacion']
-            if isinstance(hora_reservacion, timedelta):
-                total_seconds = int(hora_reservacion.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                hora_str = f"{hours:02d}:{minutes:02d}"
-            elif isinstance(hora_reservacion, time):
-                hora_str = hora_reservacion.strftime('%H:%M')
-            else:
-                hora_str = str(hora_reservacion)
+            hora_str = _hora_a_str(res['hora_reservacion'])
             
             return {
                 "message": "Reservación creada exitosamente",
@@ -328,16 +375,7 @@ async def obtener_mis_reservaciones(
                 fecha_str = str(res['fecha_reservacion'])
             
             
-            hora_reservacion = res['hora_reservacion']
-            if isinstance(hora_reservacion, timedelta):
-                total_seconds = int(hora_reservacion.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                hora_str = f"{hours:02d}:{minutes:02d}"
-            elif isinstance(hora_reservacion, time):
-                hora_str = hora_reservacion.strftime('%H:%M')
-            else:
-                hora_str = str(hora_reservacion)
+            hora_str = _hora_a_str(res['hora_reservacion'])
             
             # Convertir fecha_creacion
             if hasattr(res['fecha_creacion'], 'isoformat'):
@@ -422,7 +460,7 @@ async def obtener_detalle_reservacion(
                 "provincia": res['sucursal_provincia']
             },
             "fechaReservacion": res['fecha_reservacion'].isoformat(),
-            "horaReservacion": res['hora_reservacion'].strftime('%H:%M'),
+            "horaReservacion": _hora_a_str(res['hora_reservacion']),
             "numeroPersonas": res['numero_personas'],
             "mesaAsignada": res['mesa_asignada'],
             "estado": res['estado'],
@@ -494,6 +532,8 @@ async def modificar_reservacion(
             params.append(request.hora_reservacion)
         
         if request.numero_personas:
+            if request.numero_personas < 1:
+                raise HTTPException(status_code=400, detail="El número de personas debe ser mayor a cero")
             updates.append("numero_personas = %s")
             params.append(request.numero_personas)
         
@@ -504,14 +544,67 @@ async def modificar_reservacion(
         if not updates:
             raise HTTPException(status_code=400, detail="No hay cambios para actualizar")
         
-        # Actualizar
+        # Horario y personas resultantes
+        hora_anterior = datetime.strptime(_hora_a_str(res['hora_reservacion']), '%H:%M').time()
+        try:
+            hora_nueva = datetime.strptime(request.hora_reservacion, '%H:%M').time() if request.hora_reservacion else hora_anterior
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de hora inválido")
+        fecha_nueva = fecha_obj if request.fecha_reservacion else res['fecha_reservacion']
+        personas_nuevas = request.numero_personas or res['numero_personas']
+        
+        cambia_capacidad = (
+            fecha_nueva != res['fecha_reservacion']
+            or hora_nueva != hora_anterior
+            or personas_nuevas != res['numero_personas']
+        )
+        
+        if cambia_capacidad:
+            capacidad_nueva = _capacidad_horario(res['sucursal_id'], fecha_nueva, hora_nueva)
+            if capacidad_nueva is None:
+                raise HTTPException(status_code=400, detail="Horario no disponible")
+            capacidad_anterior = _capacidad_horario(res['sucursal_id'], res['fecha_reservacion'], hora_anterior) or 0
+        
+        # Actualizar; los lugares del horario anterior se liberan y los del nuevo
+        # se ocupan en la misma transacción
         params.append(reservacion_id)
         update_query = f"""
             UPDATE reservaciones 
             SET {', '.join(updates)}
             WHERE id = %s
         """
-        execute_query(update_query, tuple(params), fetch=False)
+        with transaccion() as cursor:
+            # Primero la reservación y luego los horarios, el mismo orden que al cancelar.
+            # Se relee bajo bloqueo: rowcount no distingue "sin cambios" de "cambió de estado"
+            cursor.execute("""
+                SELECT estado, fecha_reservacion, hora_reservacion, numero_personas
+                FROM reservaciones WHERE id = %s FOR UPDATE
+            """, (reservacion_id,))
+            actual = cursor.fetchone()
+            if (actual is None or actual['estado'] != res['estado']
+                    or actual['fecha_reservacion'] != res['fecha_reservacion']
+                    or _hora_a_str(actual['hora_reservacion']) != _hora_a_str(res['hora_reservacion'])
+                    or actual['numero_personas'] != res['numero_personas']):
+                raise HTTPException(status_code=409, detail="La reservación cambió, intente de nuevo")
+            
+            if cambia_capacidad:
+                # Ambos horarios en orden fijo antes de tocar cualquiera de los dos
+                capacidad_reservaciones.bloquear(cursor, [
+                    (res['sucursal_id'], res['fecha_reservacion'], hora_anterior, capacidad_anterior),
+                    (res['sucursal_id'], fecha_nueva, hora_nueva, capacidad_nueva)
+                ])
+                capacidad_reservaciones.liberar(
+                    cursor, res['sucursal_id'], res['fecha_reservacion'], hora_anterior, res['numero_personas']
+                )
+                if not capacidad_reservaciones.reservar(
+                    cursor, res['sucursal_id'], fecha_nueva, hora_nueva, capacidad_nueva, personas_nuevas
+                ):
+                    raise HTTPException(status_code=400, detail="No hay capacidad suficiente para este horario")
+            cursor.execute(update_query, tuple(params))
+        
+        _invalidar_disponibilidad(res['sucursal_id'], res['fecha_reservacion'])
+        if request.fecha_reservacion:
+            _invalidar_disponibilidad(res['sucursal_id'], request.fecha_reservacion)
         
         print(f" Reservación modificada exitosamente")
         
@@ -567,13 +660,23 @@ async def cancelar_reservacion(
                 detail=f"No se puede cancelar una reservación con estado '{res['estado']}'"
             )
         
-        # Actualizar estado
+        # Actualizar estado y devolver los lugares si la reservación los ocupaba
         update_query = """
             UPDATE reservaciones 
             SET estado = 'cancelada'
-            WHERE id = %s
+            WHERE id = %s AND estado = %s
         """
-        execute_query(update_query, (reservacion_id,), fetch=False)
+        with transaccion() as cursor:
+            cursor.execute(update_query, (reservacion_id, res['estado']))
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=409, detail="La reservación cambió de estado, intente de nuevo")
+            if res['estado'] in ('pendiente', 'confirmada'):
+                capacidad_reservaciones.liberar(
+                    cursor, res['sucursal_id'], res['fecha_reservacion'],
+                    res['hora_reservacion'], res['numero_personas']
+                )
+        
+        _invalidar_disponibilidad(res['sucursal_id'], res['fecha_reservacion'])
         
         print(f" Reservación cancelada exitosamente")
         
@@ -594,14 +697,11 @@ async def obtener_sucursales_disponibles():
     """Obtener sucursales que aceptan reservaciones"""
     
     try:
-        sucursales_query = """
-            SELECT DISTINCT s.*
-            FROM sucursales s
-            JOIN horarios_disponibles h ON s.id = h.sucursal_id
-            WHERE s.activa = TRUE AND h.activo = TRUE
-            ORDER BY s.nombre
-        """
-        sucursales = execute_query(sucursales_query)
+        con_horarios = referencia.sucursales_con_horarios()
+        sucursales = sorted(
+            (s for s in referencia.sucursales() if s['id'] in con_horarios),
+            key=lambda s: s['nombre']
+        )
         
         return {
             "sucursales": [
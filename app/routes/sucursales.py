@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from app.config.database import execute_query
+from app.services import referencia
 
 router = APIRouter(
     prefix="/sucursales",
@@ -10,16 +10,14 @@ router = APIRouter(
 @router.get("/") 
 def get_sucursales():
     """Obtener todas las sucursales activas"""
-    query = "SELECT * FROM sucursales WHERE activa = TRUE ORDER BY orden ASC"
-    return execute_query(query)
+    return [dict(s) for s in referencia.sucursales()]
 
 @router.get("/{id}")  
 def get_sucursal(id: int):
     """Obtener una sucursal por ID"""
-    query = "SELECT * FROM sucursales WHERE id = %s AND activa = TRUE"
-    result = execute_query(query, (id,))
+    sucursal = referencia.sucursal(id)
     
-    if not result:
+    if not sucursal:
         raise HTTPException(status_code=404, detail="Sucursal no encontrada")
     
-    return result[0]
\ No newline at end of file
+    return dict(sucursal)
\ No newline at end of file
@@ -5,6 +5,7 @@ from typing import Optional
 import re
 from datetime import datetime
 from app.config.database import execute_query
+from app.routes.pedidos import notificar_cambio_estado
 
 router = APIRouter(
     prefix="/tarjetas",
@@ -249,6 +250,9 @@ async def procesar_pago_tarjeta(
         transaction_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
         
         # 6. Actualizar pedido en la base de datos
+        pedido_query = "SELECT estado, cliente_id, sucursal_id FROM pedidos WHERE id = %s"
+        pedido = execute_query(pedido_query, (request.pedido_id,))
+        
         update_query = """
             UPDATE pedidos 
             SET estado = 'confirmado',
@@ -264,6 +268,14 @@ async def procesar_pago_tarjeta(
             (tipo_tarjeta, numero[-4:], transaction_id, request.pedido_id),
             fetch=False
         )
+        if pedido:
+            notificar_cambio_estado(
+                request.pedido_id,
+                pedido[0]['cliente_id'],
+                pedido[0]['sucursal_id'],
+                pedido[0]['estado'],
+                'confirmado'
+            )
         
         
         insert_transaccion = """
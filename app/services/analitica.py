@@ -0,0 +1,242 @@
+import threading
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+from app.config.database import consulta_lectura
+from app.services import paralelo
+
+# Snapshot columnar en memoria de pedidos completados y sus líneas, como arreglos NumPy.
+# Se carga una vez (últimos DIAS_HISTORIA días, ambos niveles) y luego se refresca
+# incrementalmente con los pedidos completados después de la última marca; en cada
+# refresco se descartan los que salieron de la ventana, así el tamaño queda acotado.
+
+DIAS_HISTORIA = 365
+INTERVALO_REFRESCO = 30
+TAMANO_BLOQUE_LINEAS = 1000
+PARTES_CARGA = 4
+
+
+class Columnas:
+    """Arreglos inmutables de un snapshot; se reemplazan completos al refrescar"""
+
+    def __init__(self, pedidos: dict, lineas: dict, marca):
+        self.pedido_id = pedidos['id']
+        self.sucursal_id = pedidos['sucursal_id']
+        self.cliente_id = pedidos['cliente_id']
+        self.total = pedidos['total']
+        self.completado = pedidos['completado']
+        self.linea_pedido_id = lineas['pedido_id']
+        self.linea_producto_id = lineas['producto_id']
+        self.linea_cantidad = lineas['cantidad']
+        self.linea_subtotal = lineas['subtotal']
+        self.marca = marca
+
+        # Columnas derivadas
+        dias = self.completado.astype('datetime64[D]')
+        self.dia = dias
+        self.hora = (self.completado - dias).astype('timedelta64[h]').astype(np.int64)
+        # 1970-01-01 fue jueves; lunes = 0
+        self.dia_semana = (dias.astype(np.int64) + 3) % 7
+
+        # Posición del pedido de cada línea (para filtrar líneas con la máscara de pedidos)
+        orden = np.argsort(self.pedido_id, kind='stable')
+        indices = np.searchsorted(self.pedido_id[orden], self.linea_pedido_id)
+        indices = np.clip(indices, 0, max(len(orden) - 1, 0))
+        self.linea_posicion = orden[indices] if len(orden) else np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.pedido_id)
+
+
+def _vacias() -> Columnas:
+    return Columnas(
+        {
+            'id': np.zeros(0, dtype=np.int64),
+            'sucursal_id': np.zeros(0, dtype=np.int64),
+            'cliente_id': np.zeros(0, dtype=np.int64),
+            'total': np.zeros(0, dtype=np.float64),
+            'completado': np.zeros(0, dtype='datetime64[s]')
+        },
+        {
+            'pedido_id': np.zeros(0, dtype=np.int64),
+            'producto_id': np.zeros(0, dtype=np.int64),
+            'cantidad': np.zeros(0, dtype=np.int64),
+            'subtotal': np.zeros(0, dtype=np.float64)
+        },
+        None
+    )
+
+
+_snapshot = _vacias()
+_refrescado = 0.0
+_lock = threading.Lock()
+
+
+def _cargar_pedidos(marca) -> list:
+    if marca is None:
+        # Carga inicial: ambos niveles, en rangos de fechas leídos en paralelo
+        query = """
+            SELECT id, sucursal_id, cliente_id, total, fecha_completado
+            FROM pedidos
+            WHERE estado = 'completado' AND fecha_completado >= %s AND fecha_completado < %s
+            UNION ALL
+            SELECT id, sucursal_id, cliente_id, total, fecha_completado
+            FROM pedidos_archivo
+            WHERE estado = 'completado' AND fecha_completado >= %s AND fecha_completado < %s
+            ORDER BY fecha_completado ASC, id ASC
+        """
+
+        def cargar_rango(rango):
+            desde, hasta = rango
+            limite = hasta + timedelta(days=1)
+            return consulta_lectura(query, (desde, limite, desde, limite))
+
+        rangos = paralelo.rangos_fecha(date.today() - timedelta(days=DIAS_HISTORIA), date.today(), PARTES_CARGA)
+        return [p for parte in paralelo.repartir(cargar_rango, rangos) for p in parte]
+
+    # Incremental: los pedidos recién completados siempre están en el nivel activo
+    fecha_marca, id_marca = marca
+    query = """
+        SELECT id, sucursal_id, cliente_id, total, fecha_completado
+        FROM pedidos
+        WHERE estado = 'completado'
+        AND (fecha_completado > %s OR (fecha_completado = %s AND id > %s))
+        ORDER BY fecha_completado ASC, id ASC
+    """
+    return consulta_lectura(query, (fecha_marca, fecha_marca, id_marca))
+
+
+def _cargar_bloque_lineas(bloque: tuple) -> list:
+    placeholders = ", ".join(["%s"] * len(bloque))
+    query = f"""
+        SELECT pedido_id, producto_id, cantidad, subtotal FROM pedido_detalles
+        WHERE pedido_id IN ({placeholders})
+        UNION ALL
+        SELECT pedido_id, producto_id, cantidad, subtotal FROM pedido_detalles_archivo
+        WHERE pedido_id IN ({placeholders})
+    """
+    return consulta_lectura(query, bloque + bloque)
+
+
+def _cargar_lineas(ids: list) -> list:
+    bloques = [tuple(ids[i:i + TAMANO_BLOQUE_LINEAS]) for i in range(0, len(ids), TAMANO_BLOQUE_LINEAS)]
+    return [l for parte in paralelo.repartir(_cargar_bloque_lineas, bloques) for l in parte]
+
+
+def refrescar(forzar: bool = True) -> int:
+    """Agrega al snapshot los pedidos completados desde la última marca"""
+    global _snapshot, _refrescado
+
+    with _lock:
+        # Otro hilo pudo refrescar mientras esperábamos
+        if not forzar and time.monotonic() - _refrescado <= INTERVALO_REFRESCO:
+            return 0
+
+        actual = _snapshot
+        pedidos = _cargar_pedidos(actual.marca)
+        _refrescado = time.monotonic()
+
+        # Los pedidos están ordenados por fecha_completado: los que salieron de la
+        # ventana de DIAS_HISTORIA son un prefijo y se descartan en cada refresco
+        limite = np.datetime64(date.today() - timedelta(days=DIAS_HISTORIA), 'D').astype('datetime64[s]')
+        corte = int(np.searchsorted(actual.completado, limite))
+
+        if not pedidos and corte == 0:
+            return 0
+
+        vigentes = actual.linea_posicion >= corte
+
+        lineas = _cargar_lineas([p['id'] for p in pedidos]) if pedidos else []
+
+        nuevos_pedidos = {
+            'id': np.array([p['id'] for p in pedidos], dtype=np.int64),
+            'sucursal_id': np.array([p['sucursal_id'] or 0 for p in pedidos], dtype=np.int64),
+            'cliente_id': np.array([p['cliente_id'] or 0 for p in pedidos], dtype=np.int64),
+            'total': np.array([float(p['total']) for p in pedidos], dtype=np.float64),
+            'completado': np.array([p['fecha_completado'] for p in pedidos], dtype='datetime64[s]')
+        }
+        nuevas_lineas = {
+            'pedido_id': np.array([l['pedido_id'] for l in lineas], dtype=np.int64),
+            'producto_id': np.array([l['producto_id'] for l in lineas], dtype=np.int64),
+            'cantidad': np.array([l['cantidad'] for l in lineas], dtype=np.int64),
+            'subtotal': np.array([float(l['subtotal']) for l in lineas], dtype=np.float64)
+        }
+
+        marca = (pedidos[-1]['fecha_completado'], pedidos[-1]['id']) if pedidos else actual.marca
+        _snapshot = Columnas(
+            {
+                'id': np.concatenate([actual.pedido_id[corte:], nuevos_pedidos['id']]),
+                'sucursal_id': np.concatenate([actual.sucursal_id[corte:], nuevos_pedidos['sucursal_id']]),
+                'cliente_id': np.concatenate([actual.cliente_id[corte:], nuevos_pedidos['cliente_id']]),
+                'total': np.concatenate([actual.total[corte:], nuevos_pedidos['total']]),
+                'completado': np.concatenate([actual.completado[corte:], nuevos_pedidos['completado']])
+            },
+            {
+                'pedido_id': np.concatenate([actual.linea_pedido_id[vigentes], nuevas_lineas['pedido_id']]),
+                'producto_id': np.concatenate([actual.linea_producto_id[vigentes], nuevas_lineas['producto_id']]),
+                'cantidad': np.concatenate([actual.linea_cantidad[vigentes], nuevas_lineas['cantidad']]),
+                'subtotal': np.concatenate([actual.linea_subtotal[vigentes], nuevas_lineas['subtotal']])
+            },
+            marca
+        )
+
+        if corte:
+            print(f"Analítica: {corte} pedidos fuera de la ventana de {DIAS_HISTORIA} días")
+        print(f"Analítica: {len(pedidos)} pedidos nuevos (total {len(_snapshot)})")
+        return len(pedidos)
+
+
+def snapshot() -> Columnas:
+    """Snapshot actual; se refresca si está vencido"""
+    if time.monotonic() - _refrescado > INTERVALO_REFRESCO:
+        refrescar(forzar=False)
+    return _snapshot
+
+
+# ============= API DE CONSULTA =============
+
+def filtrar(cols: Columnas, desde: Optional[date] = None, hasta: Optional[date] = None,
+            sucursal_id: Optional[int] = None) -> np.ndarray:
+    """Máscara booleana de pedidos por rango de fechas y sucursal"""
+    mascara = np.ones(len(cols), dtype=bool)
+    if desde is not None:
+        mascara &= cols.dia >= np.datetime64(desde, 'D')
+    if hasta is not None:
+        mascara &= cols.dia <= np.datetime64(hasta, 'D')
+    if sucursal_id is not None:
+        mascara &= cols.sucursal_id == sucursal_id
+    return mascara
+
+
+def agrupar(claves: np.ndarray, valores: Optional[np.ndarray] = None):
+    """Agrupa por clave; devuelve (claves únicas, conteos, sumas)"""
+    unicas, inverso = np.unique(claves, return_inverse=True)
+    conteos = np.bincount(inverso, minlength=len(unicas))
+    sumas = np.bincount(inverso, weights=valores, minlength=len(unicas)) if valores is not None else None
+    return unicas, conteos, sumas
+
+
+def cuantiles(valores: np.ndarray, probabilidades) -> dict:
+    """Cuantiles de un arreglo; vacío si no hay datos"""
+    if len(valores) == 0:
+        return {}
+    resultado = np.quantile(valores, probabilidades)
+    return {f"p{int(round(p * 100))}": round(float(v), 2) for p, v in zip(probabilidades, resultado)}
+
+
+def mapa_horas(cols: Columnas, mascara: np.ndarray):
+    """Matrices 7x24 (día de semana x hora) de pedidos y ventas"""
+    celda = cols.dia_semana[mascara] * 24 + cols.hora[mascara]
+    pedidos = np.bincount(celda, minlength=7 * 24).reshape(7, 24)
+    ventas = np.bincount(celda, weights=cols.total[mascara], minlength=7 * 24).reshape(7, 24)
+    return pedidos, ventas
+
+
+def mascara_lineas(cols: Columnas, mascara: np.ndarray) -> np.ndarray:
+    """Máscara de líneas cuyo pedido cumple la máscara de pedidos"""
+    if len(cols) == 0:
+        return np.zeros(len(cols.linea_pedido_id), dtype=bool)
+    return mascara[cols.linea_posicion]
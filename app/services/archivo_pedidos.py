@@ -0,0 +1,40 @@
+from app.config.database import transaccion
+
+# Mueve pedidos terminados y antiguos de las tablas activas a las de archivo.
+# Cada lote se mueve en su propia transacción para no bloquear las tablas mucho tiempo.
+# Requiere la migración 013: cupon_usos, puntos_historial y transacciones conservan
+# el pedido_id de los pedidos archivados sin llave foránea hacia pedidos.
+
+DIAS_RETENCION = 90
+TAMANO_LOTE = 500
+
+
+def archivar_pedidos(dias: int = DIAS_RETENCION, lote: int = TAMANO_LOTE) -> int:
+    """Archiva pedidos completados o cancelados hace más de `dias` días"""
+    total = 0
+
+    while True:
+        with transaccion() as cursor:
+            cursor.execute("""
+                SELECT id FROM pedidos
+                WHERE estado IN ('completado', 'cancelado')
+                AND COALESCE(fecha_completado, fecha_creacion) < NOW() - INTERVAL %s DAY
+                ORDER BY id ASC
+                LIMIT %s
+                FOR UPDATE
+            """, (dias, lote))
+            ids = tuple(fila['id'] for fila in cursor.fetchall())
+
+            if not ids:
+                break
+
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"INSERT INTO pedidos_archivo SELECT * FROM pedidos WHERE id IN ({placeholders})", ids)
+            cursor.execute(f"INSERT INTO pedido_detalles_archivo SELECT * FROM pedido_detalles WHERE pedido_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM pedido_detalles WHERE pedido_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM pedidos WHERE id IN ({placeholders})", ids)
+
+        total += len(ids)
+        print(f"Archivados {len(ids)} pedidos (total: {total})")
+
+    return total
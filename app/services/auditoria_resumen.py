@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import Optional
+
+from app.config.database import execute_query, transaccion
+from app.services import escritor_auditoria
+
+# Contadores de auditoría por acción (general, por usuario y por tabla) en
+# auditoria_resumen. Se actualizan en la misma transacción que inserta cada lote,
+# así /auditoria/estadisticas/general no recorre la tabla de auditoría.
+
+# Largos de auditoria_resumen.clave y .accion (migración 014): un valor más largo
+# haría fallar el lote completo de auditoría, así que se recorta
+LARGO_CLAVE = 255
+LARGO_ACCION = 50
+
+
+@escritor_auditoria.al_escribir
+def acumular(cursor, registros: list):
+    """Suma un lote recién insertado a los contadores"""
+    conteos = Counter()
+    for r in registros:
+        accion = (r.get('accion') or '').lower()[:LARGO_ACCION]
+        conteos[('general', '', accion)] += 1
+        if r.get('usuario_Id') is not None:
+            conteos[('usuario', str(r['usuario_Id']), accion)] += 1
+        if r.get('tabla'):
+            conteos[('tabla', r['tabla'][:LARGO_CLAVE], accion)] += 1
+
+    # Orden fijo para que lotes concurrentes bloqueen las filas en el mismo orden
+    cursor.executemany("""
+        INSERT INTO auditoria_resumen (ambito, clave, accion, total)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+    """, [(*clave, total) for clave, total in sorted(conteos.items())])
+
+
+def obtener(usuario_id: Optional[int] = None, tabla: Optional[str] = None) -> dict:
+    """Totales por acción de un ámbito: {accion: total}"""
+    if usuario_id:
+        ambito, clave = 'usuario', str(usuario_id)
+    elif tabla:
+        ambito, clave = 'tabla', tabla
+    else:
+        ambito, clave = 'general', ''
+
+    filas = execute_query(
+        "SELECT accion, total FROM auditoria_resumen WHERE ambito = %s AND clave = %s",
+        (ambito, clave)
+    )
+    return {f['accion']: int(f['total']) for f in filas}
+
+
+def reconstruir():
+    """Recalcula todos los contadores desde la tabla de auditoría"""
+    with transaccion() as cursor:
+        cursor.execute("DELETE FROM auditoria_resumen")
+        cursor.execute("""
+            INSERT INTO auditoria_resumen (ambito, clave, accion, total)
+            SELECT 'general', '', LEFT(LOWER(accion), %(accion)s), COUNT(*)
+            FROM auditoria GROUP BY LEFT(LOWER(accion), %(accion)s)
+            UNION ALL
+            SELECT 'usuario', CAST(usuario_Id AS CHAR), LEFT(LOWER(accion), %(accion)s), COUNT(*)
+            FROM auditoria WHERE usuario_Id IS NOT NULL
+            GROUP BY usuario_Id, LEFT(LOWER(accion), %(accion)s)
+            UNION ALL
+            SELECT 'tabla', LEFT(tabla, %(clave)s), LEFT(LOWER(accion), %(accion)s), COUNT(*)
+            FROM auditoria WHERE tabla IS NOT NULL AND tabla <> ''
+            GROUP BY LEFT(tabla, %(clave)s), LEFT(LOWER(accion), %(accion)s)
+        """, {'clave': LARGO_CLAVE, 'accion': LARGO_ACCION})
+
+
+if __name__ == "__main__":
+    print("Reconstruyendo contadores de auditoría")
+    reconstruir()
+    print("Contadores reconstruidos")
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class CacheTTL:
+    """Caché en memoria con expiración por clave.
+
+    Si varias peticiones piden la misma clave a la vez, solo una ejecuta
+    la carga y las demás esperan y reutilizan el resultado.
+    """
+
+    def __init__(self, ttl: float, maximo: int = None):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._datos = {}
+        self._candados = {}
+        self._lock = threading.Lock()
+
+    def _purgar(self):
+        """Con claves arbitrarias (filtros, fechas), evita que la caché crezca sin límite"""
+        if self.maximo is None or len(self._datos) <= self.maximo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            for clave in [c for c, e in list(self._datos.items()) if e[0] <= ahora]:
+                self._datos.pop(clave, None)
+            # Si siguen sobrando, se descartan las que vencen antes
+            if len(self._datos) > self.maximo:
+                sobrantes = sorted(list(self._datos.items()), key=lambda e: e[1][0])[:len(self._datos) - self.maximo]
+                for clave, _ in sobrantes:
+                    self._datos.pop(clave, None)
+            for clave in [c for c in self._candados if c not in self._datos and not self._candados[c].locked()]:
+                del self._candados[clave]
+
+    def _candado(self, clave):
+        with self._lock:
+            if clave not in self._candados:
+                self._candados[clave] = threading.Lock()
+            return self._candados[clave]
+
+    def obtener(self, clave, cargar):
+        """Devuelve el valor en caché o lo carga con cargar()"""
+        entrada = self._datos.get(clave)
+        if entrada and entrada[0] > time.monotonic():
+            return entrada[1]
+
+        with self._candado(clave):
+            # Otro hilo pudo cargarlo mientras esperábamos
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                return entrada[1]
+
+            valor = cargar()
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+
+        self._purgar()
+        return valor
+
+    def guardar(self, clave, valor):
+        self._datos[clave] = (time.monotonic() + self.ttl, valor)
+
+    def reemplazar(self, clave, valor):
+        """Sustituye el valor sin extender su vencimiento; no hace nada si no está en caché"""
+        entrada = self._datos.get(clave)
+        if entrada:
+            self._datos[clave] = (entrada[0], valor)
+
+    def invalidar(self, clave=None):
+        """Elimina una clave, o toda la caché si no se indica"""
+        if clave is None:
+            self._datos.clear()
+        else:
+            self._datos.pop(clave, None)
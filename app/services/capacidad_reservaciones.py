@@ -0,0 +1,207 @@
+import argparse
+import random
+import threading
+import time
+from datetime import date, time as hora_del_dia
+from typing import Optional
+
+from app.config.database import execute_query, transaccion
+
+# Registro de capacidad por (sucursal, fecha, hora) en reservaciones_capacidad.
+# reservar() admite o rechaza con un único UPDATE condicional, que InnoDB aplica
+# con bloqueo de fila: reservaciones simultáneas del mismo horario se serializan
+# solo entre sí y nunca pasan de la capacidad. Las funciones reciben el cursor
+# del llamador para que el cambio sea atómico con el INSERT/UPDATE de la reservación.
+
+
+def _asegurar_fila(cursor, sucursal_id: int, fecha, hora, capacidad: int):
+    """Crea la fila del horario si falta y la deja bloqueada en exclusivo"""
+    cursor.execute("""
+        SELECT 1 FROM reservaciones_capacidad
+        WHERE sucursal_id = %s AND fecha = %s AND hora = %s
+    """, (sucursal_id, fecha, hora))
+    reservado = 0
+    if not cursor.fetchall():
+        # La primera vez que se usa un horario se parte de las reservaciones existentes.
+        # Lectura sin bloqueo: un INSERT ... SELECT pondría bloqueos compartidos sobre
+        # esas reservaciones y sobre la fila del horario, y dos reservaciones del mismo
+        # horario terminarían en deadlock al pasar al UPDATE
+        cursor.execute("""
+            SELECT COALESCE(SUM(numero_personas), 0) as reservado
+            FROM reservaciones
+            WHERE sucursal_id = %s AND fecha_reservacion = %s AND hora_reservacion = %s
+            AND estado IN ('pendiente', 'confirmada')
+        """, (sucursal_id, fecha, hora))
+        reservado = cursor.fetchone()['reservado']
+
+    # ON DUPLICATE KEY toma bloqueo exclusivo también cuando la fila ya existe
+    cursor.execute("""
+        INSERT INTO reservaciones_capacidad (sucursal_id, fecha, hora, capacidad, reservado)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE capacidad = VALUES(capacidad)
+    """, (sucursal_id, fecha, hora, capacidad, reservado))
+
+
+def bloquear(cursor, horarios):
+    """Bloquea las filas de varios horarios en orden fijo (sucursal, fecha, hora).
+
+    `horarios` son tuplas (sucursal_id, fecha, hora, capacidad). Dos transacciones
+    que mueven reservaciones entre los mismos horarios toman los bloqueos en el
+    mismo orden y se esperan en lugar de caer en un deadlock.
+    """
+    for sucursal_id, fecha, hora, capacidad in sorted(set(horarios), key=lambda h: h[:3]):
+        _asegurar_fila(cursor, sucursal_id, fecha, hora, capacidad)
+
+
+def reservar(cursor, sucursal_id: int, fecha, hora, capacidad: int, personas: int) -> bool:
+    """Ocupa `personas` lugares si caben; False si no hay capacidad"""
+    _asegurar_fila(cursor, sucursal_id, fecha, hora, capacidad)
+    cursor.execute("""
+        UPDATE reservaciones_capacidad
+        SET reservado = reservado + %s
+        WHERE sucursal_id = %s AND fecha = %s AND hora = %s
+        AND reservado + %s <= capacidad
+    """, (personas, sucursal_id, fecha, hora, personas))
+    return cursor.rowcount == 1
+
+
+def liberar(cursor, sucursal_id: int, fecha, hora, personas: int):
+    """Devuelve `personas` lugares al horario"""
+    cursor.execute("""
+        UPDATE reservaciones_capacidad
+        SET reservado = GREATEST(reservado - %s, 0)
+        WHERE sucursal_id = %s AND fecha = %s AND hora = %s
+    """, (personas, sucursal_id, fecha, hora))
+
+
+def crear(cursor, cliente_id: int, sucursal_id: int, fecha, hora, capacidad: int, personas: int,
+          notas: Optional[str] = None, telefono: Optional[str] = None) -> Optional[int]:
+    """Ocupa los lugares e inserta la reservación pendiente; None si no hay capacidad"""
+    if not reservar(cursor, sucursal_id, fecha, hora, capacidad, personas):
+        return None
+    cursor.execute("""
+        INSERT INTO reservaciones (
+            cliente_id, sucursal_id, fecha_reservacion, hora_reservacion,
+            numero_personas, notas_especiales, telefono_contacto, estado
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, 'pendiente')
+    """, (cliente_id, sucursal_id, fecha, hora, personas, notas, telefono))
+    return cursor.lastrowid
+
+
+# ============= BENCHMARK =============
+
+def benchmark(hilos: int, intentos: int, capacidad: int, sucursal_id: Optional[int] = None,
+              cliente_id: Optional[int] = None, fecha: date = date(2099, 12, 31),
+              hora: hora_del_dia = hora_del_dia(0, 0)) -> dict:
+    """Reservaciones concurrentes por el mismo camino que POST /reservaciones/crear.
+
+    Cada intento corre la transacción completa (capacidad + INSERT de la reservación)
+    contra un horario de prueba; al final compara el registro de capacidad con las
+    reservaciones insertadas y borra ambas.
+    """
+    if sucursal_id is None:
+        sucursal_id = execute_query("SELECT id FROM sucursales ORDER BY id LIMIT 1")[0]['id']
+    if cliente_id is None:
+        cliente_id = execute_query("SELECT id FROM clientes ORDER BY id LIMIT 1")[0]['id']
+
+    execute_query(
+        "DELETE FROM reservaciones_capacidad WHERE sucursal_id = %s AND fecha = %s AND hora = %s",
+        (sucursal_id, fecha, hora), fetch=False
+    )
+    consulta_reservadas = """
+        SELECT COALESCE(SUM(numero_personas), 0) as personas FROM reservaciones
+        WHERE sucursal_id = %s AND fecha_reservacion = %s AND hora_reservacion = %s
+        AND estado IN ('pendiente', 'confirmada')
+    """
+    previas = int(execute_query(consulta_reservadas, (sucursal_id, fecha, hora))[0]['personas'])
+
+    lock = threading.Lock()
+    resultado = {'admitidas': 0, 'rechazadas': 0, 'personas': 0, 'errores': 0}
+    creadas = []
+    restantes = [intentos]
+
+    def trabajador():
+        while True:
+            with lock:
+                if restantes[0] == 0:
+                    return
+                restantes[0] -= 1
+            personas = random.randint(1, 6)
+            try:
+                with transaccion() as cursor:
+                    reservacion_id = crear(
+                        cursor, cliente_id, sucursal_id, fecha, hora, capacidad, personas,
+                        "benchmark", "00000000"
+                    )
+            except Exception as e:
+                print(f"Error en reservación de prueba: {e}")
+                with lock:
+                    resultado['errores'] += 1
+                continue
+            with lock:
+                if reservacion_id:
+                    creadas.append(reservacion_id)
+                    resultado['admitidas'] += 1
+                    resultado['personas'] += personas
+                else:
+                    resultado['rechazadas'] += 1
+
+    inicio = time.monotonic()
+    hilos_activos = [threading.Thread(target=trabajador) for _ in range(hilos)]
+    for hilo in hilos_activos:
+        hilo.start()
+    for hilo in hilos_activos:
+        hilo.join()
+    duracion = time.monotonic() - inicio
+
+    fila = execute_query(
+        "SELECT reservado FROM reservaciones_capacidad WHERE sucursal_id = %s AND fecha = %s AND hora = %s",
+        (sucursal_id, fecha, hora)
+    )
+    reservadas = int(execute_query(consulta_reservadas, (sucursal_id, fecha, hora))[0]['personas'])
+
+    for i in range(0, len(creadas), 500):
+        bloque = creadas[i:i + 500]
+        execute_query(
+            f"DELETE FROM reservaciones WHERE id IN ({', '.join(['%s'] * len(bloque))})",
+            tuple(bloque), fetch=False
+        )
+    execute_query(
+        "DELETE FROM reservaciones_capacidad WHERE sucursal_id = %s AND fecha = %s AND hora = %s",
+        (sucursal_id, fecha, hora), fetch=False
+    )
+
+    reservado = int(fila[0]['reservado']) if fila else 0
+    return {
+        **resultado,
+        'reservado': reservado,
+        'reservadasEnTabla': reservadas,
+        'capacidad': capacidad,
+        'sobreventa': (
+            reservadas > max(capacidad, previas)
+            or reservado != reservadas
+            or reservadas != previas + resultado['personas']
+        ),
+        'tasaErrores': round(resultado['errores'] / intentos, 4) if intentos else 0.0,
+        'porSegundo': round(intentos / duracion, 1) if duracion else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia de la creación de reservaciones")
+    parser.add_argument("--hilos", type=int, default=32)
+    parser.add_argument("--intentos", type=int, default=2000)
+    parser.add_argument("--capacidad", type=int, default=500)
+    parser.add_argument("--sucursal", type=int, default=None)
+    parser.add_argument("--cliente", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"Reservando con {args.hilos} hilos, {args.intentos} intentos, capacidad {args.capacidad}")
+    resultado = benchmark(args.hilos, args.intentos, args.capacidad, args.sucursal, args.cliente)
+    print(resultado)
+    if resultado['sobreventa']:
+        raise SystemExit("Sobreventa detectada")
+    if resultado['errores']:
+        raise SystemExit(f"{resultado['errores']} transacciones fallaron (tasa {resultado['tasaErrores']})")
+    print("Sin sobreventa ni errores")
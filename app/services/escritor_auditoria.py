@@ -0,0 +1,358 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from mysql.connector import errors as errores_mysql
+
+from app.config.database import transaccion
+
+# Escritura de auditoría en segundo plano.
+# POST /auditoria solo encola; un hilo agrupa los registros en INSERTs de varias
+# filas por tamaño o por tiempo. Si la base de datos falla (o la cola se llena),
+# los registros se escriben en un archivo spool NDJSON local y se reinsertan
+# cuando la base vuelve a responder. Un lote rechazado por sus datos (valor
+# demasiado largo, FK, etc.) se reintenta fila por fila y las filas que fallan
+# van a descartados.ndjson, para que no bloqueen la escritura ni el spool.
+
+CAPACIDAD = int(os.getenv('AUDITORIA_COLA', 10000))
+TAMANO_LOTE = 500
+ESPERA_LOTE = 0.5        # segundos máximos para juntar un lote
+REINTENTO_SPOOL = 10     # segundos entre intentos de reinsertar el spool
+DIRECTORIO_SPOOL = os.getenv('AUDITORIA_SPOOL_DIR', os.path.join('spool', 'auditoria'))
+
+COLUMNAS = [
+    'fecha', 'usuario_Id', 'tabla', 'accion', 'registro_Id', 'datos_Anteriores',
+    'datos_Nuevos', 'ip_Address', 'descripcion', 'endpoint', 'metodo'
+]
+
+_cola = queue.Queue(maxsize=CAPACIDAD)
+_lock_spool = threading.Lock()
+_lock_metricas = threading.Lock()
+_detener = threading.Event()
+_hilo = None
+_bd_disponible = True
+_proximo_reintento = 0.0
+
+_metricas = {
+    'encolados': 0,
+    'escritos': 0,
+    'lotes': 0,
+    'desbordes': 0,
+    'fallos_bd': 0,
+    'reinsertados': 0,
+    'descartados': 0,
+    'ultimo_lote': None
+}
+
+# Funciones llamadas con (cursor, registros) dentro de la transacción de cada lote
+_al_escribir = []
+
+
+def al_escribir(funcion):
+    """Registra una función que se ejecuta con cada lote escrito, en su transacción"""
+    _al_escribir.append(funcion)
+    return funcion
+
+
+def _sumar(**valores):
+    with _lock_metricas:
+        for clave, valor in valores.items():
+            _metricas[clave] += valor
+
+
+def insertar(cursor, registros: list):
+    """INSERT de varias filas con el cursor (y la transacción) del llamador"""
+    placeholders = ", ".join(["%s"] * len(COLUMNAS))
+    cursor.executemany(
+        f"INSERT INTO auditoria ({', '.join(COLUMNAS)}) VALUES ({placeholders})",
+        [tuple(r.get(c) for c in COLUMNAS) if r.get('fecha') else (datetime.now(), *(r.get(c) for c in COLUMNAS[1:]))
+         for r in registros]
+    )
+    for funcion in _al_escribir:
+        funcion(cursor, registros)
+
+
+def _error_mysql(error: Exception):
+    """Error de mysql.connector original (transaccion() lo envuelve en HTTPException)"""
+    while error is not None and not isinstance(error, errores_mysql.Error):
+        error = error.__cause__ or error.__context__
+    return error
+
+
+def _es_error_de_datos(error: Exception) -> bool:
+    """True si el servidor rechazó los datos; False si la base no respondió o es transitorio"""
+    error = _error_mysql(error)
+    if error is None or isinstance(error, (errores_mysql.InterfaceError, errores_mysql.OperationalError,
+                                           errores_mysql.InternalError, errores_mysql.PoolError)):
+        return False
+    if isinstance(error, (errores_mysql.DataError, errores_mysql.IntegrityError, errores_mysql.ProgrammingError)):
+        return True
+    # Errores del servidor sin clase específica (ej. 1366); los 2xxx son del cliente/conexión
+    return isinstance(error, errores_mysql.DatabaseError) and error.errno is not None and error.errno < 2000
+
+
+def encolar(registro: dict):
+    """Encola un registro; si la cola está llena va directo al spool"""
+    registro = {**registro, 'fecha': registro.get('fecha') or datetime.now().isoformat(sep=' ')}
+    try:
+        _cola.put_nowait(registro)
+        _sumar(encolados=1)
+    except queue.Full:
+        _a_spool([registro])
+        _sumar(desbordes=1)
+
+
+# ============= SPOOL =============
+
+def _archivo_spool() -> str:
+    return os.path.join(DIRECTORIO_SPOOL, f"auditoria_{os.getpid()}.ndjson")
+
+
+def _a_spool(registros: list):
+    with _lock_spool:
+        os.makedirs(DIRECTORIO_SPOOL, exist_ok=True)
+        with open(_archivo_spool(), 'a', encoding='utf-8') as archivo:
+            for registro in registros:
+                archivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+
+def _descartar(registro: dict, error: Exception):
+    with _lock_spool:
+        os.makedirs(DIRECTORIO_SPOOL, exist_ok=True)
+        with open(os.path.join(DIRECTORIO_SPOOL, "descartados.ndjson"), 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(
+                {'registro': registro, 'error': str(_error_mysql(error) or error)},
+                ensure_ascii=False, default=str
+            ) + "\n")
+    _sumar(descartados=1)
+
+
+def _escribir_fila_a_fila(lote: list) -> list:
+    """Escribe un lote rechazado fila por fila; las filas inválidas se descartan.
+
+    Devuelve las filas que quedaron sin escribir porque la base dejó de responder.
+    """
+    for i, registro in enumerate(lote):
+        try:
+            with transaccion() as cursor:
+                insertar(cursor, [registro])
+        except Exception as e:
+            if not _es_error_de_datos(e):
+                return lote[i:]
+            print(f"Auditoría: registro descartado ({_error_mysql(e)})")
+            _descartar(registro, e)
+            continue
+        _sumar(escritos=1)
+    return []
+
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _archivos_propios() -> list:
+    """Spool de este proceso y los que dejaron procesos que ya no existen"""
+    archivos = []
+    for ruta in glob.glob(os.path.join(DIRECTORIO_SPOOL, "auditoria_*.ndjson")):
+        try:
+            pid = int(os.path.basename(ruta)[len("auditoria_"):-len(".ndjson")])
+        except ValueError:
+            continue
+        if pid == os.getpid() or not _proceso_vivo(pid):
+            archivos.append(ruta)
+    return sorted(archivos)
+
+
+def _reinsertar_archivo(ruta: str) -> bool:
+    # Se toma el archivo renombrándolo; las escrituras nuevas crean otro
+    tomado = f"{ruta}.{os.getpid()}.reinsertando"
+    with _lock_spool:
+        try:
+            os.rename(ruta, tomado)
+        except FileNotFoundError:
+            return True
+
+    with open(tomado, encoding='utf-8') as archivo:
+        lineas = [l for l in archivo if l.strip()]
+
+    for i in range(0, len(lineas), TAMANO_LOTE):
+        lote = [json.loads(l) for l in lineas[i:i + TAMANO_LOTE]]
+        try:
+            with transaccion() as cursor:
+                insertar(cursor, lote)
+        except Exception as e:
+            pendientes = _escribir_fila_a_fila(lote) if _es_error_de_datos(e) else lote
+            if pendientes:
+                print(f"Spool de auditoría: la base sigue sin responder ({e})")
+                # Lo que falta vuelve al spool; lo anterior ya quedó escrito o descartado
+                _a_spool(pendientes + [json.loads(l) for l in lineas[i + TAMANO_LOTE:]])
+                os.remove(tomado)
+                return False
+            _sumar(reinsertados=len(lote), lotes=1)
+            continue
+        _sumar(reinsertados=len(lote), escritos=len(lote), lotes=1)
+
+    os.remove(tomado)
+    print(f"Spool de auditoría: {len(lineas)} registros reinsertados desde {os.path.basename(ruta)}")
+    return True
+
+
+def _reinsertar_spool():
+    global _bd_disponible, _proximo_reintento
+
+    _proximo_reintento = time.monotonic() + REINTENTO_SPOOL
+    for ruta in _archivos_propios():
+        if not _reinsertar_archivo(ruta):
+            _bd_disponible = False
+            return
+    _bd_disponible = True
+
+
+def _recuperar_tomados():
+    """Pasa al spool propio los archivos que un proceso caído dejó a medio reinsertar"""
+    for ruta in glob.glob(os.path.join(DIRECTORIO_SPOOL, "auditoria_*.ndjson.*.reinsertando")):
+        try:
+            pid = int(ruta.rsplit('.', 2)[1])
+        except ValueError:
+            continue
+        if _proceso_vivo(pid):
+            continue
+        with open(ruta, encoding='utf-8') as archivo:
+            registros = [json.loads(l) for l in archivo if l.strip()]
+        if registros:
+            _a_spool(registros)
+        os.remove(ruta)
+
+
+# ============= HILO ESCRITOR =============
+
+def _escribir_lote(lote: list):
+    global _bd_disponible, _proximo_reintento
+
+    # Mientras la base está caída todo va al spool, en orden
+    if not _bd_disponible:
+        _a_spool(lote)
+        return
+
+    inicio = time.monotonic()
+    try:
+        with transaccion() as cursor:
+            insertar(cursor, lote)
+        _sumar(escritos=len(lote))
+    except Exception as e:
+        # Datos inválidos: solo se pierden (al archivo de descartados) las filas culpables
+        pendientes = _escribir_fila_a_fila(lote) if _es_error_de_datos(e) else lote
+        if pendientes:
+            print(f"Error escribiendo auditoría, se guarda en spool: {getattr(e, 'detail', e)}")
+            _a_spool(pendientes)
+            _sumar(fallos_bd=1)
+            _bd_disponible = False
+            _proximo_reintento = time.monotonic() + REINTENTO_SPOOL
+            return
+
+    _sumar(lotes=1)
+    with _lock_metricas:
+        _metricas['ultimo_lote'] = {
+            'registros': len(lote),
+            'duracionMs': int((time.monotonic() - inicio) * 1000),
+            'fecha': datetime.now().isoformat()
+        }
+
+
+def _tomar_lote() -> list:
+    try:
+        lote = [_cola.get(timeout=ESPERA_LOTE)]
+    except queue.Empty:
+        return []
+
+    limite = time.monotonic() + ESPERA_LOTE
+    while len(lote) < TAMANO_LOTE:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        try:
+            lote.append(_cola.get(timeout=restante))
+        except queue.Empty:
+            break
+    return lote
+
+
+def _bucle():
+    while not (_detener.is_set() and _cola.empty()):
+        try:
+            lote = _tomar_lote()
+            if lote:
+                _escribir_lote(lote)
+            if time.monotonic() >= _proximo_reintento and _archivos_propios():
+                _reinsertar_spool()
+        except Exception as e:
+            print(f"Error en escritor de auditoría: {e}")
+            traceback.print_exc()
+            time.sleep(1)
+
+
+def metricas() -> dict:
+    """Estado de la cola y del spool (contrapresión)"""
+    pendiente_spool = 0
+    for ruta in glob.glob(os.path.join(DIRECTORIO_SPOOL, "auditoria_*")):
+        try:
+            pendiente_spool += os.path.getsize(ruta)
+        except OSError:
+            pass
+
+    with _lock_metricas:
+        datos = dict(_metricas)
+
+    en_cola = _cola.qsize()
+    return {
+        "enCola": en_cola,
+        "capacidad": CAPACIDAD,
+        "ocupacion": round(en_cola / CAPACIDAD * 100, 2),
+        "encolados": datos['encolados'],
+        "escritos": datos['escritos'],
+        "lotes": datos['lotes'],
+        "desbordes": datos['desbordes'],
+        "fallosBd": datos['fallos_bd'],
+        "reinsertados": datos['reinsertados'],
+        "descartados": datos['descartados'],
+        "baseDisponible": _bd_disponible,
+        "spoolBytes": pendiente_spool,
+        "ultimoLote": datos['ultimo_lote']
+    }
+
+
+def iniciar():
+    global _hilo
+    if _hilo and _hilo.is_alive():
+        return
+    _detener.clear()
+    try:
+        _recuperar_tomados()
+    except OSError as e:
+        print(f"No se pudo recuperar el spool de auditoría: {e}")
+    _hilo = threading.Thread(target=_bucle, name="escritor-auditoria", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    """Escribe lo que quede en la cola (o lo manda al spool) antes de salir"""
+    _detener.set()
+    if _hilo:
+        _hilo.join(timeout=10)
+    # Si el hilo no alcanzó a vaciar la cola, el resto va al spool
+    restantes = []
+    while not _cola.empty():
+        restantes.append(_cola.get_nowait())
+    if restantes:
+        _a_spool(restantes)
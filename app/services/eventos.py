@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado (SSE o WebSocket)"""
+
+    def __init__(self, canal, filtro: dict, loop, tamano: int):
+        self.canal = canal
+        self.filtro = filtro
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=tamano)
+
+    def acepta(self, evento: dict) -> bool:
+        datos = evento['datos']
+        return all(datos.get(campo) == valor for campo, valor in self.filtro.items())
+
+    def _entregar(self, evento: dict):
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # El cliente va atrasado; puede reanudar con el último id recibido
+            pass
+
+    async def siguiente(self, timeout: float) -> Optional[dict]:
+        """Espera el próximo evento; None si se cumple el timeout"""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def cerrar(self):
+        self.canal._quitar(self)
+
+
+class CanalEventos:
+    """Canal pub/sub en proceso con historial para reanudar desde un id"""
+
+    def __init__(self, historial: int = 1000):
+        self._lock = threading.Lock()
+        self._ultimo_id = 0
+        self._historial = deque(maxlen=historial)
+        self._suscriptores = set()
+        self._oyentes = []
+
+    def agregar_oyente(self, funcion):
+        """Registra una función que recibe cada evento en el hilo que publica"""
+        self._oyentes.append(funcion)
+
+    def publicar(self, tipo: str, datos: dict) -> dict:
+        """Publica un evento; se puede llamar desde cualquier hilo"""
+        with self._lock:
+            self._ultimo_id += 1
+            evento = {
+                'id': self._ultimo_id,
+                'tipo': tipo,
+                'fecha': datetime.now().isoformat(),
+                'datos': datos
+            }
+            self._historial.append(evento)
+            destinos = [s for s in self._suscriptores if s.acepta(evento)]
+
+        for oyente in self._oyentes:
+            try:
+                oyente(evento)
+            except Exception as e:
+                print(f"Error en oyente de eventos: {e}")
+
+        for suscripcion in destinos:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, evento)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self._quitar(suscripcion)
+
+        return evento
+
+    def suscribir(self, filtro: dict, desde_id: Optional[int] = None) -> Suscripcion:
+        """Registra un suscriptor; debe llamarse desde el loop de asyncio.
+
+        Si se indica desde_id, primero se reenvían los eventos posteriores
+        que sigan en el historial.
+        """
+        suscripcion = Suscripcion(self, filtro, asyncio.get_running_loop(), self._historial.maxlen + 100)
+
+        with self._lock:
+            if desde_id is not None:
+                if self._historial and desde_id < self._historial[0]['id'] - 1:
+                    # Se perdieron eventos: el cliente debe volver a consultar
+                    suscripcion._entregar({
+                        'id': self._ultimo_id,
+                        'tipo': 'resincronizar',
+                        'fecha': datetime.now().isoformat(),
+                        'datos': {}
+                    })
+                for evento in self._historial:
+                    if evento['id'] > desde_id and suscripcion.acepta(evento):
+                        suscripcion._entregar(evento)
+            self._suscriptores.add(suscripcion)
+
+        return suscripcion
+
+    def _quitar(self, suscripcion: Suscripcion):
+        with self._lock:
+            self._suscriptores.discard(suscripcion)
+
+
+# Cambios de estado de pedidos
+canal_pedidos = CanalEventos()
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from fastapi.responses import StreamingResponse
+from mysql.connector import Error
+
+from app.config.database import get_db
+
+# Exportación en streaming (CSV o NDJSON) leída con cursor del lado del servidor.
+# El rango de fechas se recorre en bloques: cada bloque usa su propia conexión
+# en autocommit, así ninguna lectura mantiene una transacción larga abierta.
+
+DIAS_BLOQUE = 7
+FILAS_FETCH = 1000
+TAMANO_ENVIO = 64 * 1024
+FORMATOS = ('csv', 'ndjson')
+
+
+def bloques_fecha(desde: date, hasta: date, dias: int = DIAS_BLOQUE):
+    """Divide [desde, hasta] (días completos) en intervalos [inicio, fin) de datetime"""
+    inicio = datetime.combine(desde, datetime.min.time())
+    limite = datetime.combine(hasta + timedelta(days=1), datetime.min.time())
+    while inicio < limite:
+        fin = min(inicio + timedelta(days=dias), limite)
+        yield inicio, fin
+        inicio = fin
+
+
+def _leer_bloque(query: str, params: dict):
+    conn = get_db()
+    conn.autocommit = True
+    # Cursor sin buffer: las filas se leen del servidor a medida que se consumen
+    cursor = conn.cursor(dictionary=True)
+    terminado = False
+    try:
+        cursor.execute(query, params)
+        while True:
+            filas = cursor.fetchmany(FILAS_FETCH)
+            if not filas:
+                break
+            yield from filas
+        terminado = True
+    finally:
+        if terminado:
+            cursor.close()
+            conn.close()
+        else:
+            # Cliente desconectado o error a medio resultado: cortar sin leer el resto
+            try:
+                conn.shutdown()
+            except Error:
+                pass
+
+
+def filas_por_rangos(query: str, desde: date, hasta: date, params: dict = None, dias: int = DIAS_BLOQUE):
+    """Ejecuta la consulta por bloques de fechas y produce las filas en orden.
+
+    La consulta recibe los límites de cada bloque como %(desde)s y %(hasta)s.
+    """
+    for inicio, fin in bloques_fecha(desde, hasta, dias):
+        yield from _leer_bloque(query, {**(params or {}), 'desde': inicio, 'hasta': fin})
+
+
+def valor_plano(valor):
+    """Valor de una fila de MySQL convertido a tipos de JSON/CSV"""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (bytes, bytearray)):
+        return valor.decode('utf-8', errors='replace')
+    return valor
+
+
+def _a_csv(filas, columnas: list):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow([valor_plano(fila.get(c)) for c in columnas])
+        if buffer.tell() >= TAMANO_ENVIO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _a_ndjson(filas, columnas: list):
+    partes = []
+    tamano = 0
+    for fila in filas:
+        linea = json.dumps({c: valor_plano(fila.get(c)) for c in columnas}, ensure_ascii=False) + "\n"
+        partes.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_ENVIO:
+            yield "".join(partes).encode('utf-8')
+            partes = []
+            tamano = 0
+    yield "".join(partes).encode('utf-8')
+
+
+def _gzip(bloques):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = formato gzip
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def respuesta(filas, columnas: list, formato: str, nombre: str, comprimir: bool = False) -> StreamingResponse:
+    """Respuesta en streaming con las filas en CSV o NDJSON, opcionalmente en gzip"""
+    if formato == 'csv':
+        contenido = _a_csv(filas, columnas)
+        media_type = 'text/csv; charset=utf-8'
+    else:
+        contenido = _a_ndjson(filas, columnas)
+        media_type = 'application/x-ndjson'
+
+    archivo = f"{nombre}.{formato}"
+    if comprimir:
+        contenido = _gzip(contenido)
+        media_type = 'application/gzip'
+        archivo += '.gz'
+
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{archivo}"'}
+    )
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import time
+
+
+class _Entrada:
+    def __init__(self, huella: str, expira: float):
+        self.huella = huella
+        self.expira = expira
+        self.evento = asyncio.Event()
+        self.respuesta = None  # (status, headers, body) cuando termina
+
+
+class IdempotenciaMiddleware:
+    """Soporte del header Idempotency-Key para POSTs de pago y checkout.
+
+    Un reintento con la misma clave recibe la respuesta guardada sin volver
+    a ejecutar el endpoint. Si el original sigue en curso, el duplicado
+    espera a que termine. Las respuestas 5xx no se guardan para permitir
+    reintentar.
+    """
+
+    def __init__(self, app, rutas: list, ttl: int = 24 * 3600, espera_maxima: float = 30):
+        self.app = app
+        self.rutas = set(rutas)
+        self.ttl = ttl
+        self.espera_maxima = espera_maxima
+        self._entradas = {}
+        self._proxima_purga = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] not in self.rutas:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope['headers'])
+        clave = headers.get(b'idempotency-key')
+        if not clave:
+            return await self.app(scope, receive, send)
+
+        body = await self._leer_body(receive)
+        huella = hashlib.sha256(body).hexdigest()
+        # La clave se aplica por ruta y por usuario
+        id_clave = (scope['path'], headers.get(b'usuario-id', b''), clave)
+
+        while True:
+            self._purgar()
+            entrada = self._entradas.get(id_clave)
+
+            if entrada is None:
+                entrada = _Entrada(huella, time.monotonic() + self.ttl)
+                self._entradas[id_clave] = entrada
+                break
+
+            if entrada.huella != huella:
+                return await self._enviar_json(send, 422, {
+                    "detail": "Idempotency-Key ya usada con otro contenido"
+                })
+
+            if entrada.respuesta is not None:
+                return await self._repetir(send, entrada.respuesta)
+
+            # Duplicado concurrente: esperar al original
+            try:
+                await asyncio.wait_for(entrada.evento.wait(), self.espera_maxima)
+            except asyncio.TimeoutError:
+                return await self._enviar_json(send, 409, {
+                    "detail": "La solicitud original sigue en proceso"
+                })
+
+        await self._ejecutar(scope, receive, send, body, id_clave, entrada)
+
+    async def _ejecutar(self, scope, receive, send, body, id_clave, entrada):
+        capturado = {'status': 500, 'headers': [], 'body': []}
+        body_enviado = False
+
+        async def receive_repetido():
+            nonlocal body_enviado
+            if not body_enviado:
+                body_enviado = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        async def send_capturando(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                capturado['status'] = mensaje['status']
+                capturado['headers'] = list(mensaje.get('headers', []))
+            elif mensaje['type'] == 'http.response.body':
+                capturado['body'].append(mensaje.get('body', b''))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive_repetido, send_capturando)
+        except BaseException:
+            self._entradas.pop(id_clave, None)
+            entrada.evento.set()
+            raise
+
+        if capturado['status'] < 500:
+            entrada.respuesta = (capturado['status'], capturado['headers'], b''.join(capturado['body']))
+        else:
+            self._entradas.pop(id_clave, None)
+        entrada.evento.set()
+
+    async def _leer_body(self, receive) -> bytes:
+        partes = []
+        while True:
+            mensaje = await receive()
+            partes.append(mensaje.get('body', b''))
+            if not mensaje.get('more_body'):
+                return b''.join(partes)
+
+    async def _repetir(self, send, respuesta):
+        status, headers, body = respuesta
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers + [(b'idempotent-replayed', b'true')]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _enviar_json(self, send, status: int, contenido: dict):
+        body = json.dumps(contenido).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _purgar(self):
+        ahora = time.monotonic()
+        if ahora < self._proxima_purga:
+            return
+        self._proxima_purga = ahora + 60
+        vencidas = [k for k, e in self._entradas.items() if e.expira < ahora and e.respuesta is not None]
+        for k in vencidas:
+            del self._entradas[k]
@@ -0,0 +1,99 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from app.config.database import execute_query
+from app.services.eventos import canal_pedidos
+
+# Contadores en memoria para /reportes/metricas.
+# Se actualizan con los eventos de pedidos y productos, y se reconcilian
+# contra la base de datos cada INTERVALO_RECONCILIACION segundos o al cambiar el día.
+
+INTERVALO_RECONCILIACION = 60
+ESTADOS_ACTIVOS = ('confirmado', 'en_preparacion', 'listo', 'pendiente')
+
+_lock = threading.Lock()
+_lock_reconciliacion = threading.Lock()
+_estado = {
+    'fecha': None,
+    'pedidos_hoy': 0,
+    'ventas_hoy': 0.0,
+    'pedidos_activos': 0,
+    'productos_total': 0,
+    'productos_disponibles': 0,
+    'reconciliado': 0.0
+}
+
+
+def reconciliar():
+    """Recalcula todos los contadores desde la base de datos"""
+    hoy = date.today()
+    manana = hoy + timedelta(days=1)
+    placeholders = ", ".join(["%s"] * len(ESTADOS_ACTIVOS))
+
+    query = f"""
+        SELECT 
+            (SELECT COUNT(*) FROM pedidos
+             WHERE fecha_creacion >= %s AND fecha_creacion < %s AND estado = 'completado') as pedidos_hoy,
+            (SELECT COALESCE(SUM(total), 0) FROM pedidos
+             WHERE fecha_creacion >= %s AND fecha_creacion < %s AND estado = 'completado') as ventas_hoy,
+            (SELECT COUNT(*) FROM pedidos WHERE estado IN ({placeholders})) as pedidos_activos,
+            (SELECT COUNT(*) FROM productos) as productos_total,
+            (SELECT COALESCE(SUM(CASE WHEN disponible = TRUE THEN 1 ELSE 0 END), 0) FROM productos) as productos_disponibles
+    """
+    fila = execute_query(query, (hoy, manana, hoy, manana, *ESTADOS_ACTIVOS))[0]
+
+    with _lock:
+        _estado.update({
+            'fecha': hoy,
+            'pedidos_hoy': int(fila['pedidos_hoy']),
+            'ventas_hoy': float(fila['ventas_hoy']),
+            'pedidos_activos': int(fila['pedidos_activos']),
+            'productos_total': int(fila['productos_total']),
+            'productos_disponibles': int(fila['productos_disponibles']),
+            'reconciliado': time.monotonic()
+        })
+
+
+def _vencido() -> bool:
+    return (_estado['fecha'] != date.today()
+            or time.monotonic() - _estado['reconciliado'] > INTERVALO_RECONCILIACION)
+
+
+def obtener() -> dict:
+    """Copia de los contadores; reconcilia si están vencidos"""
+    if _vencido():
+        # Una sola petición reconcilia; las demás esperan el resultado
+        with _lock_reconciliacion:
+            if _vencido():
+                reconciliar()
+
+    with _lock:
+        return dict(_estado)
+
+
+def cambio_producto(delta_total: int = 0, delta_disponibles: int = 0):
+    with _lock:
+        _estado['productos_total'] += delta_total
+        _estado['productos_disponibles'] += delta_disponibles
+
+
+def _al_cambiar_estado(evento: dict):
+    datos = evento['datos']
+    anterior = datos.get('estado_anterior')
+    nuevo = datos.get('estado')
+
+    with _lock:
+        if _estado['fecha'] is None:
+            return
+
+        _estado['pedidos_activos'] += (nuevo in ESTADOS_ACTIVOS) - (anterior in ESTADOS_ACTIVOS)
+
+        fecha_creacion = datos.get('fecha_creacion')
+        if (nuevo == 'completado' and fecha_creacion
+                and fecha_creacion[:10] == _estado['fecha'].isoformat()):
+            _estado['pedidos_hoy'] += 1
+            _estado['ventas_hoy'] += float(datos.get('total') or 0)
+
+
+canal_pedidos.agregar_oyente(_al_cambiar_estado)
@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from app.config.database import TAMANO_POOL_LECTURA
+
+# Ejecución en paralelo de subconsultas de reportes (por sucursal o por rango de
+# fechas) sobre el pool de lectura. El pool de hilos es compartido y acotado para
+# que varios reportes simultáneos no agoten las conexiones.
+
+MAX_HILOS = int(os.getenv('REPORTES_HILOS', min(8, TAMANO_POOL_LECTURA)))
+
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="reporte")
+
+
+def repartir(funcion, particiones: list) -> list:
+    """Aplica funcion a cada partición en paralelo; resultados en el mismo orden.
+
+    Si alguna falla, se propaga la primera excepción. funcion no debe llamar
+    a repartir a su vez (los hilos del pool quedarían esperándose entre sí).
+    """
+    if len(particiones) <= 1:
+        return [funcion(p) for p in particiones]
+
+    futuros = [_ejecutor.submit(funcion, p) for p in particiones]
+    return [f.result() for f in futuros]
+
+
+def rangos_fecha(desde: date, hasta: date, partes: int) -> list:
+    """Divide [desde, hasta] en hasta `partes` rangos contiguos [(inicio, fin)] inclusivos"""
+    dias = (hasta - desde).days + 1
+    partes = max(1, min(partes, dias))
+    tamano, sobrante = divmod(dias, partes)
+
+    rangos = []
+    inicio = desde
+    for i in range(partes):
+        fin = inicio + timedelta(days=tamano + (1 if i < sobrante else 0) - 1)
+        rangos.append((inicio, fin))
+        inicio = fin + timedelta(days=1)
+    return rangos
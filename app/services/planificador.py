@@ -0,0 +1,282 @@
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config.database import execute_query, get_db
+
+# Planificador de tareas periódicas en proceso.
+# Cada tarea tiene una expresión tipo cron (minuto hora día mes día_semana) y un
+# jitter aleatorio. Las tareas marcadas como únicas toman un GET_LOCK de MySQL para
+# que solo un worker las ejecute; las demás corren en cada proceso (cachés locales).
+
+INTERVALO = 1.0
+MAX_HILOS = 4
+HISTORIAL = 50
+INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"
+
+_tareas = {}
+_detener = threading.Event()
+_hilo = None
+_ejecutor = None
+
+
+class Cron:
+    """Expresión cron de 5 campos: minuto hora día mes día_semana (0 o 7 = domingo)"""
+
+    CAMPOS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expresion: str):
+        partes = expresion.split()
+        if len(partes) != 5:
+            raise ValueError(f"Expresión cron inválida: {expresion}")
+
+        self.expresion = expresion
+        valores = [self._campo(p, *rango) for p, rango in zip(partes, self.CAMPOS)]
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = valores
+        self.dias_semana = {d % 7 for d in dias_semana}
+        self.dia_libre = partes[2] == '*'
+        self.dia_semana_libre = partes[4] == '*'
+
+    @staticmethod
+    def _campo(texto: str, minimo: int, maximo: int) -> set:
+        valores = set()
+        for parte in texto.split(','):
+            rango, _, paso = parte.partition('/')
+            paso = int(paso) if paso else 1
+            if rango == '*':
+                inicio, fin = minimo, maximo
+            elif '-' in rango:
+                inicio, fin = (int(x) for x in rango.split('-'))
+            else:
+                inicio = int(rango)
+                fin = maximo if paso > 1 else inicio
+            if inicio < minimo or fin > maximo or inicio > fin or paso < 1:
+                raise ValueError(f"Campo cron fuera de rango: {parte}")
+            valores.update(range(inicio, fin + 1, paso))
+        return valores
+
+    def _coincide_dia(self, fecha: datetime) -> bool:
+        dia_semana = (fecha.weekday() + 1) % 7  # cron: domingo = 0
+        if self.dia_libre:
+            return self.dia_semana_libre or dia_semana in self.dias_semana
+        if self.dia_semana_libre:
+            return fecha.day in self.dias
+        # Como en cron: si ambos campos están restringidos basta con uno
+        return fecha.day in self.dias or dia_semana in self.dias_semana
+
+    def siguiente(self, desde: datetime) -> datetime:
+        """Próximo instante (al minuto) posterior a desde que cumple la expresión"""
+        fecha = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = fecha + timedelta(days=366 * 5)
+
+        while fecha < limite:
+            if fecha.month not in self.meses:
+                anio, mes = (fecha.year + 1, 1) if fecha.month == 12 else (fecha.year, fecha.month + 1)
+                fecha = fecha.replace(year=anio, month=mes, day=1, hour=0, minute=0)
+                continue
+            if not self._coincide_dia(fecha):
+                fecha = (fecha + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if fecha.hour not in self.horas:
+                fecha = (fecha + timedelta(hours=1)).replace(minute=0)
+                continue
+            if fecha.minute not in self.minutos:
+                fecha += timedelta(minutes=1)
+                continue
+            return fecha
+
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expresion}")
+
+
+class Tarea:
+    def __init__(self, nombre: str, cron: str, funcion, jitter: float, unica: bool):
+        self.nombre = nombre
+        self.cron = Cron(cron)
+        self.funcion = funcion
+        self.jitter = jitter
+        self.unica = unica
+        self.proxima = None
+        self.en_curso = False
+        self.ejecuciones = 0
+        self.fallos = 0
+        self.omitidas = 0
+        self.ultima = None
+        self.historial = deque(maxlen=HISTORIAL)
+
+    def programar(self, desde: datetime):
+        self.proxima = self.cron.siguiente(desde) + timedelta(seconds=random.uniform(0, self.jitter))
+
+    def resumen(self) -> dict:
+        duraciones = [e['duracionMs'] for e in self.historial if e['estado'] != 'omitida']
+        return {
+            "nombre": self.nombre,
+            "cron": self.cron.expresion,
+            "jitter": self.jitter,
+            "unica": self.unica,
+            "enCurso": self.en_curso,
+            "proxima": self.proxima.isoformat() if self.proxima else None,
+            "ejecuciones": self.ejecuciones,
+            "fallos": self.fallos,
+            "omitidas": self.omitidas,
+            "ultima": self.ultima,
+            "duracionPromedioMs": round(sum(duraciones) / len(duraciones)) if duraciones else None,
+            "duracionMaximaMs": max(duraciones) if duraciones else None
+        }
+
+
+def tarea(nombre: str, cron: str, jitter: float = 0, unica: bool = False):
+    """Registra una función como tarea periódica.
+
+    unica=True: un solo worker la ejecuta a la vez (GET_LOCK de MySQL).
+    """
+    def decorador(funcion):
+        _tareas[nombre] = Tarea(nombre, cron, funcion, jitter, unica)
+        return funcion
+    return decorador
+
+
+def _con_bloqueo(nombre: str, funcion) -> bool:
+    """Ejecuta funcion si este proceso obtiene el lock; False si otro lo tiene"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (f"planificador:{nombre}",))
+        if cursor.fetchone()[0] != 1:
+            return False
+        try:
+            funcion()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (f"planificador:{nombre}",))
+            cursor.fetchone()
+        return True
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _registrar(t: Tarea, inicio: datetime, duracion_ms: int, estado: str, error: Optional[str]):
+    entrada = {
+        "inicio": inicio.isoformat(),
+        "duracionMs": duracion_ms,
+        "estado": estado,
+        "error": error
+    }
+    t.historial.append(entrada)
+    t.ultima = entrada
+
+    # En la tabla quedan las tareas únicas y los fallos; las locales frecuentes
+    # (cachés por proceso) solo se guardan en memoria
+    if estado == 'omitida' or (not t.unica and estado != 'fallida'):
+        return
+    try:
+        execute_query("""
+            INSERT INTO planificador_ejecuciones (tarea, instancia, inicio, duracion_ms, estado, error)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (t.nombre, INSTANCIA, inicio, duracion_ms, estado, error), fetch=False)
+    except Exception as e:
+        print(f"No se pudo guardar la ejecución de {t.nombre}: {e}")
+
+
+def ejecutar(t: Tarea):
+    """Ejecuta una tarea ahora y registra el resultado"""
+    inicio = datetime.now()
+    reloj = time.monotonic()
+    estado, error = 'completada', None
+
+    try:
+        if t.unica:
+            if not _con_bloqueo(t.nombre, t.funcion):
+                estado = 'omitida'
+        else:
+            t.funcion()
+    except Exception as e:
+        estado, error = 'fallida', str(getattr(e, 'detail', e))[:1000]
+        print(f"Error en tarea {t.nombre}: {error}")
+        traceback.print_exc()
+    finally:
+        t.en_curso = False
+
+    if estado == 'completada':
+        t.ejecuciones += 1
+    elif estado == 'fallida':
+        t.fallos += 1
+    else:
+        t.omitidas += 1
+
+    _registrar(t, inicio, int((time.monotonic() - reloj) * 1000), estado, error)
+    return estado
+
+
+def lanzar(nombre: str) -> bool:
+    """Envía una tarea al pool; False si ya está en curso"""
+    t = _tareas[nombre]
+    if t.en_curso:
+        return False
+    t.en_curso = True
+    if _ejecutor is None:
+        threading.Thread(target=ejecutar, args=(t,), name=f"tarea-{nombre}", daemon=True).start()
+    else:
+        _ejecutor.submit(ejecutar, t)
+    return True
+
+
+def _bucle():
+    ahora = datetime.now()
+    for t in _tareas.values():
+        t.programar(ahora)
+
+    while not _detener.is_set():
+        ahora = datetime.now()
+        for t in _tareas.values():
+            if t.proxima <= ahora:
+                # Si la ejecución anterior sigue en curso, se salta este turno
+                lanzar(t.nombre)
+                t.programar(ahora)
+        _detener.wait(INTERVALO)
+
+
+def tareas() -> list:
+    return [t.resumen() for t in _tareas.values()]
+
+
+def obtener(nombre: str) -> Optional[Tarea]:
+    return _tareas.get(nombre)
+
+
+def iniciar():
+    global _hilo, _ejecutor
+    if _hilo and _hilo.is_alive():
+        return
+    _detener.clear()
+    _ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="tarea")
+    _hilo = threading.Thread(target=_bucle, name="planificador", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    global _ejecutor
+    _detener.set()
+    if _hilo:
+        _hilo.join(timeout=5)
+    if _ejecutor:
+        _ejecutor.shutdown(wait=False, cancel_futures=True)
+        _ejecutor = None
+
+
+DIAS_HISTORIAL = 30
+
+
+@tarea('planificador.purgar', '15 4 * * *', jitter=300, unica=True)
+def purgar_historial():
+    """Elimina el historial de ejecuciones más antiguo que DIAS_HISTORIAL"""
+    execute_query(
+        "DELETE FROM planificador_ejecuciones WHERE inicio < NOW() - INTERVAL %s DAY",
+        (DIAS_HISTORIAL,), fetch=False
+    )
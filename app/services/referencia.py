@@ -0,0 +1,197 @@
+import os
+from bisect import bisect_right
+from datetime import date
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from app.config.database import execute_query
+from app.services.cache import CacheTTL
+
+# Datos de referencia: tablas pequeñas que cambian poco y se leen en muchas
+# peticiones (categorías, sucursales, horarios, condiciones de salud, recompensas
+# y cupones activos no vencidos). Se cargan completas en estructuras inmutables y
+# se recargan cuando vence el TTL o cuando alguien llama a invalidar().
+
+TTL = int(os.getenv('REFERENCIA_TTL', 120))
+
+Fila = Mapping[str, object]
+
+_cache = CacheTTL(ttl=TTL)
+
+
+def _congelar(filas: list) -> Tuple[Fila, ...]:
+    return tuple(MappingProxyType(dict(f)) for f in filas)
+
+
+def _por_clave(filas: tuple, clave) -> Mapping:
+    return MappingProxyType({clave(f): f for f in filas})
+
+
+# ============= CARGA =============
+
+def _cargar_categorias():
+    filas = _congelar(execute_query("SELECT * FROM categorias ORDER BY nombre ASC"))
+    return filas, _por_clave(filas, lambda f: f['id'])
+
+
+def _cargar_sucursales():
+    filas = _congelar(execute_query("SELECT * FROM sucursales WHERE activa = TRUE ORDER BY orden ASC"))
+    return filas, _por_clave(filas, lambda f: f['id'])
+
+
+def _cargar_horarios():
+    filas = _congelar(execute_query("""
+        SELECT * FROM horarios_disponibles
+        WHERE activo = TRUE
+        ORDER BY sucursal_id, hora_inicio
+    """))
+    por_dia = {}
+    for f in filas:
+        por_dia.setdefault((f['sucursal_id'], f['dia_semana']), []).append(f)
+    return MappingProxyType({clave: tuple(v) for clave, v in por_dia.items()})
+
+
+def _cargar_condiciones_salud():
+    filas = _congelar(execute_query("SELECT * FROM condiciones_salud ORDER BY nombre ASC"))
+    return filas, _por_clave(filas, lambda f: f['id'])
+
+
+def _cargar_recompensas():
+    filas = _congelar(execute_query("""
+        SELECT * FROM recompensas
+        WHERE activa = TRUE
+        ORDER BY puntos_requeridos ASC
+    """))
+    return filas, _por_clave(filas, lambda f: f['id'])
+
+
+def normalizar_codigo(codigo: str) -> str:
+    """Misma normalización que la columna cupones.codigo_normalizado"""
+    return codigo.strip().upper()
+
+
+def _indexar_cupones(filas: tuple):
+    # Índice por fecha de inicio: los vigentes en un día son un prefijo de esta lista
+    por_inicio = tuple(sorted(filas, key=lambda f: f['fecha_inicio']))
+    inicios = tuple(f['fecha_inicio'] for f in por_inicio)
+    return filas, _por_clave(filas, lambda f: normalizar_codigo(f['codigo'])), por_inicio, inicios
+
+
+def _cargar_cupones():
+    # Solo los que no han vencido: los cupones personales de un solo uso se acumulan
+    return _indexar_cupones(_congelar(execute_query("""
+        SELECT * FROM cupones
+        WHERE activo = TRUE AND fecha_fin >= CURDATE()
+    """)))
+
+
+_CARGAS = {
+    'categorias': _cargar_categorias,
+    'sucursales': _cargar_sucursales,
+    'horarios': _cargar_horarios,
+    'condiciones_salud': _cargar_condiciones_salud,
+    'recompensas': _cargar_recompensas,
+    'cupones': _cargar_cupones,
+}
+
+
+def _tabla(nombre: str):
+    return _cache.obtener(nombre, _CARGAS[nombre])
+
+
+def cargar():
+    """Carga todas las tablas de referencia (al iniciar la aplicación)"""
+    for nombre in _CARGAS:
+        _tabla(nombre)
+
+
+def invalidar(tabla: Optional[str] = None):
+    """Fuerza la recarga de una tabla, o de todas, en el próximo acceso"""
+    _cache.invalidar(tabla)
+
+
+# ============= ACCESO =============
+
+def categorias() -> Tuple[Fila, ...]:
+    return _tabla('categorias')[0]
+
+
+def categoria(categoria_id: int) -> Optional[Fila]:
+    return _tabla('categorias')[1].get(categoria_id)
+
+
+def sucursales() -> Tuple[Fila, ...]:
+    """Sucursales activas en su orden de presentación"""
+    return _tabla('sucursales')[0]
+
+
+def sucursal(sucursal_id: int) -> Optional[Fila]:
+    """Sucursal activa por id"""
+    return _tabla('sucursales')[1].get(sucursal_id)
+
+
+def horarios(sucursal_id: int, dia_semana: str) -> Tuple[Fila, ...]:
+    """Horarios activos de una sucursal para un día de la semana, por hora de inicio"""
+    return _tabla('horarios').get((sucursal_id, dia_semana), ())
+
+
+def horarios_sucursal(sucursal_id: int) -> Mapping[str, Tuple[Fila, ...]]:
+    """Plantilla semanal de una sucursal: {dia_semana: horarios}"""
+    return MappingProxyType({
+        dia: filas for (sucursal, dia), filas in _tabla('horarios').items() if sucursal == sucursal_id
+    })
+
+
+def sucursales_con_horarios() -> frozenset:
+    return frozenset(sucursal for sucursal, _ in _tabla('horarios'))
+
+
+def condiciones_salud() -> Tuple[Fila, ...]:
+    return _tabla('condiciones_salud')[0]
+
+
+def condicion_salud(condicion_id: int) -> Optional[Fila]:
+    return _tabla('condiciones_salud')[1].get(condicion_id)
+
+
+def recompensas() -> Tuple[Fila, ...]:
+    """Recompensas activas por puntos requeridos"""
+    return _tabla('recompensas')[0]
+
+
+def recompensa(recompensa_id: int) -> Optional[Fila]:
+    return _tabla('recompensas')[1].get(recompensa_id)
+
+
+def cupones() -> Tuple[Fila, ...]:
+    """Cupones activos que no han vencido, hayan empezado o no"""
+    return _tabla('cupones')[0]
+
+
+def cupones_vigentes(hoy: Optional[date] = None) -> Tuple[Fila, ...]:
+    hoy = hoy or date.today()
+    _, _, por_inicio, inicios = _tabla('cupones')
+    return tuple(c for c in por_inicio[:bisect_right(inicios, hoy)] if c['fecha_fin'] >= hoy)
+
+
+def cupon_vigente(codigo: str, hoy: Optional[date] = None) -> Optional[Fila]:
+    """Cupón activo y dentro de sus fechas, por código sin distinguir mayúsculas"""
+    hoy = hoy or date.today()
+    codigo = normalizar_codigo(codigo)
+    cupon = _tabla('cupones')[1].get(codigo)
+
+    if cupon is None:
+        # Puede ser un cupón creado después de la última carga
+        encontrado = execute_query("""
+            SELECT * FROM cupones
+            WHERE codigo_normalizado = %s AND activo = TRUE AND fecha_fin >= CURDATE()
+        """, (codigo,))
+        if not encontrado:
+            return None
+        cupon = MappingProxyType(dict(encontrado[0]))
+        # Se agrega al registro actual en lugar de recargarlo completo
+        _cache.reemplazar('cupones', _indexar_cupones(_tabla('cupones')[0] + (cupon,)))
+
+    if cupon['fecha_inicio'] <= hoy <= cupon['fecha_fin']:
+        return cupon
+    return None
@@ -0,0 +1,199 @@
+import gzip
+import json
+import os
+import re
+from datetime import date, timedelta
+
+from app.config.database import execute_query, transaccion
+from app.services import exportacion
+
+# Retención de la tabla auditoria, particionada por mes (migración 009).
+# Las particiones más antiguas que MESES_RETENCION se exportan a
+# auditoria_YYYYMM.ndjson.gz en DIRECTORIO_ARCHIVO, se indexan por
+# (tabla, registro_Id) en auditoria_archivo_indice y se eliminan. Cada registro
+# ocupa un tramo propio del archivo (miembro gzip) cuya posición guarda el índice.
+
+MESES_RETENCION = int(os.getenv('AUDITORIA_MESES_RETENCION', 12))
+MESES_ADELANTE = 2
+# Largo de auditoria_archivo_indice.tabla (migración 016), igual que auditoria_resumen.clave
+LARGO_TABLA = 255
+LOTE_INDICE = 1000
+DIRECTORIO_ARCHIVO = os.getenv('AUDITORIA_ARCHIVO_DIR', os.path.join('archivo', 'auditoria'))
+
+_PARTICION_MENSUAL = re.compile(r'^p(\d{4})(\d{2})$')
+
+
+def _sumar_meses(fecha: date, meses: int) -> date:
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _particiones() -> list:
+    """Particiones mensuales existentes: [(nombre, primer día del mes)] en orden"""
+    filas = execute_query("""
+        SELECT PARTITION_NAME as nombre
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'auditoria'
+        AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    mensuales = []
+    for fila in filas:
+        coincide = _PARTICION_MENSUAL.match(fila['nombre'])
+        if coincide:
+            mensuales.append((fila['nombre'], date(int(coincide.group(1)), int(coincide.group(2)), 1)))
+    return mensuales
+
+
+def asegurar_particiones() -> int:
+    """Divide pmax en particiones mensuales hasta MESES_ADELANTE meses en el futuro"""
+    mensuales = _particiones()
+    hoy = date.today().replace(day=1)
+
+    if mensuales:
+        desde = _sumar_meses(mensuales[-1][1], 1)
+    else:
+        # Primera vez: desde el mes del registro más antiguo
+        primero = execute_query("SELECT MIN(fecha) as primero FROM auditoria")[0]['primero']
+        desde = primero.date().replace(day=1) if primero else hoy
+
+    hasta = _sumar_meses(hoy, MESES_ADELANTE)
+    meses = []
+    mes = desde
+    while mes <= hasta:
+        meses.append(mes)
+        mes = _sumar_meses(mes, 1)
+
+    if not meses:
+        return 0
+
+    definiciones = [
+        f"PARTITION p{m:%Y%m} VALUES LESS THAN (TO_DAYS('{_sumar_meses(m, 1).isoformat()}'))"
+        for m in meses
+    ]
+    definiciones.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    execute_query(
+        f"ALTER TABLE auditoria REORGANIZE PARTITION pmax INTO ({', '.join(definiciones)})",
+        fetch=False
+    )
+    print(f"Auditoría: {len(meses)} particiones mensuales nuevas")
+    return len(meses)
+
+
+def _escribir_grupo(salida, lineas: list) -> tuple:
+    """Escribe un miembro gzip independiente; devuelve (desplazamiento, largo) en bytes"""
+    datos = gzip.compress("".join(lineas).encode('utf-8'))
+    desplazamiento = salida.tell()
+    salida.write(datos)
+    return desplazamiento, len(datos)
+
+
+def _archivar_particion(nombre: str, mes: date) -> int:
+    os.makedirs(DIRECTORIO_ARCHIVO, exist_ok=True)
+    archivo = f"auditoria_{mes:%Y%m}.ndjson.gz"
+    ruta = os.path.join(DIRECTORIO_ARCHIVO, archivo)
+    temporal = ruta + ".tmp"
+
+    # 1. Exportar en streaming, agrupado por registro: cada (tabla, registro_Id) es un
+    #    miembro gzip propio, así buscar_archivados lee y descomprime solo ese tramo.
+    #    El archivo completo sigue siendo un gzip válido (miembros concatenados).
+    #    Un solo bloque de fechas para que el orden por registro cubra todo el mes.
+    query = f"""
+        SELECT * FROM auditoria PARTITION ({nombre})
+        WHERE fecha >= %(desde)s AND fecha < %(hasta)s
+        ORDER BY COALESCE(tabla, ''), COALESCE(registro_Id, 0), fecha ASC, id ASC
+    """
+    fin_mes = _sumar_meses(mes, 1) - timedelta(days=1)
+    total = 0
+    entradas = []
+    clave, lineas, fechas = None, [], []
+    with open(temporal, 'wb') as salida:
+        for fila in exportacion.filas_por_rangos(query, mes, fin_mes, dias=(fin_mes - mes).days + 1):
+            actual = ((fila.get('tabla') or '')[:LARGO_TABLA], fila.get('registro_Id') or 0)
+            if actual != clave and lineas:
+                entradas.append((*clave, *_escribir_grupo(salida, lineas), min(fechas), max(fechas), len(lineas)))
+                lineas, fechas = [], []
+            clave = actual
+            lineas.append(json.dumps({c: exportacion.valor_plano(v) for c, v in fila.items()}, ensure_ascii=False) + "\n")
+            fechas.append(fila['fecha'])
+            total += 1
+        if lineas:
+            entradas.append((*clave, *_escribir_grupo(salida, lineas), min(fechas), max(fechas), len(lineas)))
+    # El archivo final aparece completo o no aparece
+    os.replace(temporal, ruta)
+
+    # 2. Índice por registro con la posición de su tramo en el archivo
+    with transaccion() as cursor:
+        for i in range(0, len(entradas), LOTE_INDICE):
+            cursor.executemany("""
+                INSERT INTO auditoria_archivo_indice
+                    (tabla, registro_Id, archivo, desplazamiento, largo, fecha_desde, fecha_hasta, total)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    desplazamiento = VALUES(desplazamiento),
+                    largo = VALUES(largo),
+                    fecha_desde = VALUES(fecha_desde),
+                    fecha_hasta = VALUES(fecha_hasta),
+                    total = VALUES(total)
+            """, [(t, r, archivo, d, l, f1, f2, n) for t, r, d, l, f1, f2, n in entradas[i:i + LOTE_INDICE]])
+
+    # 3. Eliminar la partición (si algo falló antes, se repite todo en la próxima corrida)
+    execute_query(f"ALTER TABLE auditoria DROP PARTITION {nombre}", fetch=False)
+
+    print(f"Auditoría: partición {nombre} archivada en {archivo} ({total} registros, {len(entradas)} tramos)")
+    return total
+
+
+def aplicar_retencion() -> int:
+    """Archiva y elimina las particiones anteriores al periodo de retención"""
+    limite = _sumar_meses(date.today().replace(day=1), -MESES_RETENCION)
+    archivados = 0
+    for nombre, mes in _particiones():
+        if _sumar_meses(mes, 1) <= limite:
+            archivados += _archivar_particion(nombre, mes)
+    return archivados
+
+
+def _leer_tramo(ruta: str, desplazamiento: int, largo: int):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(desplazamiento)
+        datos = gzip.decompress(archivo.read(largo))
+    for linea in datos.decode('utf-8').splitlines():
+        if linea:
+            yield linea
+
+
+def _leer_completo(ruta: str):
+    # Archivos anteriores al índice con posiciones: se recorren enteros
+    with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+        yield from archivo
+
+
+def buscar_archivados(tabla: str, registro_id: int) -> list:
+    """Registros archivados de un registro; lee solo su tramo de cada archivo mensual"""
+    indice = execute_query("""
+        SELECT archivo, desplazamiento, largo FROM auditoria_archivo_indice
+        WHERE tabla = %s AND registro_Id = %s
+        ORDER BY fecha_hasta DESC
+    """, (tabla[:LARGO_TABLA], registro_id))
+
+    registros = []
+    for entrada in indice:
+        ruta = os.path.join(DIRECTORIO_ARCHIVO, entrada['archivo'])
+        if not os.path.exists(ruta):
+            print(f"Archivo de auditoría no encontrado: {ruta}")
+            continue
+        if entrada['desplazamiento'] is not None:
+            lineas = _leer_tramo(ruta, entrada['desplazamiento'], entrada['largo'])
+        else:
+            lineas = _leer_completo(ruta)
+        for linea in lineas:
+            # Filtro barato antes de decodificar la línea
+            if str(registro_id) not in linea:
+                continue
+            fila = json.loads(linea)
+            if fila.get('tabla') == tabla and (fila.get('registro_Id') or 0) == registro_id:
+                registros.append(fila)
+
+    registros.sort(key=lambda r: (r.get('fecha') or '', r.get('id') or 0), reverse=True)
+    return registros
@@ -0,0 +1,145 @@
+import queue
+import threading
+from datetime import date, datetime, timedelta
+
+from app.config.database import execute_query
+from app.services.eventos import canal_pedidos
+
+# Productos en tendencia con un sketch Space-Saving por hora.
+# Cada pedido completado suma sus líneas al bucket de su hora; las ventanas
+# (última hora, día, semana) se obtienen fusionando los buckets que cubren.
+# Al arrancar se precarga con ventas_producto_diarias de la última semana.
+
+CAPACIDAD = 100
+HORAS_RETENIDAS = 7 * 24
+VENTANAS = {'hora': 1, 'dia': 24, 'semana': 7 * 24}
+
+
+class EspacioAhorro:
+    """Sketch Space-Saving: top-k aproximado con memoria fija.
+
+    Cada clave guarda (conteo, error); el conteo real está entre
+    conteo - error y conteo.
+    """
+
+    def __init__(self, capacidad: int = CAPACIDAD):
+        self.capacidad = capacidad
+        self.contadores = {}
+
+    def agregar(self, clave, peso: int = 1):
+        if clave in self.contadores:
+            self.contadores[clave][0] += peso
+        elif len(self.contadores) < self.capacidad:
+            self.contadores[clave] = [peso, 0]
+        else:
+            # Reemplaza a la clave con menor conteo y hereda su conteo como error
+            minima = min(self.contadores, key=lambda k: self.contadores[k][0])
+            conteo_minimo = self.contadores.pop(minima)[0]
+            self.contadores[clave] = [conteo_minimo + peso, conteo_minimo]
+
+    def fusionar(self, otro: 'EspacioAhorro'):
+        for clave, (conteo, error) in otro.contadores.items():
+            if clave in self.contadores:
+                self.contadores[clave][0] += conteo
+                self.contadores[clave][1] += error
+            else:
+                self.contadores[clave] = [conteo, error]
+
+        if len(self.contadores) > self.capacidad:
+            conservar = sorted(self.contadores.items(), key=lambda c: c[1][0], reverse=True)[:self.capacidad]
+            self.contadores = {clave: valor for clave, valor in conservar}
+
+    def top(self, n: int) -> list:
+        """[(clave, conteo, error)] ordenado por conteo descendente"""
+        ordenados = sorted(self.contadores.items(), key=lambda c: c[1][0], reverse=True)[:n]
+        return [(clave, conteo, error) for clave, (conteo, error) in ordenados]
+
+
+_lock = threading.Lock()
+_buckets = {}
+_pendientes = queue.SimpleQueue()
+_precargado = False
+
+
+def _hora(fecha: datetime) -> datetime:
+    return fecha.replace(minute=0, second=0, microsecond=0)
+
+
+def _agregar(hora: datetime, producto_id: int, cantidad: int):
+    if hora not in _buckets:
+        _buckets[hora] = EspacioAhorro()
+    _buckets[hora].agregar(producto_id, cantidad)
+
+
+def _precargar():
+    """Carga la última semana desde el rollup diario (cada día en su hora 00)"""
+    global _precargado
+
+    desde = date.today() - timedelta(days=HORAS_RETENIDAS // 24 - 1)
+    query = """
+        SELECT fecha, producto_id, SUM(cantidad) as cantidad
+        FROM ventas_producto_diarias
+        WHERE fecha >= %s
+        GROUP BY fecha, producto_id
+    """
+    filas = execute_query(query, (desde,))
+
+    # Los pedidos anteriores a la precarga ya están incluidos en el rollup
+    while not _pendientes.empty():
+        _pendientes.get_nowait()
+
+    for fila in filas:
+        _agregar(datetime.combine(fila['fecha'], datetime.min.time()), fila['producto_id'], int(fila['cantidad']))
+
+    _precargado = True
+    print(f"Tendencias: precarga con {len(filas)} filas del rollup")
+
+
+def procesar_pendientes():
+    """Suma las líneas de los pedidos completados pendientes y descarta buckets viejos"""
+    with _lock:
+        if not _precargado:
+            _precargar()
+
+        pedidos = {}
+        while not _pendientes.empty():
+            pedido_id, fecha = _pendientes.get_nowait()
+            pedidos[pedido_id] = fecha
+
+        if pedidos:
+            ids = tuple(pedidos)
+            placeholders = ", ".join(["%s"] * len(ids))
+            lineas = execute_query(f"""
+                SELECT pedido_id, producto_id, cantidad
+                FROM pedido_detalles
+                WHERE pedido_id IN ({placeholders})
+            """, ids)
+            for linea in lineas:
+                _agregar(_hora(pedidos[linea['pedido_id']]), linea['producto_id'], int(linea['cantidad']))
+
+        limite = _hora(datetime.now()) - timedelta(hours=HORAS_RETENIDAS)
+        for hora in [h for h in _buckets if h <= limite]:
+            del _buckets[hora]
+
+
+def top(ventana: str = 'dia', n: int = 10) -> list:
+    """Top-n de productos vendidos en la ventana: [(producto_id, cantidad, error)]"""
+    procesar_pendientes()
+
+    desde = _hora(datetime.now()) - timedelta(hours=VENTANAS[ventana] - 1)
+    combinado = EspacioAhorro()
+    with _lock:
+        for hora, sketch in _buckets.items():
+            if hora >= desde:
+                combinado.fusionar(sketch)
+    return combinado.top(n)
+
+
+def _al_cambiar_estado(evento: dict):
+    datos = evento['datos']
+    if datos.get('estado') == 'completado' and datos.get('estado_anterior') != 'completado':
+        # Las líneas se leen en lote al consultar, fuera del hilo que publica
+        _pendientes.put((datos['pedido_id'], datetime.fromisoformat(evento['fecha'])))
+
+
+canal_pedidos.agregar_oyente(_al_cambiar_estado)
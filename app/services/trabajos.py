@@ -0,0 +1,145 @@
+import json
+import threading
+import traceback
+
+from fastapi import HTTPException
+
+from app.config.database import transaccion
+
+# Trabajos en segundo plano respaldados por la tabla trabajos_pendientes (outbox).
+# Los endpoints encolan dentro de su propia transacción y un hilo los procesa por lotes.
+
+TAMANO_LOTE = 50
+INTERVALO = 1.0          # segundos entre sondeos si no hay trabajo
+MAX_INTENTOS = 5
+TIEMPO_BLOQUEO = 300     # segundos antes de reclamar un trabajo 'procesando' abandonado
+
+_manejadores = {}
+_despertar = threading.Event()
+_detener = threading.Event()
+_hilo = None
+
+
+def manejador(tipo: str):
+    """Registra la función que procesa los trabajos de un tipo"""
+    def decorador(funcion):
+        _manejadores[tipo] = funcion
+        return funcion
+    return decorador
+
+
+def encolar(cursor, tipo: str, payload: dict):
+    """Inserta un trabajo usando el cursor (y la transacción) del llamador"""
+    cursor.execute(
+        "INSERT INTO trabajos_pendientes (tipo, payload) VALUES (%s, %s)",
+        (tipo, json.dumps(payload, default=str))
+    )
+
+
+def despertar():
+    """Avisa al worker que hay trabajos nuevos (llamar después del commit)"""
+    _despertar.set()
+
+
+def _tomar_lote() -> list:
+    with transaccion() as cursor:
+        cursor.execute("""
+            SELECT id, tipo, payload, intentos
+            FROM trabajos_pendientes
+            WHERE (estado = 'pendiente' AND disponible_en <= NOW())
+            OR (estado = 'procesando' AND disponible_en < NOW() - INTERVAL %s SECOND)
+            ORDER BY id ASC
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (TIEMPO_BLOQUEO, TAMANO_LOTE))
+        trabajos = cursor.fetchall()
+
+        if trabajos:
+            placeholders = ", ".join(["%s"] * len(trabajos))
+            cursor.execute(f"""
+                UPDATE trabajos_pendientes
+                SET estado = 'procesando', disponible_en = NOW()
+                WHERE id IN ({placeholders})
+            """, tuple(t['id'] for t in trabajos))
+
+    return trabajos
+
+
+def procesar_lote() -> int:
+    """Procesa un lote de trabajos pendientes; devuelve cuántos tomó"""
+    trabajos = _tomar_lote()
+    completados = []
+    fallidos = []
+
+    for trabajo in trabajos:
+        funcion = _manejadores.get(trabajo['tipo'])
+        try:
+            if funcion is None:
+                raise ValueError(f"Tipo de trabajo desconocido: {trabajo['tipo']}")
+            payload = trabajo['payload']
+            funcion(json.loads(payload) if isinstance(payload, (str, bytes)) else payload)
+            completados.append(trabajo['id'])
+        except HTTPException as e:
+            print(f"Error en trabajo {trabajo['id']} ({trabajo['tipo']}): {e.detail}")
+            # Los errores 4xx no se arreglan reintentando
+            fallidos.append((trabajo, str(e.detail)[:1000], e.status_code < 500))
+        except Exception as e:
+            print(f"Error en trabajo {trabajo['id']} ({trabajo['tipo']}): {e}")
+            fallidos.append((trabajo, str(e)[:1000], False))
+
+    if completados or fallidos:
+        with transaccion() as cursor:
+            if completados:
+                placeholders = ", ".join(["%s"] * len(completados))
+                cursor.execute(f"""
+                    UPDATE trabajos_pendientes
+                    SET estado = 'completado', fecha_procesado = NOW()
+                    WHERE id IN ({placeholders})
+                """, tuple(completados))
+
+            for trabajo, error, definitivo in fallidos:
+                intentos = MAX_INTENTOS if definitivo else trabajo['intentos'] + 1
+                # Reintento con espera exponencial: 2, 4, 8... segundos
+                cursor.execute("""
+                    UPDATE trabajos_pendientes
+                    SET estado = %s, intentos = %s, ultimo_error = %s,
+                        disponible_en = NOW() + INTERVAL %s SECOND
+                    WHERE id = %s
+                """, (
+                    'fallido' if intentos >= MAX_INTENTOS else 'pendiente',
+                    intentos,
+                    error,
+                    2 ** intentos,
+                    trabajo['id']
+                ))
+
+    return len(trabajos)
+
+
+def _bucle():
+    while not _detener.is_set():
+        try:
+            if procesar_lote() >= TAMANO_LOTE:
+                continue
+        except Exception as e:
+            print(f"Error en worker de trabajos: {e}")
+            traceback.print_exc()
+
+        _despertar.wait(INTERVALO)
+        _despertar.clear()
+
+
+def iniciar():
+    global _hilo
+    if _hilo and _hilo.is_alive():
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_bucle, name="worker-trabajos", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    _detener.set()
+    _despertar.set()
+    if _hilo:
+        _hilo.join(timeout=5)
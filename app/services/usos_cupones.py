@@ -0,0 +1,56 @@
+from fastapi import HTTPException
+
+from app.config.database import execute_query
+
+# Usos de cupones con contadores mantenidos: cupones.usos_actuales y
+# cupon_usos_cliente(cupon_id, cliente_id, usos). registrar() inserta en cupon_usos
+# y sube ambos contadores con UPDATE condicionales, con el cursor (y la transacción)
+# del llamador; si algún límite ya se alcanzó, la transacción completa se revierte.
+
+
+def consultar(cliente_id: int, cupon_ids: list) -> dict:
+    """Usos por cupón: {cupon_id: (usos totales, usos del cliente)}, por clave primaria"""
+    if not cupon_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(cupon_ids))
+    filas = execute_query(f"""
+        SELECT c.id, c.usos_actuales, COALESCE(cc.usos, 0) as del_cliente
+        FROM cupones c
+        LEFT JOIN cupon_usos_cliente cc ON cc.cupon_id = c.id AND cc.cliente_id = %s
+        WHERE c.id IN ({placeholders})
+    """, (cliente_id, *cupon_ids))
+    return {f['id']: (int(f['usos_actuales']), int(f['del_cliente'])) for f in filas}
+
+
+def registrar(cursor, cupon_id: int, cliente_id: int, pedido_id: int, descuento: float) -> bool:
+    """Registra el uso del cupón en el pedido; False si ese pedido ya lo tenía registrado"""
+    cursor.execute("""
+        INSERT IGNORE INTO cupon_usos (cupon_id, cliente_id, pedido_id, descuento_aplicado)
+        VALUES (%s, %s, %s, %s)
+    """, (cupon_id, cliente_id, pedido_id, descuento))
+    if cursor.rowcount == 0:
+        return False
+
+    cursor.execute("""
+        UPDATE cupones
+        SET usos_actuales = usos_actuales + 1
+        WHERE id = %s AND (usos_maximos IS NULL OR usos_maximos = 0 OR usos_actuales < usos_maximos)
+    """, (cupon_id,))
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=400, detail="El cupón ha alcanzado su límite de usos")
+
+    cursor.execute("""
+        INSERT IGNORE INTO cupon_usos_cliente (cupon_id, cliente_id, usos)
+        VALUES (%s, %s, 0)
+    """, (cupon_id, cliente_id))
+    cursor.execute("""
+        UPDATE cupon_usos_cliente cc
+        JOIN cupones c ON c.id = cc.cupon_id
+        SET cc.usos = cc.usos + 1
+        WHERE cc.cupon_id = %s AND cc.cliente_id = %s
+        AND (c.usos_por_cliente IS NULL OR cc.usos < c.usos_por_cliente)
+    """, (cupon_id, cliente_id))
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=400, detail="Ya has usado este cupón el máximo de veces permitido")
+
+    return True
@@ -0,0 +1,90 @@
+import argparse
+from datetime import date, datetime, timedelta
+
+from app.config.database import transaccion
+
+# Rollups diarios de ventas (ventas_diarias y ventas_producto_diarias).
+# Los reportes leen solo estas tablas en lugar de agregar pedidos crudos.
+
+
+def acumular_pedido(cursor, pedido_id: int):
+    """Suma un pedido recién completado a los rollups.
+
+    Debe llamarse con el cursor de la transacción que cambia el estado,
+    para que el pedido se cuente una sola vez.
+    """
+    cursor.execute("""
+        INSERT INTO ventas_diarias (fecha, sucursal_id, total_pedidos, total_ventas)
+        SELECT DATE(fecha_completado), COALESCE(sucursal_id, 0), 1, total
+        FROM pedidos
+        WHERE id = %s
+        ON DUPLICATE KEY UPDATE
+            total_pedidos = total_pedidos + VALUES(total_pedidos),
+            total_ventas = total_ventas + VALUES(total_ventas)
+    """, (pedido_id,))
+
+    cursor.execute("""
+        INSERT INTO ventas_producto_diarias (fecha, sucursal_id, producto_id, cantidad, total)
+        SELECT DATE(p.fecha_completado), COALESCE(p.sucursal_id, 0), pd.producto_id,
+               SUM(pd.cantidad), SUM(pd.subtotal)
+        FROM pedidos p
+        JOIN pedido_detalles pd ON pd.pedido_id = p.id
+        WHERE p.id = %s
+        GROUP BY DATE(p.fecha_completado), COALESCE(p.sucursal_id, 0), pd.producto_id
+        ON DUPLICATE KEY UPDATE
+            cantidad = cantidad + VALUES(cantidad),
+            total = total + VALUES(total)
+    """, (pedido_id,))
+
+
+def reconstruir(desde: date, hasta: date):
+    """Recalcula los rollups del rango [desde, hasta] desde pedidos activos y archivados"""
+    limite = hasta + timedelta(days=1)
+
+    with transaccion() as cursor:
+        cursor.execute("DELETE FROM ventas_diarias WHERE fecha BETWEEN %s AND %s", (desde, hasta))
+        cursor.execute("DELETE FROM ventas_producto_diarias WHERE fecha BETWEEN %s AND %s", (desde, hasta))
+
+        cursor.execute("""
+            INSERT INTO ventas_diarias (fecha, sucursal_id, total_pedidos, total_ventas)
+            SELECT DATE(fecha_completado), COALESCE(sucursal_id, 0), COUNT(*), SUM(total)
+            FROM (
+                SELECT fecha_completado, sucursal_id, total FROM pedidos
+                WHERE estado = 'completado' AND fecha_completado >= %s AND fecha_completado < %s
+                UNION ALL
+                SELECT fecha_completado, sucursal_id, total FROM pedidos_archivo
+                WHERE estado = 'completado' AND fecha_completado >= %s AND fecha_completado < %s
+            ) p
+            GROUP BY DATE(fecha_completado), COALESCE(sucursal_id, 0)
+        """, (desde, limite, desde, limite))
+
+        cursor.execute("""
+            INSERT INTO ventas_producto_diarias (fecha, sucursal_id, producto_id, cantidad, total)
+            SELECT DATE(fecha_completado), COALESCE(sucursal_id, 0), producto_id, SUM(cantidad), SUM(subtotal)
+            FROM (
+                SELECT p.fecha_completado, p.sucursal_id, pd.producto_id, pd.cantidad, pd.subtotal
+                FROM pedidos p
+                JOIN pedido_detalles pd ON pd.pedido_id = p.id
+                WHERE p.estado = 'completado' AND p.fecha_completado >= %s AND p.fecha_completado < %s
+                UNION ALL
+                SELECT p.fecha_completado, p.sucursal_id, pd.producto_id, pd.cantidad, pd.subtotal
+                FROM pedidos_archivo p
+                JOIN pedido_detalles_archivo pd ON pd.pedido_id = p.id
+                WHERE p.estado = 'completado' AND p.fecha_completado >= %s AND p.fecha_completado < %s
+            ) lineas
+            GROUP BY DATE(fecha_completado), COALESCE(sucursal_id, 0), producto_id
+        """, (desde, limite, desde, limite))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruir rollups diarios de ventas")
+    parser.add_argument("--desde", required=True, help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", default=date.today().isoformat(), help="Fecha final YYYY-MM-DD")
+    args = parser.parse_args()
+
+    desde = datetime.strptime(args.desde, '%Y-%m-%d').date()
+    hasta = datetime.strptime(args.hasta, '%Y-%m-%d').date()
+
+    print(f"Reconstruyendo rollups de ventas: {desde} a {hasta}")
+    reconstruir(desde, hasta)
+    print("Rollups reconstruidos")